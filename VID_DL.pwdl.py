@@ -6,6 +6,7 @@ from operator import attrgetter # For easier sorting
 
 # Assuming mainLogic.downloader.py contains a function named 'main'
 from mainLogic.downloader import main as downloader # Renamed to avoid confusion with internal 'main'
+from mainLogic.big4.Ravenclaw_decrypt.key_prefetch import prefetch_keys
 
 batch_name_default = "yakeen-neet-2-0-2026-854543"
 
@@ -90,6 +91,9 @@ all_subjects = batch_api.get_batch_details(batch_name=batch_name)
 # Define UTC timezone for consistency
 UTC = timezone.utc # Python 3.2+ recommended way for UTC
 
+# Lectures picked per subject, downloaded once every subject has been scanned
+selected_lectures = []
+
 # Iterate through subjects
 for subject in all_subjects:
     # Filter subjects based on preferences (from CLI or prefs file)
@@ -162,16 +166,29 @@ for subject in all_subjects:
         debugger.info(f"  Batch Name: {batch_name}")
         debugger.info(f"  Lecture ID: {selected_lecture.id}")
         
-        # --- Download Logic ---
-        # Pass the chapter name and subject slug to the downloader for structured folders
-        if download_enabled:
-            debugger.info(f"  Attempting to download lecture...")
-            downloader(
-                name=lecture_name,
-                batch_name=batch_name,
-                id=selected_lecture.id,
-                directory=base_download_directory,
-            )
+        selected_lectures.append({"id": selected_lecture.id, "name": lecture_name, "batch_name": batch_name})
         
     else:
-        debugger.warning(f"No lectures found for subject: {subject.slug} that match the applied filters.")
\ No newline at end of file
+        debugger.warning(f"No lectures found for subject: {subject.slug} that match the applied filters.")
+
+# --- Download Logic ---
+if download_enabled and selected_lectures:
+    # Fetch every key concurrently first, so a lecture whose key fails is reported before any
+    # download starts and the downloads below find their keys in the key cache
+    key_failures = {}
+    if prefs.get('key-cache', True) and prefs.get('key-prefetch-workers', 8):
+        key_failures = prefetch_keys(selected_lectures, batch_api.token, batch_api.random_id,
+                                     workers=prefs.get('key-prefetch-workers', 8))
+
+    for lecture in selected_lectures:
+        if lecture["id"] in key_failures:
+            debugger.warning(f"Skipping '{lecture['name']}': key fetch failed ({key_failures[lecture['id']]})")
+            continue
+        debugger.info(f"Attempting to download '{lecture['name']}'...")
+        # Pass the chapter name and subject slug to the downloader for structured folders
+        downloader(
+            name=lecture["name"],
+            batch_name=lecture["batch_name"],
+            id=lecture["id"],
+            directory=base_download_directory,
+        )
@@ -18,6 +18,7 @@ from beta.api.blueprints.while_dl_and_post_dl import dl_and_post_dl
 from beta.api.blueprints.custom import custom_blueprints 
 
 from beta.api.mr_manager.boss_manager import Boss
+from mainLogic.utils import glv_var
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger
 
@@ -51,5 +52,8 @@ app.register_blueprint(login)
 
 for blueprint in custom_blueprints:
     blueprint.register_blueprint(app)
+
+# Prefs are loaded by now, by pwdl or (served as run:app) by the blueprints above
+Boss.apply_prefs(glv_var.vars.get('prefs', {}))
 if __name__ == '__main__':
     app.run(debug=True, port=7680)
@@ -1,5 +1,6 @@
 import os
 from mainLogic.utils.gen_utils import delete_old_files
+from mainLogic.error import DownloadCancelled
 from mainLogic.main import Main
 from mainLogic.startup.checkup import CheckState
 from mainLogic.utils.glv import Global
@@ -8,7 +9,7 @@ from mainLogic.utils.glv_var import debugger
 
 
 def download_pw_video(task_id, name, id, batch_name, topic_name, lecture_url, out_dir, client_id, session_id,
-                      progress_callback):
+                      progress_callback, cancel_event=None):
     # Create directories for client_id and session_id if they don't exist
     client_session_dir = os.path.join(out_dir, client_id, session_id)
     os.makedirs(client_session_dir, exist_ok=True)
@@ -44,8 +45,16 @@ def download_pw_video(task_id, name, id, batch_name, topic_name, lecture_url, ou
              lecture_url=lecture_url,
              random_id=prefs['random_id'],
              tui=False,
+             engine=prefs.get('downloader-engine', 'threads'),
+             decrypt_backend=prefs.get('decrypt-backend', 'mp4decrypt'),
+             direct_mux=prefs.get('direct-mux', False),
+             key_cache=prefs.get('key-cache', True),
              directory=client_session_dir, tmpDir="/*auto*/", ffmpeg=ffmpeg, mp4d=mp4d, verbose=False,
-             progress_callback=progress_callback).process()
+             progress_callback=progress_callback,
+             progress_hz=float(prefs.get('progress-update-hz', 4)),
+             cancel_event=cancel_event).process()
+    except DownloadCancelled:
+        raise
     except TypeError as e:
         raise Exception(f"Invalid ID: {e}")
     except Exception as e:
@@ -64,6 +64,20 @@ def get_subpath(subpath):
         return jsonify({'error': f'file at {path_to_file} not found'}), 404
 
 
+@admin.route('/api/server/caches')
+@admin.route('/server/caches')
+def get_cache_stats():
+    # {cache name: size and hit/miss/eviction counters} of the decrypting proxy caches
+    return jsonify(Boss.cache_manager.stats()), 200
+
+
+@admin.route('/api/server/tasks')
+@admin.route('/server/tasks')
+def get_task_queue_stats():
+    # Running, queued and paused downloads of the task scheduler, per client
+    return jsonify(task_manager.scheduler.stats()), 200
+
+
 @admin.route('/api/server/usages')
 @admin.route('/server/usages')
 def get_usages_for_all_client():
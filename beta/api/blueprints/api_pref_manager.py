@@ -2,6 +2,7 @@ import os
 
 from flask import Blueprint, request, jsonify
 
+from beta.api.mr_manager.boss_manager import Boss
 from mainLogic.utils import glv_var
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import PREFS_FILE
@@ -40,6 +41,7 @@ def update_prefs():
     ## recheck dependencies
     from mainLogic.utils.dependency_checker import re_check_dependencies
     re_check_dependencies()
+    Boss.apply_prefs(glv_var.vars['prefs'])
 
 
     return jsonify(data), 200
@@ -15,17 +15,23 @@ from functools import wraps
 
 import requests
 import urllib3
-from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 from beta.batch_scraper_2.Endpoints import Endpoints
 from beta.batch_scraper_2.models.AllTestDetails import AllTestDetails
 from beta.batch_scraper_2.module import ScraperModule
 from beta.util import generate_safe_file_name
+from beta.api.file_delivery import send_media
+from beta.api.mr_manager.boss_manager import Boss
+from beta.api.mr_manager.cache_manager import LRUCache, SegmentStore
+from beta.api.mr_manager.segment_prefetcher import SegmentPrefetcher
+from beta.api.mr_manager.single_flight import SingleFlight
 from mainLogic.utils.Endpoint import Endpoint
 from mainLogic.utils.dependency_checker import re_check_dependencies
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger, ENDPOINTS_NAME
 from mainLogic.utils import glv_var
 from mainLogic.utils.image_utils import create_a4_pdf_from_images
+from mainLogic.big4.Ravenclaw_decrypt import cenc
 
 # Initialize the blueprint
 scraper_blueprint = Blueprint('scraper', __name__)
@@ -37,11 +43,33 @@ TMP_DIR = os.path.join(BASE_DIR, "tmp_proxy")
 ENC_DIR = os.path.join(TMP_DIR, "enc")
 DEC_DIR = os.path.join(TMP_DIR, "dec")
 
-# Global Dictionary to store context (Keys, URLs) for active lectures
-LECTURE_CONTEXT = {}
+PROXY_PREFS = glv_var.vars.get('prefs', {})
+
+# Context (Keys, URLs) of the lectures being streamed, most recently used kept
+LECTURE_CONTEXT = Boss.cache_manager.register('lecture_context', LRUCache(
+    'lecture_context', max_entries=PROXY_PREFS.get('proxy-context-entries', 256)))
+# Rendered DASH/HLS playlists per (batch_name, id), valid until the signed URL expires
+MANIFEST_CACHE = Boss.cache_manager.register('manifests', LRUCache(
+    'manifests', max_entries=PROXY_PREFS.get('proxy-context-entries', 256)))
+# Encrypted and decrypted segments on disk, bounded in bytes and idle age
+SEGMENT_STORE = Boss.cache_manager.register('segments', SegmentStore(
+    TMP_DIR,
+    max_bytes=PROXY_PREFS.get('proxy-cache-bytes', 2 * 1024 ** 3),
+    max_age=PROXY_PREFS.get('proxy-cache-max-age', 6 * 3600)))
+# Init segments per representation (by encrypted init path), with their parsed decryptor
+INIT_CACHE = Boss.cache_manager.register('inits', LRUCache(
+    'inits', max_entries=PROXY_PREFS.get('proxy-context-entries', 256)))
+# Concurrent context misses and segment requests for the same lecture share one fetch. Init
+# segments are only ever loaded inline (never queued on the decrypt pool), so the pool workers
+# preparing media segments can wait for them; no wait outlasts a player request's own timeout
+CONTEXT_FLIGHTS = Boss.cache_manager.register('context_flights', SingleFlight('context_flights'))
+SEGMENT_FLIGHTS = Boss.cache_manager.register('segment_flights', SingleFlight('segment_flights', timeout=60))
 
 # Threading configuration
 MAX_WORKER_THREADS = int(os.environ.get('PWDL_DECRYPT_THREADS', '4'))  # Configurable via environment variable
+DECRYPT_BACKEND = os.environ.get('PWDL_DECRYPT_BACKEND', 'mp4decrypt')  # mp4decrypt | python | auto
+# Keys and signed URLs survive proxy restarts in the persistent key cache (see KeyCache)
+KEY_CACHE = PROXY_PREFS.get('key-cache', True)
 DECRYPT_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKER_THREADS, thread_name_prefix='decrypt-worker')
 debugger.info(f"[THREADING] Initialized decrypt thread pool with {MAX_WORKER_THREADS} workers")
 
@@ -116,8 +144,11 @@ def ensure_dirs(lecture_id):
     return l_enc, l_dec
 
 @thread_safe_file_operation
-def run_mp4decrypt(input_path, output_path, kid, key):
-    """Runs mp4decrypt subprocess, ensuring output dir exists (Thread-safe)"""
+def run_mp4decrypt(input_path, output_path, kid, key, init=None):
+    """
+    Runs mp4decrypt subprocess, ensuring output dir exists (Thread-safe). With `init` (an
+    INIT_CACHE entry) the input is a bare media segment, decrypted against that init segment.
+    """
     try:
         # Check if already decrypted by another thread
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -128,9 +159,29 @@ def run_mp4decrypt(input_path, output_path, kid, key):
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         debugger.info(f"[DECRYPT] Starting decryption: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
-        
+
+        if DECRYPT_BACKEND in ('python', 'auto') and (init is None or init['decryptor'] is not None):
+            start_time = time.time()
+            try:
+                if init is None:
+                    cenc.decrypt_file(input_path, output_path, key)
+                else:
+                    with open(input_path, 'rb') as f:
+                        segment = init['decryptor'].decrypt_segment(f.read())
+                    with open(output_path, 'wb') as f:
+                        f.write(segment)
+                debugger.success(f"[DECRYPT] Completed {os.path.basename(output_path)} in-process in {time.time() - start_time:.2f}s")
+                return True
+            except (cenc.CencError, OSError) as e:
+                debugger.error(f"[DECRYPT] In-process decryption failed for {os.path.basename(output_path)}: {e}")
+                if DECRYPT_BACKEND == 'python':
+                    return False
+
         key_arg = f"{kid}:{key}"
-        cmd = ['mp4decrypt', '--key', key_arg, input_path, output_path]
+        cmd = ['mp4decrypt', '--key', key_arg]
+        if init is not None:
+            cmd += ['--fragments-info', init['enc_path']]
+        cmd += [input_path, output_path]
         
         # Run and capture output
         start_time = time.time()
@@ -170,6 +221,8 @@ def fetch_upstream_file(url, dest_path):
         start_time = time.time()
         
         with requests.get(url, headers=headers, stream=True) as r:
+            if r.status_code == 403:
+                forget_lecture_context(url=url)
             r.raise_for_status()
             with open(dest_path, 'wb') as f:
                 for chunk in r.iter_content(chunk_size=65536):
@@ -232,72 +285,224 @@ def get_lecture_context(batch_name, id):
     """Retrieves URL/Key from cache or API"""
     ctx = LECTURE_CONTEXT.get(id)
     if not ctx:
-        from mainLogic.big4.Ravenclaw_decrypt.key import LicenseKeyFetcher as Lf
-        lf = Lf(batch_api.token, batch_api.random_id)
-        keys = lf.get_key(id, batch_name) # [kid, key, url]
-        
-        parsed_url = urllib.parse.urlparse(keys[2])
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}{os.path.dirname(parsed_url.path)}/"
-        
-        ctx = {
-            'kid': keys[0],
-            'key': keys[1],
-            'original_url': keys[2],
-            'base_url': base_url,
-            'query': parsed_url.query
-        }
-        LECTURE_CONTEXT[id] = ctx
+        # A player opening a lecture requests several segments at once; one key fetch serves them all
+        ctx = CONTEXT_FLIGHTS.do(id, load_lecture_context, batch_name, id)
     return ctx
 
-# --- ROUTE 1: DASH MANIFEST REWRITER ---
+def load_lecture_context(batch_name, id):
+    from mainLogic.big4.Ravenclaw_decrypt.key import LicenseKeyFetcher as Lf
+    lf = Lf(batch_api.token, batch_api.random_id)
+    keys = lf.get_key(id, batch_name, use_cache=KEY_CACHE) # [kid, key, url]
+    
+    parsed_url = urllib.parse.urlparse(keys[2])
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}{os.path.dirname(parsed_url.path)}/"
+    
+    ctx = {
+        'kid': keys[0],
+        'key': keys[1],
+        'original_url': keys[2],
+        'base_url': base_url,
+        'query': parsed_url.query,
+        'batch_name': batch_name,
+    }
+    LECTURE_CONTEXT.set(id, ctx, expires=signed_url_expiry(keys[2]))
+    return ctx
 
-@scraper_blueprint.route('/api/lecture/<batch_name>/<id>/master.mpd', methods=['GET'])
-def get_rewritten_manifest(batch_name, id):
-    try:
+def signed_url_expiry(url):
+    """When a context or manifest built from a signed URL has to be refreshed"""
+    from mainLogic.big4.Ravenclaw_decrypt.key_cache import KeyCache
+    url_expires = KeyCache.url_expiry(url)
+    return (url_expires - KeyCache.URL_EXPIRY_MARGIN) if url_expires else time.time() + KeyCache.DEFAULT_URL_TTL
+
+def forget_lecture_context(id=None, url=None):
+    """
+    Drops the context of a lecture whose signed URL the CDN rejected (403), by lecture id or by
+    any upstream URL under its base URL, so that the next request signs a fresh one.
+    """
+    if id is None and url:
+        id = next((lecture_id for lecture_id, ctx in list(LECTURE_CONTEXT.items())
+                   if url.startswith(ctx['base_url'])), None)
+    ctx = LECTURE_CONTEXT.pop(id, None)
+    for cache_key in [k for k in MANIFEST_CACHE.keys() if k[1] == id]:
+        MANIFEST_CACHE.pop(cache_key, None)
+    if ctx is None:
+        return
+    debugger.warning(f"[SCARPER] Signed URL of {id} was rejected, it will be fetched again")
+    if KEY_CACHE:
+        from mainLogic.big4.Ravenclaw_decrypt.key import LicenseKeyFetcher as Lf
+        Lf(batch_api.token, batch_api.random_id).invalidate_cached_url(id, ctx['batch_name'])
+
+def fetch_upstream_manifest(batch_name, id):
+    """Fetches the upstream MPD of a lecture, re-signing its URL once if the CDN answers 403"""
+    headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://pw.live/'}
+    ctx = get_lecture_context(batch_name, id)
+    resp = requests.get(ctx['original_url'], headers=headers)
+    if resp.status_code == 403:
+        forget_lecture_context(id)
         ctx = get_lecture_context(batch_name, id)
-
-        # Fetch Manifest Content
-        headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://pw.live/'}
         resp = requests.get(ctx['original_url'], headers=headers)
-        if resp.status_code != 200:
-            return Response(f"Failed to fetch upstream manifest: {resp.status_code}", status=502)
-        
-        content = resp.text
-        debugger.info(f"[SCARPER] Original manifest content preview: {content[:200]}...")
+    return ctx, resp
 
-        # Strip DRM Tags - More comprehensive removal
-        original_content = content
-        
-        # Remove multi-line ContentProtection tags
-        content = re.sub(r'<ContentProtection[^>]*>.*?</ContentProtection>', '', content, flags=re.DOTALL | re.IGNORECASE)
-        
-        # Remove self-closing ContentProtection tags
-        content = re.sub(r'<ContentProtection[^>]*/?>', '', content, flags=re.IGNORECASE)
+# --- MANIFEST RENDERING ---
+
+MPD_NS = {'d': 'urn:mpeg:dash:schema:mpd:2011'}
+
+def render_dash_manifest(content, batch_name, id):
+    """Strips the DRM signalling from an upstream MPD and points its segments at the proxy"""
+    debugger.info(f"[SCARPER] Original manifest content preview: {content[:200]}...")
+
+    # Strip DRM Tags - More comprehensive removal
+    original_content = content
+    
+    # Remove multi-line ContentProtection tags
+    content = re.sub(r'<ContentProtection[^>]*>.*?</ContentProtection>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    
+    # Remove self-closing ContentProtection tags
+    content = re.sub(r'<ContentProtection[^>]*/?>', '', content, flags=re.IGNORECASE)
+    
+    # Also remove any pssh boxes or DRM-related elements
+    content = re.sub(r'<cenc:pssh[^>]*>.*?</cenc:pssh>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    content = re.sub(r'<ms:pro[^>]*>.*?</ms:pro>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    
+    if original_content != content:
+        debugger.info(f"[SCARPER] DRM content removed from manifest")
+    else:
+        debugger.warning(f"[SCARPER] No DRM content found to remove in manifest")
         
-        # Also remove any pssh boxes or DRM-related elements
-        content = re.sub(r'<cenc:pssh[^>]*>.*?</cenc:pssh>', '', content, flags=re.DOTALL | re.IGNORECASE)
-        content = re.sub(r'<ms:pro[^>]*>.*?</ms:pro>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    debugger.info(f"[SCARPER] Cleaned manifest content preview: {content[:200]}...")
+
+    # Rewrite Paths to point to Proxy
+    def rewrite_path(match):
+        attr = match.group(1)
+        rel_path = match.group(2)
+        # Escape URL for XML (replace & with &amp;)
+        proxy_path = html.escape(f'/api/proxy/{batch_name}/{id}/{rel_path}')
+        return f'{attr}="{proxy_path}"'
+
+    pattern = r'(initialization|media)="([^"]+)"'
+    return re.sub(pattern, rewrite_path, content)
+
+def render_master_m3u8(root, batch_name, id):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6"]
+    audio_group = "audio-group"
+    audio_found = False
+
+    # 1. Scan for AUDIO tracks
+    for adapt in root.findall(".//d:AdaptationSet", MPD_NS):
+        if adapt.get("contentType") == "audio":
+            for rep in adapt.findall("d:Representation", MPD_NS):
+                rid = rep.get("id")
+                # Using /api/lecture/.../media.m3u8 path structure
+                media_url = f"/api/lecture/{batch_name}/{id}/{rid}/media.m3u8"
+                lines.append(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{audio_group}",NAME="Audio",DEFAULT=YES,AUTOSELECT=YES,URI="{media_url}"')
+                audio_found = True
+
+    # 2. Scan for VIDEO tracks
+    for adapt in root.findall(".//d:AdaptationSet", MPD_NS):
+        if adapt.get("contentType") == "video":
+            for rep in adapt.findall("d:Representation", MPD_NS):
+                rid = rep.get("id")
+                bw = rep.get("bandwidth")
+                w = rep.get("width")
+                h = rep.get("height")
+                
+                media_url = f"/api/lecture/{batch_name}/{id}/{rid}/media.m3u8"
+                audio_attr = f',AUDIO="{audio_group}"' if audio_found else ""
+                
+                lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={w}x{h},CODECS="avc1.4d401f"{audio_attr}')
+                lines.append(media_url)
+                
+    return "\n".join(lines)
+
+def render_media_m3u8(adapt, rep, batch_name, id):
+    rep_id = rep.get("id")
+    seg_tpl = rep.find("d:SegmentTemplate", MPD_NS)
+    if seg_tpl is None: seg_tpl = adapt.find("d:SegmentTemplate", MPD_NS)
+    
+    timescale = int(seg_tpl.get("timescale"))
+    media_tpl = seg_tpl.get("media")
+    init_tpl = seg_tpl.get("initialization")
+    start_num = int(seg_tpl.get("startNumber", "1"))
+    
+    # Build M3U8
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-TARGETDURATION:6", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    
+    # Init Map (Point to Proxy)
+    init_name = init_tpl.replace("$RepresentationID$", str(rep_id))
+    proxy_init = f"/api/proxy/{batch_name}/{id}/{init_name}"
+    lines.append(f'#EXT-X-MAP:URI="{proxy_init}"')
+    
+    # Segments (Point to Proxy)
+    timeline = seg_tpl.find("d:SegmentTimeline", MPD_NS)
+    curr_num = start_num
+    
+    for s in timeline.findall("d:S", MPD_NS):
+        d = int(s.get("d"))
+        r = int(s.get("r", "0"))
+        sec = float(d) / timescale
         
-        if original_content != content:
-            debugger.info(f"[SCARPER] DRM content removed from manifest")
-        else:
-            debugger.warning(f"[SCARPER] No DRM content found to remove in manifest")
+        for _ in range(r + 1):
+            seg_name = media_tpl.replace("$RepresentationID$", str(rep_id)).replace("$Number$", str(curr_num))
+            proxy_seg = f"/api/proxy/{batch_name}/{id}/{seg_name}"
+            
+            lines.append(f"#EXTINF:{sec:.6f},")
+            lines.append(proxy_seg)
+            curr_num += 1
             
-        debugger.info(f"[SCARPER] Cleaned manifest content preview: {content[:200]}...")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines)
+
+def get_lecture_manifest(batch_name, id):
+    """
+    Returns the rendered playlists of a lecture: {'dash', 'master', 'media': {rep_id: m3u8}}.
+
+    The upstream MPD is fetched and parsed once, every playlist the player can ask for is
+    rendered right away and the result is kept in MANIFEST_CACHE until the signed URL it came
+    from expires. Returns (None, upstream status) when the MPD could not be fetched.
+    """
+    cache_key = (batch_name, id)
+    entry = MANIFEST_CACHE.get(cache_key)
+    if entry:
+        return entry, 200
+
+    # One build per lecture; concurrent requests for it wait and then read the cache
+    with get_file_lock(f"manifest:{batch_name}/{id}"):
+        entry = MANIFEST_CACHE.get(cache_key)
+        if entry:
+            return entry, 200
+
+        ctx, resp = fetch_upstream_manifest(batch_name, id)
+        if resp.status_code != 200:
+            return None, resp.status_code
 
-        # Rewrite Paths to point to Proxy
-        def rewrite_path(match):
-            attr = match.group(1)
-            rel_path = match.group(2)
-            # Escape URL for XML (replace & with &amp;)
-            proxy_path = html.escape(f'/api/proxy/{batch_name}/{id}/{rel_path}')
-            return f'{attr}="{proxy_path}"'
+        root = ET.fromstring(resp.text)
+        media = {}
+        for adapt in root.findall(".//d:AdaptationSet", MPD_NS):
+            for rep in adapt.findall("d:Representation", MPD_NS):
+                # The first representation with a given id wins, as in the old per-request lookup
+                if rep.get("id") not in media:
+                    media[rep.get("id")] = render_media_m3u8(adapt, rep, batch_name, id)
+
+        entry = {
+            'dash': render_dash_manifest(resp.text, batch_name, id),
+            'master': render_master_m3u8(root, batch_name, id),
+            'media': media,
+        }
+        MANIFEST_CACHE.set(cache_key, entry, expires=signed_url_expiry(ctx['original_url']))
+        debugger.info(f"[SCARPER] Cached manifest of {id} ({len(media)} renditions)")
+        return entry, 200
+
+# --- ROUTE 1: DASH MANIFEST REWRITER ---
 
-        pattern = r'(initialization|media)="([^"]+)"'
-        content = re.sub(pattern, rewrite_path, content)
+@scraper_blueprint.route('/api/lecture/<batch_name>/<id>/master.mpd', methods=['GET'])
+def get_rewritten_manifest(batch_name, id):
+    try:
+        entry, status = get_lecture_manifest(batch_name, id)
+        if entry is None:
+            return Response(f"Failed to fetch upstream manifest: {status}", status=502)
 
         # Create response with proper CORS headers
-        response = Response(content, mimetype='application/dash+xml')
+        response = Response(entry['dash'], mimetype='application/dash+xml')
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
@@ -314,44 +519,10 @@ def get_rewritten_manifest(batch_name, id):
 @scraper_blueprint.route('/api/lecture/<batch_name>/<id>/master.m3u8', methods=['GET'])
 def get_master_m3u8(batch_name, id):
     try:
-        ctx = get_lecture_context(batch_name, id)
-        
-        headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://pw.live/'}
-        resp = requests.get(ctx['original_url'], headers=headers)
-        
-        root = ET.fromstring(resp.text)
-        ns = {'d': 'urn:mpeg:dash:schema:mpd:2011'}
-        
-        lines = ["#EXTM3U", "#EXT-X-VERSION:6"]
-        audio_group = "audio-group"
-        audio_found = False
-
-        # 1. Scan for AUDIO tracks
-        for adapt in root.findall(".//d:AdaptationSet", ns):
-            if adapt.get("contentType") == "audio":
-                for rep in adapt.findall("d:Representation", ns):
-                    rid = rep.get("id")
-                    # Using /api/lecture/.../media.m3u8 path structure
-                    media_url = f"/api/lecture/{batch_name}/{id}/{rid}/media.m3u8"
-                    lines.append(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{audio_group}",NAME="Audio",DEFAULT=YES,AUTOSELECT=YES,URI="{media_url}"')
-                    audio_found = True
-
-        # 2. Scan for VIDEO tracks
-        for adapt in root.findall(".//d:AdaptationSet", ns):
-            if adapt.get("contentType") == "video":
-                for rep in adapt.findall("d:Representation", ns):
-                    rid = rep.get("id")
-                    bw = rep.get("bandwidth")
-                    w = rep.get("width")
-                    h = rep.get("height")
-                    
-                    media_url = f"/api/lecture/{batch_name}/{id}/{rid}/media.m3u8"
-                    audio_attr = f',AUDIO="{audio_group}"' if audio_found else ""
-                    
-                    lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={w}x{h},CODECS="avc1.4d401f"{audio_attr}')
-                    lines.append(media_url)
-                    
-        return Response("\n".join(lines), mimetype="application/vnd.apple.mpegurl")
+        entry, status = get_lecture_manifest(batch_name, id)
+        if entry is None:
+            return Response(f"Failed to fetch upstream manifest: {status}", status=502)
+        return Response(entry['master'], mimetype="application/vnd.apple.mpegurl")
 
     except Exception as e:
         debugger.error(f"HLS Master Error: {e}")
@@ -362,66 +533,164 @@ def get_master_m3u8(batch_name, id):
 @scraper_blueprint.route('/api/lecture/<batch_name>/<id>/<rep_id>/media.m3u8', methods=['GET'])
 def get_media_m3u8(batch_name, id, rep_id):
     try:
-        ctx = get_lecture_context(batch_name, id)
-        
-        headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://pw.live/'}
-        resp = requests.get(ctx['original_url'], headers=headers)
-        root = ET.fromstring(resp.text)
-        ns = {'d': 'urn:mpeg:dash:schema:mpd:2011'}
-        
-        # Find Representation
-        target_rep = None
-        parent_adapt = None
-        for adapt in root.findall(".//d:AdaptationSet", ns):
-            for rep in adapt.findall("d:Representation", ns):
-                if rep.get("id") == str(rep_id):
-                    target_rep = rep
-                    parent_adapt = adapt
-                    break
-            if target_rep is not None: break
-            
-        if target_rep is None: return Response("Representation Not found", 404)
-        
-        seg_tpl = target_rep.find("d:SegmentTemplate", ns)
-        if seg_tpl is None: seg_tpl = parent_adapt.find("d:SegmentTemplate", ns)
-        
-        timescale = int(seg_tpl.get("timescale"))
-        media_tpl = seg_tpl.get("media")
-        init_tpl = seg_tpl.get("initialization")
-        start_num = int(seg_tpl.get("startNumber", "1"))
-        
-        # Build M3U8
-        lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-TARGETDURATION:6", "#EXT-X-PLAYLIST-TYPE:VOD"]
-        
-        # Init Map (Point to Proxy)
-        init_name = init_tpl.replace("$RepresentationID$", str(rep_id))
-        proxy_init = f"/api/proxy/{batch_name}/{id}/{init_name}"
-        lines.append(f'#EXT-X-MAP:URI="{proxy_init}"')
-        
-        # Segments (Point to Proxy)
-        timeline = seg_tpl.find("d:SegmentTimeline", ns)
-        curr_num = start_num
-        
-        for s in timeline.findall("d:S", ns):
-            d = int(s.get("d"))
-            r = int(s.get("r", "0"))
-            sec = float(d) / timescale
-            
-            for _ in range(r + 1):
-                seg_name = media_tpl.replace("$RepresentationID$", str(rep_id)).replace("$Number$", str(curr_num))
-                proxy_seg = f"/api/proxy/{batch_name}/{id}/{seg_name}"
-                
-                lines.append(f"#EXTINF:{sec:.6f},")
-                lines.append(proxy_seg)
-                curr_num += 1
-                
-        lines.append("#EXT-X-ENDLIST")
-        return Response("\n".join(lines), mimetype="application/vnd.apple.mpegurl")
+        entry, status = get_lecture_manifest(batch_name, id)
+        if entry is None:
+            return Response(f"Failed to fetch upstream manifest: {status}", status=502)
+
+        playlist = entry['media'].get(str(rep_id))
+        if playlist is None: return Response("Representation Not found", 404)
+        return Response(playlist, mimetype="application/vnd.apple.mpegurl")
 
     except Exception as e:
         debugger.error(f"HLS Media Error: {e}")
         return Response(str(e), 500)
 
+# --- MEDIA SEGMENT PIPELINE ---
+
+def segment_ready(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def prepare_media_segment(ctx, l_enc_dir, l_dec_dir, filepath):
+    """
+    Downloads, decrypts and stores one media segment (and its init segment if needed), inline
+    on the calling thread. Runs on DECRYPT_EXECUTOR, for player requests and for the look-ahead
+    alike. Returns None on success, or (message, HTTP status) on failure.
+    """
+    local_enc_path = os.path.join(l_enc_dir, filepath)
+    local_dec_path = os.path.join(l_dec_dir, filepath)
+
+    # One preparation per segment; whoever comes second finds it done. Not the lock of the
+    # file itself, run_mp4decrypt takes that one when writing it
+    with get_file_lock(f"prepare:{local_dec_path}"):
+        if segment_ready(local_dec_path):
+            return None
+
+        # A. Init segment of the representation, from memory after the first segment
+        init_rel_path = f"{os.path.dirname(filepath)}/init.mp4"
+        try:
+            init = get_init_segment(ctx, l_enc_dir, l_dec_dir, init_rel_path)
+        except concurrent.futures.TimeoutError:
+            return "Init Segment Timeout", 504
+        if init is None:
+            return "Init Processing Failed", 500
+        # Every media segment uses the init, keep it at the hot end of the LRU
+        SEGMENT_STORE.touch(init['enc_path'])
+        SEGMENT_STORE.touch(os.path.join(l_dec_dir, init_rel_path))
+
+        # B. Download Media Segment
+        upstream_seg = f"{ctx['base_url']}{filepath}?{ctx['query']}"
+        if not fetch_upstream_file(upstream_seg, local_enc_path):
+            return "Media Download Failed", 502
+
+        # C. Decrypt the segment on its own against the init, no stitching
+        start_decrypt = time.time()
+        if init['decryptor'] is None and not os.path.exists(init['enc_path']):
+            # mp4decrypt reads the track info from the encrypted init, which may have been evicted
+            with open(init['enc_path'], 'wb') as f:
+                f.write(init['enc'])
+        if not run_mp4decrypt(local_enc_path, local_dec_path, ctx['kid'], ctx['key'], init=init):
+            return "Media Decrypt Failed", 500
+
+        debugger.success(f"[PROXY] Media segment processed in {time.time() - start_decrypt:.2f}s")
+        SEGMENT_STORE.add(local_enc_path, local_dec_path)
+        return None
+
+def get_init_segment(ctx, l_enc_dir, l_dec_dir, init_rel_path):
+    enc_init_path = os.path.join(l_enc_dir, init_rel_path)
+    init = INIT_CACHE.get(enc_init_path)
+    if init is None:
+        # Inline on the calling thread, whether that is a request or a decrypt worker
+        init = SEGMENT_FLIGHTS.do(('init', enc_init_path), load_init_segment, ctx, l_enc_dir, l_dec_dir, init_rel_path)
+    return init
+
+def load_init_segment(ctx, l_enc_dir, l_dec_dir, init_rel_path):
+    """
+    Loads the init segment of a representation into INIT_CACHE: its encrypted and decrypted
+    bytes, and (with the python backend) a decryptor that has parsed its track info. Fetches and
+    decrypts it first if it isn't on disk. Returns the entry, or None on failure.
+    """
+    enc_init_path = os.path.join(l_enc_dir, init_rel_path)
+    dec_init_path = os.path.join(l_dec_dir, init_rel_path)
+
+    if not (segment_ready(enc_init_path) and segment_ready(dec_init_path)):
+        debugger.info(f"[PROXY] Init segment missing, processing it first")
+        upstream_init = f"{ctx['base_url']}{init_rel_path}?{ctx['query']}"
+        if not (fetch_upstream_file(upstream_init, enc_init_path) and
+                run_mp4decrypt(enc_init_path, dec_init_path, ctx['kid'], ctx['key'])):
+            return None
+        SEGMENT_STORE.add(enc_init_path, dec_init_path)
+
+    try:
+        with open(enc_init_path, 'rb') as f:
+            enc = f.read()
+        with open(dec_init_path, 'rb') as f:
+            dec = f.read()
+    except OSError as e:
+        debugger.error(f"[PROXY] Could not read init segment {init_rel_path}: {e}")
+        return None
+
+    decryptor = None
+    if DECRYPT_BACKEND in ('python', 'auto'):
+        try:
+            decryptor = cenc.CencDecryptor(ctx['key'], enc)
+        except cenc.CencError as e:
+            debugger.error(f"[PROXY] Could not parse init segment {init_rel_path}: {e}")
+            if DECRYPT_BACKEND == 'python':
+                return None
+
+    init = {'enc': enc, 'dec': dec, 'enc_path': enc_init_path, 'decryptor': decryptor}
+    INIT_CACHE.set(enc_init_path, init)
+    return init
+
+# Segment file names end in their number, e.g. "720/seg-12.mp4"
+SEGMENT_NUMBER = re.compile(r'^(.*?)(\d+)(\.[^./]+)$')
+
+def segment_stream(batch_name, id, filepath):
+    """(stream key, segment number) of a media segment path, (None, None) for anything else"""
+    match = SEGMENT_NUMBER.match(filepath)
+    if filepath.endswith("init.mp4") or not match:
+        return None, None
+    prefix, digits, suffix = match.groups()
+    width = len(digits) if digits.startswith("0") else 0
+    return (batch_name, id, prefix, suffix, width), int(digits)
+
+def _segment_path(stream, number):
+    batch_name, id, prefix, suffix, width = stream
+    return id, f"{prefix}{str(number).zfill(width)}{suffix}"
+
+def _prefetch_segment(stream, number):
+    id, filepath = _segment_path(stream, number)
+    ctx = get_lecture_context(stream[0], id)
+    l_enc_dir, l_dec_dir = ensure_dirs(id)
+    # A player request may have queued this segment on the decrypt pool; waiting for that from
+    # a worker of the same pool could leave no worker to run it, so the look-ahead moves on
+    started, error = SEGMENT_FLIGHTS.do_if_idle((id, filepath), prepare_media_segment,
+                                                ctx, l_enc_dir, l_dec_dir, filepath)
+    if not started:
+        return True
+    if error:
+        debugger.warning(f"[PREFETCH] {filepath}: {error[0]}")
+    return error is None
+
+def _prefetched_segment_ready(stream, number):
+    id, filepath = _segment_path(stream, number)
+    return segment_ready(os.path.join(DEC_DIR, id, filepath))
+
+# Look-ahead over the decrypt pool; one worker is always left for player requests
+PREFETCHER = Boss.cache_manager.register('prefetch', SegmentPrefetcher(
+    DECRYPT_EXECUTOR, _prefetch_segment, _prefetched_segment_ready,
+    max_ahead=PROXY_PREFS.get('proxy-prefetch-segments', 6),
+    max_pending=max(1, MAX_WORKER_THREADS - 1),
+    idle_timeout=PROXY_PREFS.get('proxy-prefetch-idle', 30)))
+
+def segment_response(path=None, data=None):
+    """A decrypted segment, from disk or memory, with Range/ETag support and the proxy's CORS headers"""
+    response = send_media(path, data=data, mimetype='video/mp4')
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Credentials'] = 'true'
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Length, Content-Range, Accept-Ranges, ETag'
+    return response
+
 # --- ROUTE 4: SEGMENT PROXY (DECRYPTION) ---
 
 @scraper_blueprint.route('/api/proxy/<batch_name>/<id>/<path:filepath>', methods=['GET', 'OPTIONS'])
@@ -432,7 +701,7 @@ def proxy_segment_decrypt(batch_name, id, filepath):
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Range, If-None-Match, If-Modified-Since'
         return response
     try:
         # 1. Get Context
@@ -446,123 +715,59 @@ def proxy_segment_decrypt(batch_name, id, filepath):
         local_enc_path = os.path.join(l_enc_dir, filepath)
         local_dec_path = os.path.join(l_dec_dir, filepath)
 
+        # Sequential reads of a representation drive the look-ahead, also when served from disk
+        stream, number = segment_stream(batch_name, id, filepath)
+        if stream is not None:
+            PREFETCHER.on_request(stream, number)
+
         # Return cached if ready
-        if os.path.exists(local_dec_path) and os.path.getsize(local_dec_path) > 0:
-            response = send_file(local_dec_path, mimetype='video/mp4')
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-            return response
+        if SEGMENT_STORE.lookup(local_dec_path):
+            return segment_response(local_dec_path)
 
         # 3. Handle Init Segments (Use async for better performance)
         if filepath.endswith("init.mp4"):
-            upstream_url = f"{ctx['base_url']}{filepath}?{ctx['query']}"
-            
             debugger.info(f"[PROXY] Processing init segment: {os.path.basename(filepath)}")
-            
-            # Use async download+decrypt
-            future = download_and_decrypt_async(upstream_url, local_enc_path, local_dec_path, ctx['kid'], ctx['key'])
-            
+
+            # Loaded once, on this thread rather than the decrypt pool (its workers wait for
+            # inits), and shared by concurrent requests and media segments
             try:
-                success = future.result(timeout=20)  # 20 second timeout for init segments
-                if not success:
+                init = get_init_segment(ctx, l_enc_dir, l_dec_dir, filepath)
+                if init is None:
                     return Response("Init Segment Processing Failed", 500)
             except concurrent.futures.TimeoutError:
                 return Response("Init Segment Timeout", 504)
             except Exception as e:
                 debugger.error(f"[PROXY] Init segment error: {e}")
                 return Response("Init Segment Error", 500)
-            
-            response = send_file(local_dec_path, mimetype='video/mp4')
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Credentials'] = 'true'
-            return response
+
+            return segment_response(data=init['dec'])
 
         # 4. Handle Media Segments (Enhanced with threading and batch processing)
         else:
             debugger.info(f"[PROXY] Processing media segment: {os.path.basename(filepath)}")
-            
-            dir_name = os.path.dirname(filepath)
-            init_rel_path = f"{dir_name}/init.mp4"
-            
-            enc_init_path = os.path.join(l_enc_dir, init_rel_path)
-            dec_init_path = os.path.join(l_dec_dir, init_rel_path)
 
-            # A. Ensure Decrypted Init Exists (Use async if needed)
-            if not os.path.exists(dec_init_path):
-                debugger.info(f"[PROXY] Init segment missing, processing asynchronously")
-                upstream_init = f"{ctx['base_url']}{init_rel_path}?{ctx['query']}"
-                
-                # Process init segment asynchronously
-                init_future = download_and_decrypt_async(upstream_init, enc_init_path, dec_init_path, ctx['kid'], ctx['key'])
+            # The look-ahead may already be preparing this very segment
+            prefetch = PREFETCHER.pending(stream, number) if stream is not None else None
+            if prefetch is not None:
                 try:
-                    if not init_future.result(timeout=15):  # 15 second timeout for init
-                        return Response("Init Processing Failed", 500)
-                except concurrent.futures.TimeoutError:
-                    return Response("Init Timeout", 504)
-
-            if not os.path.exists(dec_init_path):
-                return Response("Init Missing After Processing", 500)
-
-            # B. Get Offset
-            offset = os.path.getsize(dec_init_path)
-
-            # C. Download Media Segment (async)
-            upstream_seg = f"{ctx['base_url']}{filepath}?{ctx['query']}"
-            
-            debugger.info(f"[PROXY] Starting async download for media segment")
-            download_future = DECRYPT_EXECUTOR.submit(fetch_upstream_file, upstream_seg, local_enc_path)
-            
-            try:
-                if not download_future.result(timeout=25):  # 25 second timeout for download
-                    return Response("Media Download Failed", 502)
-            except concurrent.futures.TimeoutError:
-                return Response("Media Download Timeout", 504)
-
-            # D. Stitch and Decrypt (optimized)
-            temp_stitch_enc = local_enc_path + ".st.enc"
-            temp_stitch_dec = local_enc_path + ".st.dec"
-
-            try:
-                debugger.info(f"[PROXY] Stitching and decrypting media segment")
-                start_stitch = time.time()
-                
-                # Stitch files
-                with open(temp_stitch_enc, 'wb') as out:
-                    with open(enc_init_path, 'rb') as f: shutil.copyfileobj(f, out)
-                    with open(local_enc_path, 'rb') as f: shutil.copyfileobj(f, out)
-
-                # Decrypt stitched file asynchronously
-                decrypt_future = DECRYPT_EXECUTOR.submit(run_mp4decrypt, temp_stitch_enc, temp_stitch_dec, ctx['kid'], ctx['key'])
-                
+                    prefetch.result(timeout=60)
+                except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+                    pass
+
+            if not segment_ready(local_dec_path):
+                start_prepare = time.time()
+                # Duplicate requests for this segment wait on one preparation, without taking a worker each
+                future = SEGMENT_FLIGHTS.start((id, filepath), lambda: DECRYPT_EXECUTOR.submit(
+                    prepare_media_segment, ctx, l_enc_dir, l_dec_dir, filepath))
                 try:
-                    if not decrypt_future.result(timeout=20):  # 20 second timeout for decryption
-                        return Response("Media Decrypt Failed", 500)
+                    error = future.result(timeout=60)  # init, download and decrypt together
                 except concurrent.futures.TimeoutError:
-                    return Response("Media Decrypt Timeout", 504)
-
-                # F. Split and Save
-                if os.path.exists(temp_stitch_dec):
-                    with open(temp_stitch_dec, 'rb') as fin:
-                        fin.seek(offset)
-                        with open(local_dec_path, 'wb') as fout:
-                            shutil.copyfileobj(fin, fout)
-                    
-                    stitch_time = time.time() - start_stitch
-                    debugger.success(f"[PROXY] Media segment processed in {stitch_time:.2f}s")
-                    
-                    response = send_file(local_dec_path, mimetype='video/mp4')
-                    response.headers['Access-Control-Allow-Origin'] = '*'
-                    response.headers['Access-Control-Allow-Credentials'] = 'true'
-                    return response
-                else:
-                    return Response("Split Failed: Output missing", 500)
+                    return Response("Media Segment Timeout", 504)
+                if error:
+                    return Response(*error)
+                PREFETCHER.record_prepare_time(time.time() - start_prepare)
 
-            finally:
-                # Cleanup temps
-                try:
-                    if os.path.exists(temp_stitch_enc): os.remove(temp_stitch_enc)
-                    if os.path.exists(temp_stitch_dec): os.remove(temp_stitch_dec)
-                except: pass
+            return segment_response(local_dec_path)
 
     except Exception as e:
         debugger.error(f"Proxy error: {e}")
@@ -689,7 +894,7 @@ def get_lecture_info(batch_name,id):
             # Original behavior - fetch keys and return CloudFront URL
             debugger.info(f"[SCARPER] CORS fix disabled - fetching CloudFront URL and keys")
             lf = Lf(batch_api.token, batch_api.random_id)
-            keys = lf.get_key(id, batch_name)
+            keys = lf.get_key(id, batch_name, use_cache=KEY_CACHE)
             original_url = keys[2]
             debugger.info(f"[SCARPER] Returning CloudFront URL: {original_url[:50]}... with keys")
             return create_response(data={"url": original_url, "key": keys[1], "kid": keys[0]})
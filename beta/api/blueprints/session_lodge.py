@@ -44,6 +44,7 @@ def create_session(client_id, session_id):
     batch_names = data.get('batch_names', [])
     topic_names = data.get('topic_names', [])
     lecture_urls = data.get('lecture_urls', [])
+    priorities = data.get('priorities', [])
 
 
     if not ids or not names:
@@ -71,6 +72,7 @@ def create_session(client_id, session_id):
             'batch_name': batch_name,
             'topic_name': topic_names[i] if i < len(topic_names) else None,
             'lecture_url': lecture_urls[i] if i < len(lecture_urls) else None,
+            'priority': priorities[i] if i < len(priorities) else 0,
             'out_dir': OUT_DIR,
             'client_id': client_id,
             'session_id': session_id
@@ -91,6 +93,37 @@ def start_task(task_id):
         print(e)
         return jsonify({'error': str(e)}), 500
 
+@session_lodge.route('/api/pause/<task_id>', methods=['GET', 'POST'])
+@session_lodge.route('/pause/<task_id>', methods=['GET', 'POST'])
+def pause_task(task_id):
+    return _control_task(task_manager.pause_task, task_id)
+
+
+@session_lodge.route('/api/resume/<task_id>', methods=['GET', 'POST'])
+@session_lodge.route('/resume/<task_id>', methods=['GET', 'POST'])
+def resume_task(task_id):
+    return _control_task(task_manager.resume_task, task_id)
+
+
+@session_lodge.route('/api/cancel/<task_id>', methods=['GET', 'POST'])
+@session_lodge.route('/cancel/<task_id>', methods=['GET', 'POST'])
+def cancel_task(task_id):
+    return _control_task(task_manager.cancel_task, task_id)
+
+
+@session_lodge.route('/api/priority/<task_id>/<int(signed=True):priority>', methods=['GET', 'POST'])
+@session_lodge.route('/priority/<task_id>/<int(signed=True):priority>', methods=['GET', 'POST'])
+def set_task_priority(task_id, priority):
+    return _control_task(task_manager.set_priority, task_id, priority)
+
+
+def _control_task(action, task_id, *args):
+    try:
+        action(task_id, *args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'success': True, 'status': task_manager.get_progress(task_id).get('status')}), 200
+
 @session_lodge.route('/api/client/<client_id>/delete_client')
 @session_lodge.route('/client/<client_id>/delete_client')
 def delete_client_route(client_id):
@@ -1,8 +1,12 @@
+import json
 import os
+import time
 
-from flask import Blueprint, jsonify, send_file, render_template
+from flask import Blueprint, Response, jsonify, render_template
+from beta.api.file_delivery import send_media
 from beta.api.mr_manager.boss_manager import Boss
 from mainLogic.error import debugger
+from mainLogic.utils import glv_var
 from mainLogic.utils.glv_var import ENDPOINTS_NAME
 
 client_manager = Boss.client_manager
@@ -11,6 +15,9 @@ OUT_DIR = Boss.OUT_DIR
 
 dl_and_post_dl = Blueprint('dl_and_post_dl', __name__)
 
+# Seconds between keep-alive comments on an idle progress stream, so proxies don't time it out
+# and a closed connection is noticed
+STREAM_KEEPALIVE = 15
 
 
 @dl_and_post_dl.route('/api/progress/<task_id>', methods=['GET'])
@@ -20,6 +27,41 @@ def get_progress(task_id):
     return jsonify(progress), 200
 
 
+@dl_and_post_dl.route('/api/client/<client_id>/<session_id>/progress/stream', methods=['GET'])
+@dl_and_post_dl.route('/client/<client_id>/<session_id>/progress/stream', methods=['GET'])
+def stream_progress(client_id, session_id):
+    """
+    Server-Sent Events of every task of a session, instead of polling /progress/<task_id> per task.
+    The first event ('snapshot') has the session's tasks; every later one (the default 'message'
+    event) a list of changes, each {'task_id', ...changed fields}, where 'progress' holds only the
+    streams that moved. Changes are sent at most `progress-update-hz` times a second.
+    """
+    hub = task_manager.progress_hub
+    # Subscribed before the snapshot is taken, so no change falls in between
+    subscription = hub.subscribe(client_id, session_id)
+    snapshot = task_manager.get_session_tasks(client_id, session_id)
+    interval = 1.0 / max(0.1, float(glv_var.vars.get('prefs', {}).get('progress-update-hz', 4)))
+
+    def events():
+        try:
+            yield f"retry: 2000\nevent: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                changes = subscription.next(STREAM_KEEPALIVE)
+                if not changes:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(list(changes.values()))}\n\n"
+                # Lets the changes of the next interval coalesce in the subscription
+                time.sleep(interval)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx would otherwise buffer the stream
+    })
+
+
 @dl_and_post_dl.route('/api/get-file/<task_id>/<name>', methods=['GET'])
 @dl_and_post_dl.route('/get-file/<task_id>/<name>', methods=['GET'])
 def get_file(task_id, name):
@@ -40,7 +82,8 @@ def get_file(task_id, name):
         debugger.error(f"File not found: {file_path}")
         return render_template("error.html",task_id=task_id,video_details=client_manager.get_task(task_id),reason='deleted'), 404
 
-    return send_file(file_path, as_attachment=True,download_name=f"{name}.mp4")
+    # Ranged and conditional, so players can seek in the file without downloading it from the start
+    return send_media(file_path, as_attachment=True,download_name=f"{name}.mp4")
 
 @dl_and_post_dl.route(ENDPOINTS_NAME.GET_PVT_FILE_FOR_A_CLIENT(), methods=['GET'])
 @dl_and_post_dl.route('/get-private-file/<client_id>/<name>', methods=['GET'])
@@ -52,4 +95,4 @@ def get_private_file(client_id, name):
         debugger.error(f"File not found: {file_path}")
         return render_template("error.html",reason='deleted'), 404
 
-    return send_file(file_path, as_attachment=True,download_name=name)
+    return send_media(file_path, as_attachment=True,download_name=name)
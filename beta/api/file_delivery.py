@@ -0,0 +1,111 @@
+"""
+File responses for the web UI with validators, conditional GET and byte ranges: the finished
+lectures on /get-file and the segments of the decrypting proxy.
+
+Flask's send_file handles Range by wrapping the whole file and skipping to the start of the range,
+which on servers whose file wrapper can't seek (gunicorn) reads and throws away everything before
+it. Here the file is positioned at the start of the range instead, and handed to the server's
+`wsgi.file_wrapper` when there is one, so gunicorn and waitress send it with sendfile() up to
+Content-Length. Other servers (the development server) get it streamed in chunks of
+`stream-chunk-size` bytes.
+"""
+import mimetypes
+import os
+import unicodedata
+from urllib.parse import quote
+from zlib import adler32
+
+from flask import Response, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+from mainLogic.utils import glv_var
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+def chunk_size():
+    return max(4096, int(glv_var.vars.get('prefs', {}).get('stream-chunk-size', DEFAULT_CHUNK_SIZE)))
+
+
+def send_media(path=None, data=None, mimetype=None, download_name=None, as_attachment=False,
+               etag=None, max_age=None):
+    """
+    Sends the file at `path`, or `data` from memory, answering GET and HEAD with 200, 206 for a
+    satisfiable Range, 304/412 for If-None-Match/If-Modified-Since/If-Match, and 416 for a bad
+    Range. The ETag defaults to one built from the file's mtime, size and path (or the bytes).
+    Responses are returned, never raised, so callers can add their own headers.
+    """
+    environ = request.environ
+
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(download_name or path or '')[0] or 'application/octet-stream'
+    rv = Response(mimetype=mimetype, direct_passthrough=True)
+
+    if path is not None:
+        st = os.stat(path)
+        size = st.st_size
+        rv.last_modified = st.st_mtime
+        etag = etag or f"{st.st_mtime_ns:x}-{size:x}-{adler32(path.encode()) & 0xFFFFFFFF:x}"
+    else:
+        size = len(data)
+        etag = etag or f"{size:x}-{adler32(data) & 0xFFFFFFFF:x}"
+    rv.set_etag(etag)
+    rv.content_length = size
+
+    if download_name is not None:
+        rv.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                       **_filename_params(download_name))
+
+    if max_age:
+        rv.cache_control.public = True
+        rv.cache_control.max_age = max_age
+    else:
+        rv.cache_control.no_cache = True
+
+    try:
+        rv.make_conditional(environ, accept_ranges=True, complete_length=size)
+    except RequestedRangeNotSatisfiable as e:
+        return e.get_response(environ)
+
+    if rv.status_code in (304, 412) or environ['REQUEST_METHOD'] == 'HEAD':
+        rv.response = []
+        return rv
+
+    start, stop = (rv.content_range.start, rv.content_range.stop) if rv.status_code == 206 else (0, size)
+    if data is not None:
+        rv.response = [data[start:stop]]
+    else:
+        rv.response = _file_body(environ, path, start, stop)
+    return rv
+
+
+def _file_body(environ, path, start, stop):
+    f = open(path, 'rb')
+    f.seek(start)
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        # Sends from the current offset and stops at Content-Length, with sendfile() if it can
+        return file_wrapper(f, chunk_size())
+    return _read_chunks(f, stop - start, chunk_size())
+
+
+def _read_chunks(f, remaining, size):
+    # A generator so that the server closing the response (or the client going away) closes the file
+    try:
+        while remaining > 0:
+            chunk = f.read(min(size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _filename_params(download_name):
+    try:
+        download_name.encode('ascii')
+        return {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
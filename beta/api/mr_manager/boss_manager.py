@@ -1,3 +1,4 @@
+from beta.api.mr_manager.cache_manager import CacheManager
 from beta.api.mr_manager.client_manager import ClientManager
 from beta.api.mr_manager.task_manager import TaskManager
 from mainLogic.utils import glv_var
@@ -5,5 +6,13 @@ from mainLogic.utils import glv_var
 
 class Boss:
     client_manager = ClientManager('clients.json')
+    # Downloads running at once; the rest wait in the queue. Prefs may not be loaded yet when
+    # this is imported, so the webui-max-tasks limit is set by apply_prefs
     task_manager = TaskManager(client_manager)
+    cache_manager = CacheManager()
     OUT_DIR = glv_var.api_webdl_directory
+
+    @classmethod
+    def apply_prefs(cls, prefs):
+        """Applies the prefs the managers follow; called once prefs are loaded and whenever they change."""
+        cls.task_manager.scheduler.set_max_running(prefs.get('webui-max-tasks', 2))
@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from mainLogic.utils.glv_var import debugger
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache bounded by entry count, evicting the least recently used entry.
+    Entries may carry their own expiry (e.g. the signed URL they were built from); an expired
+    entry reads as a miss and is dropped.
+    """
+
+    def __init__(self, name, max_entries=256, ttl=None):
+        self.name = name
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, expires or None)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and item[1] is not None and item[1] <= time.time():
+                del self.entries[key]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, expires=None):
+        if expires is None and self.ttl:
+            expires = time.time() + self.ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.entries.pop(key, None)
+        return default if item is None else item[0]
+
+    def items(self):
+        """Snapshot of (key, value) pairs, safe to iterate while other threads write."""
+        with self.lock:
+            return [(key, item[0]) for key, item in self.entries.items()]
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SegmentStore:
+    """
+    Tracks the segment files the proxy keeps under `root` and deletes the least recently used
+    ones once their total size exceeds `max_bytes`, or once they haven't been read for
+    `max_age` seconds. Files already on disk at startup are adopted, oldest first.
+
+    The proxy reports every file it writes with `add` and every lookup with `lookup`; the store
+    never decides on its own what is cached, it only forgets it.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, max_age=6 * 3600):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.files = OrderedDict()  # path -> (size, last access)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        found = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        with self.lock:
+            for mtime, path, size in sorted(found):
+                self.files[path] = (size, mtime)
+                self.total_bytes += size
+            self._evict_locked()
+
+    def lookup(self, path):
+        """True (and marks the file as recently used) if a non-empty copy of `path` is stored."""
+        path = os.path.abspath(path)
+        try:
+            present = os.path.getsize(path) > 0
+        except OSError:
+            present = False
+        with self.lock:
+            if present:
+                self.hits += 1
+                self._touch_locked(path)
+            else:
+                self.misses += 1
+                self._forget_locked(path)
+        return present
+
+    def touch(self, path):
+        with self.lock:
+            self._touch_locked(os.path.abspath(path))
+
+    def add(self, *paths):
+        """Registers freshly written files, then evicts down to the budget."""
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            with self.lock:
+                self._forget_locked(path)
+                self.files[path] = (size, time.time())
+                self.total_bytes += size
+        with self.lock:
+            self._evict_locked()
+
+    def _touch_locked(self, path):
+        if path in self.files:
+            self.files[path] = (self.files[path][0], time.time())
+            self.files.move_to_end(path)
+
+    def _forget_locked(self, path):
+        item = self.files.pop(path, None)
+        if item:
+            self.total_bytes -= item[0]
+
+    def _evict_locked(self):
+        cutoff = time.time() - self.max_age if self.max_age else None
+        while self.files:
+            path, (size, accessed) = next(iter(self.files.items()))
+            if self.total_bytes <= self.max_bytes and (cutoff is None or accessed > cutoff):
+                break
+            # Unlinking a file that is still being sent is fine on POSIX; elsewhere it just
+            # stays on disk and is picked up again at the next startup
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                debugger.warning(f"[CACHE] Could not evict {path}: {e}")
+            self._forget_locked(path)
+            self.evictions += 1
+            self.evicted_bytes += size
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self.files),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+class CacheManager:
+    """Registry of the server's caches so that their counters can be read in one place."""
+
+    def __init__(self):
+        self.caches = {}
+
+    def register(self, name, cache):
+        self.caches[name] = cache
+        return cache
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
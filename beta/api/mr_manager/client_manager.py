@@ -1,27 +1,57 @@
 import json
 import os
 
+from beta.api.mr_manager.client_store import ClientStore
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger
 
 
 class ClientManager:
-    def __init__(self, json_file_path):
+    """
+    Clients, their sessions and their tasks. Reads are served from `self.clients`, a dict in the
+    shape of the legacy clients.json; every change is written through to a SQLite store next to
+    it (clients.db), row by row. clients.json is only read: it is imported once when the store
+    is new, and never written back, so it goes stale from then on.
+    """
+
+    def __init__(self, json_file_path, db_path=None):
         self.json_file_path = json_file_path
+        self.db_path = db_path or os.path.splitext(json_file_path)[0] + '.db'
+        self.store = ClientStore(self.db_path)
+        if self.store.is_empty() and os.path.exists(self.json_file_path):
+            debugger.info(f"[CLIENTS] Importing {self.json_file_path} into {self.db_path}")
+            self.import_json(self.json_file_path)
         self.clients = self.load_data()
+        self.task_index = self._build_task_index()
 
     def load_data(self):
-        if not os.path.exists(self.json_file_path):
-            return {}
+        return self.store.load()
+
+    def _build_task_index(self):
+        """task_id -> (client_id, session_id), kept in step with self.clients by every method below"""
+        return {task_id: (client_id, session_id)
+                for client_id, client in self.clients.items()
+                for session_id, session in client['sessions'].items()
+                for task_id in session['tasks']}
+
+    def _unindex(self, client_id, session_id=None):
+        sessions = self.clients[client_id]['sessions']
+        for sid in ([session_id] if session_id is not None else sessions):
+            for task_id in sessions[sid]['tasks']:
+                self.task_index.pop(task_id, None)
+
+    def import_json(self, path):
+        """Replaces all clients with the ones in a clients.json file."""
         try:
-            with open(self.json_file_path, 'r') as file:
-                return json.load(file)
-        except json.JSONDecodeError:
-            return {}
-
-    def save_data(self):
-        with open(self.json_file_path, 'w') as file:
-            json.dump(self.clients, file, indent=4)
+            with open(path, 'r') as file:
+                clients = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            debugger.error(f"[CLIENTS] Could not import {path}: {e}")
+            return False
+        self.store.replace_all(clients)
+        self.clients = self.load_data()
+        self.task_index = self._build_task_index()
+        return True
 
     def client_exists(self, client_id):
         return client_id in self.clients
@@ -36,21 +66,22 @@ class ClientManager:
                 "client_id": client_id,
                 "sessions": {}
             }
-            self.save_data()
+            self.store.put_client(client_id, self.clients[client_id]['name'])
         else:
             print(f"Client with ID {client_id} already exists.")
 
     def remove_client(self, client_id):
         if client_id in self.clients:
+            self._unindex(client_id)
             del self.clients[client_id]
-            self.save_data()
+            self.store.delete_client(client_id)
         else:
             print(f"Client with ID {client_id} does not exist.")
 
     def set_client_name(self, client_id, name):
         if client_id in self.clients:
             self.clients[client_id]['name'] = name
-            self.save_data()
+            self.store.put_client(client_id, name)
         else:
             print(f"Client with ID {client_id} does not exist.")
 
@@ -60,7 +91,7 @@ class ClientManager:
             if session_id not in self.clients[client_id]['sessions']:
                 timestamp = generate_timestamp()
                 self.clients[client_id]['sessions'][session_id] = {"tasks": {}, "name": "", "timestamp": timestamp}
-                self.save_data()
+                self.store.put_session(client_id, session_id, "", timestamp)
             else:
                 print(f"Session with ID {session_id} already exists for client {client_id}.")
         else:
@@ -68,15 +99,17 @@ class ClientManager:
 
     def remove_session(self, client_id, session_id):
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
+            self._unindex(client_id, session_id)
             del self.clients[client_id]['sessions'][session_id]
-            self.save_data()
+            self.store.delete_session(client_id, session_id)
         else:
             print(f"Session with ID {session_id} does not exist for client {client_id}.")
 
     def add_task(self, client_id, session_id, task_id, task_info):
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
             self.clients[client_id]['sessions'][session_id]['tasks'][task_id] = task_info
-            self.save_data()
+            self.task_index[task_id] = (client_id, session_id)
+            self.store.add_task(client_id, session_id, task_info)
         else:
             print(f"Either client with ID {client_id} or session with ID {session_id} does not exist.")
 
@@ -89,11 +122,14 @@ class ClientManager:
             return self.clients[client_id]['sessions'][session_id]['tasks']
 
     def get_task(self,task_id):
-        for client_id in self.clients:
-            for session_id in self.clients[client_id]['sessions']:
-                if task_id in self.clients[client_id]['sessions'][session_id]['tasks']:
-                    return self.clients[client_id]['sessions'][session_id]['tasks'][task_id]
-        return None
+        location = self.task_index.get(task_id)
+        if location is None:
+            return None
+        client_id, session_id = location
+        try:
+            return self.clients[client_id]['sessions'][session_id]['tasks'][task_id]
+        except KeyError:
+            return None
 
     def update_task(self, task_info):
         client_id = task_info['client_id']
@@ -102,7 +138,8 @@ class ClientManager:
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
             if task_id in self.clients[client_id]['sessions'][session_id]['tasks']:
                 self.clients[client_id]['sessions'][session_id]['tasks'][task_id] = task_info
-                self.save_data()
+                # Progress ticks land here; the store batches them
+                self.store.put_task(client_id, session_id, task_info)
             else:
                 print(f"Task with ID {task_id} does not exist in session {session_id} for client {client_id}.")
         else:
@@ -112,7 +149,8 @@ class ClientManager:
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
             if task_id in self.clients[client_id]['sessions'][session_id]['tasks']:
                 del self.clients[client_id]['sessions'][session_id]['tasks'][task_id]
-                self.save_data()
+                self.task_index.pop(task_id, None)
+                self.store.delete_task(task_id)
             else:
                 print(f"Task with ID {task_id} does not exist in session {session_id} for client {client_id}.")
         else:
@@ -135,16 +173,18 @@ class ClientManager:
 
     def set_session_name(self, client_id, session_id, name):
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
-            self.clients[client_id]['sessions'][session_id]['name'] = name
-            self.save_data()
+            session = self.clients[client_id]['sessions'][session_id]
+            session['name'] = name
+            self.store.put_session(client_id, session_id, name, session.get('timestamp'))
         else:
             print(f"Either client with ID {client_id} or session with ID {session_id} does not exist.")
 
 
     def delete_session(self, client_id, session_id):
         if client_id in self.clients and session_id in self.clients[client_id]['sessions']:
+            self._unindex(client_id, session_id)
             del self.clients[client_id]['sessions'][session_id]
-            self.save_data()
+            self.store.delete_session(client_id, session_id)
         else:
             print(f"Session with ID {session_id} does not exist for client {client_id}.")
 
@@ -168,19 +208,28 @@ class ClientManager:
                 debugger.debug(f"Deleting task {task_id}")
                 del self.clients[client_id]['sessions'][session_id_2]['tasks'][task_id]
 
+            for task_id in tasks_to_delete:
+                self.task_index.pop(task_id, None)
+                self.store.delete_task(task_id)
+
             # Move tasks from session_id_2 to session_id_1
-            self.clients[client_id]['sessions'][session_id_1]['tasks'].update(self.clients[client_id]['sessions'][session_id_2]['tasks'])
+            moved = self.clients[client_id]['sessions'][session_id_2]['tasks']
+            self.clients[client_id]['sessions'][session_id_1]['tasks'].update(moved)
+            for task_id in moved:
+                self.task_index[task_id] = (client_id, session_id_1)
+            self.store.move_tasks(client_id, list(moved), session_id_1)
 
             # Delete session_id_2
             del self.clients[client_id]['sessions'][session_id_2]
-            self.save_data()
+            self.store.delete_session(client_id, session_id_2)
         else:
             print(f"Either client with ID {client_id} or session with ID {session_id_1} or {session_id_2} does not exist.")
 
 
     def delete_client(self, client_id):
         if client_id in self.clients:
+            self._unindex(client_id)
             del self.clients[client_id]
-            self.save_data()
+            self.store.delete_client(client_id)
         else:
             print(f"Client with ID {client_id} does not exist.")
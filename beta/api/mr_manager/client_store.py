@@ -0,0 +1,188 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+from mainLogic.utils.glv_var import debugger
+
+
+class ClientStore:
+    """
+    SQLite (WAL) persistence of ClientManager's clients, sessions and tasks, one row each.
+
+    Task updates are the hot path (a progress tick per segment per running download), so
+    `put_task` only records the latest state of the task in memory; a background thread commits
+    all pending tasks in one transaction every `flush_interval` seconds. Every other change,
+    creating a task included, is committed right away, after the pending tasks, so that e.g. a
+    task removed after a progress tick stays removed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            client_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            timestamp TEXT,
+            PRIMARY KEY (client_id, session_id)
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_by_session ON tasks (client_id, session_id);
+    """
+
+    def __init__(self, db_path, flush_interval=0.5):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+        self.pending = {}  # task_id -> (client_id, session_id, task_info as JSON)
+        self.flusher = None
+        self.commits = 0
+        self.coalesced = 0
+        atexit.register(self.flush)
+
+    # --- reads ---
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM clients LIMIT 1").fetchone() is None
+
+    def load(self):
+        """Everything, in the shape of the legacy clients.json."""
+        with self.lock:
+            self._flush_locked()
+            clients = {}
+            for client_id, name in self.conn.execute("SELECT client_id, name FROM clients"):
+                clients[client_id] = {"name": name, "client_id": client_id, "sessions": {}}
+            for client_id, session_id, name, timestamp in self.conn.execute(
+                    "SELECT client_id, session_id, name, timestamp FROM sessions"):
+                if client_id in clients:
+                    clients[client_id]["sessions"][session_id] = {"tasks": {}, "name": name, "timestamp": timestamp}
+            for task_id, client_id, session_id, data in self.conn.execute(
+                    "SELECT task_id, client_id, session_id, data FROM tasks"):
+                session = clients.get(client_id, {}).get("sessions", {}).get(session_id)
+                if session is not None:
+                    session["tasks"][task_id] = json.loads(data)
+            return clients
+
+    # --- writes ---
+
+    def add_task(self, client_id, session_id, task_info):
+        """A new task, committed right away so that it survives a crash before the next batch."""
+        self._execute("INSERT OR REPLACE INTO tasks (task_id, client_id, session_id, data) VALUES (?, ?, ?, ?)",
+                      (task_info['task_id'], client_id, session_id, json.dumps(task_info)))
+
+    def put_task(self, client_id, session_id, task_info):
+        """Deferred: the task update is committed with the next batch."""
+        with self.lock:
+            if task_info['task_id'] in self.pending:
+                self.coalesced += 1
+            self.pending[task_info['task_id']] = (client_id, session_id, json.dumps(task_info))
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, name="client-store-flush", daemon=True)
+                self.flusher.start()
+
+    def put_client(self, client_id, name):
+        self._execute("INSERT INTO clients (client_id, name) VALUES (?, ?) "
+                      "ON CONFLICT (client_id) DO UPDATE SET name = excluded.name", (client_id, name))
+
+    def delete_client(self, client_id):
+        self._execute("DELETE FROM tasks WHERE client_id = ?", (client_id,),
+                      "DELETE FROM sessions WHERE client_id = ?", (client_id,),
+                      "DELETE FROM clients WHERE client_id = ?", (client_id,))
+
+    def put_session(self, client_id, session_id, name, timestamp):
+        self._execute("INSERT INTO sessions (client_id, session_id, name, timestamp) VALUES (?, ?, ?, ?) "
+                      "ON CONFLICT (client_id, session_id) DO UPDATE SET name = excluded.name, "
+                      "timestamp = excluded.timestamp", (client_id, session_id, name, timestamp))
+
+    def delete_session(self, client_id, session_id):
+        self._execute("DELETE FROM tasks WHERE client_id = ? AND session_id = ?", (client_id, session_id),
+                      "DELETE FROM sessions WHERE client_id = ? AND session_id = ?", (client_id, session_id))
+
+    def move_tasks(self, client_id, task_ids, session_id):
+        with self.lock:
+            self._flush_locked()
+            self.conn.executemany("UPDATE tasks SET session_id = ? WHERE client_id = ? AND task_id = ?",
+                                  [(session_id, client_id, task_id) for task_id in task_ids])
+            self.conn.commit()
+            self.commits += 1
+
+    def delete_task(self, task_id):
+        self._execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def replace_all(self, clients):
+        """Replaces the whole store with `clients` (legacy clients.json shape)."""
+        with self.lock:
+            self.pending.clear()
+            self.conn.execute("DELETE FROM tasks")
+            self.conn.execute("DELETE FROM sessions")
+            self.conn.execute("DELETE FROM clients")
+            for client_id, client in clients.items():
+                self.conn.execute("INSERT INTO clients (client_id, name) VALUES (?, ?)",
+                                  (client_id, client.get("name", "")))
+                for session_id, session in client.get("sessions", {}).items():
+                    self.conn.execute("INSERT INTO sessions (client_id, session_id, name, timestamp) VALUES (?, ?, ?, ?)",
+                                      (client_id, session_id, session.get("name", ""), session.get("timestamp")))
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO tasks (task_id, client_id, session_id, data) VALUES (?, ?, ?, ?)",
+                        [(task_id, client_id, session_id, json.dumps(task))
+                         for task_id, task in session.get("tasks", {}).items()])
+            self.conn.commit()
+            self.commits += 1
+
+    def _execute(self, *statements):
+        """Runs (sql, params) pairs in one transaction, after the pending task writes."""
+        with self.lock:
+            self._flush_locked()
+            for sql, params in zip(statements[::2], statements[1::2]):
+                self.conn.execute(sql, params)
+            self.conn.commit()
+            self.commits += 1
+
+    # --- batching ---
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        rows = [(task_id, client_id, session_id, data)
+                for task_id, (client_id, session_id, data) in self.pending.items()]
+        try:
+            self.conn.executemany("INSERT OR REPLACE INTO tasks (task_id, client_id, session_id, data) "
+                                  "VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+        except sqlite3.Error:
+            # Kept pending, the next flush retries with whatever is newest by then
+            self.conn.rollback()
+            raise
+        self.pending.clear()
+        self.commits += 1
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                debugger.error(f"[CLIENTS] Could not save task progress: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {"pending": len(self.pending), "commits": self.commits, "coalesced": self.coalesced}
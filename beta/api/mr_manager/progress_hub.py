@@ -0,0 +1,85 @@
+import threading
+
+
+class Subscription:
+    """
+    The changes waiting to be sent to one client, coalesced per task: a task that changed several
+    times since the last `next()` is sent once, with its latest status and the latest state of
+    every stream that moved. A slow client therefore never holds more than one entry per task.
+    """
+
+    def __init__(self, client_id, session_id):
+        self.client_id = client_id
+        self.session_id = session_id
+        self.cond = threading.Condition()
+        self.pending = {}  # task_id -> change
+        self.closed = False
+
+    def push(self, task_id, change):
+        with self.cond:
+            entry = self.pending.get(task_id)
+            if entry is None:
+                self.pending[task_id] = entry = {'task_id': task_id}
+            for key, value in change.items():
+                if key == 'progress' and isinstance(entry.get('progress'), dict):
+                    entry['progress'] = {**entry['progress'], **value}
+                else:
+                    entry[key] = value
+            self.cond.notify()
+
+    def next(self, timeout):
+        """The changes since the last call, waiting up to `timeout` seconds for one; {} on timeout."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending or self.closed, timeout)
+            changes, self.pending = self.pending, {}
+            return changes
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+
+class ProgressHub:
+    """
+    Fans task changes out to the progress streams of their session (see
+    /api/client/<client_id>/<session_id>/progress/stream). TaskManager publishes from the same
+    paths that update the task, under its own lock; publishing only merges the change into the
+    pending changes of each subscriber of that session, so it never waits on a client.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # (client_id, session_id) -> set of Subscription
+        self.published = 0
+
+    def subscribe(self, client_id, session_id):
+        subscription = Subscription(client_id, session_id)
+        with self.lock:
+            self.subscribers.setdefault((client_id, session_id), set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        key = (subscription.client_id, subscription.session_id)
+        with self.lock:
+            subscribers = self.subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[key]
+
+    def publish(self, client_id, session_id, task_id, change):
+        with self.lock:
+            subscribers = self.subscribers.get((client_id, session_id))
+            if not subscribers:
+                return
+            subscribers = list(subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.push(task_id, change)
+
+    def stats(self):
+        with self.lock:
+            return {"streams": sum(len(s) for s in self.subscribers.values()),
+                    "sessions": len(self.subscribers), "published": self.published}
@@ -0,0 +1,164 @@
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional
+
+
+class _Stream:
+    def __init__(self):
+        self.last = None
+        self.last_seen = 0.0
+        self.interval = None  # EWMA of the time between sequential requests
+        self.generation = 0
+        self.end = None  # first number that failed, nothing is prefetched from there on
+        self.pending: Dict[int, Future] = {}
+        self.prepared = set()
+
+
+class SegmentPrefetcher:
+    """
+    Look-ahead for the decrypting proxy.
+
+    Every media segment request is reported with `on_request(stream, number)`, where `stream`
+    identifies a lecture's representation. Once a stream is read sequentially, the next K
+    segments are prepared in the background with `prepare(stream, number)` on `executor`. K
+    follows the playback rate: it is the number of requests the player makes while one segment
+    is being prepared (plus one), clamped to [min_ahead, max_ahead].
+
+    A request that isn't the next segment is a seek; look-ahead that hasn't started yet is
+    cancelled. Streams not read for `idle_timeout` seconds are dropped, and queued work of a
+    dropped or seeked stream returns without doing anything. At most `max_pending` prefetches are
+    queued or running at a time, so that player requests always find a free worker.
+    """
+
+    EWMA = 0.3
+
+    def __init__(self, executor, prepare: Callable[[Hashable, int], bool],
+                 is_ready: Callable[[Hashable, int], bool], max_ahead=6, min_ahead=1,
+                 max_pending=3, idle_timeout=30.0):
+        self.executor = executor
+        self.prepare = prepare
+        self.is_ready = is_ready
+        self.max_ahead = max_ahead
+        self.min_ahead = max(1, min(min_ahead, max_ahead))
+        self.max_pending = max(1, max_pending)
+        self.idle_timeout = idle_timeout
+        self.streams: Dict[Hashable, _Stream] = {}
+        self.lock = threading.Lock()
+        self.prepare_time = None  # EWMA of how long preparing a segment takes
+        self.issued = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    @property
+    def enabled(self):
+        return self.max_ahead > 0
+
+    def record_prepare_time(self, seconds: float):
+        with self.lock:
+            self.prepare_time = seconds if self.prepare_time is None else (
+                self.EWMA * seconds + (1 - self.EWMA) * self.prepare_time)
+
+    def pending(self, stream: Hashable, number: int) -> Optional[Future]:
+        """The prefetch of this segment, if one is queued or running, so a request can wait for it."""
+        with self.lock:
+            st = self.streams.get(stream)
+            future = st.pending.get(number) if st else None
+        return future if future is not None and not future.cancelled() else None
+
+    def on_request(self, stream: Hashable, number: int):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self._drop_idle_locked(now)
+            st = self.streams.setdefault(stream, _Stream())
+            if number in st.prepared:
+                st.prepared.discard(number)
+                self.hits += 1
+
+            sequential = st.last is not None and number == st.last + 1
+            if sequential:
+                if st.end is not None and number >= st.end:
+                    # The failure that set `end` wasn't the end of the stream after all
+                    st.end = None
+                gap = now - st.last_seen
+                st.interval = gap if st.interval is None else self.EWMA * gap + (1 - self.EWMA) * st.interval
+            elif st.last is not None and number != st.last:
+                self._cancel_locked(st)
+                st.interval = None
+                st.end = None
+            st.last = number
+            st.last_seen = now
+
+            if sequential:
+                self._schedule_locked(stream, st, number)
+
+    def _ahead_locked(self, st: _Stream) -> int:
+        if not st.interval or self.prepare_time is None:
+            return self.min_ahead
+        return max(self.min_ahead, min(self.max_ahead, math.ceil(self.prepare_time / st.interval) + 1))
+
+    def _schedule_locked(self, stream, st: _Stream, number: int):
+        in_flight = sum(len(s.pending) for s in self.streams.values())
+        for ahead in range(1, self._ahead_locked(st) + 1):
+            target = number + ahead
+            if in_flight >= self.max_pending or (st.end is not None and target >= st.end):
+                break
+            if target in st.pending or self.is_ready(stream, target):
+                continue
+            st.pending[target] = self.executor.submit(self._run, stream, target, st.generation)
+            in_flight += 1
+            self.issued += 1
+
+    def _run(self, stream, number: int, generation: int) -> bool:
+        with self.lock:
+            st = self.streams.get(stream)
+            stale = st is None or st.generation != generation
+        if stale:
+            # Seeked away from or idle since this was queued
+            return False
+        started = time.monotonic()
+        ok = False
+        try:
+            ok = self.prepare(stream, number)
+        finally:
+            if ok:
+                self.record_prepare_time(time.monotonic() - started)
+            with self.lock:
+                # Seeked while this was running; the work is kept, the bookkeeping is not
+                if st.generation == generation:
+                    st.pending.pop(number, None)
+                    if ok:
+                        st.prepared.add(number)
+                    else:
+                        self.failed += 1
+                        # Most likely past the last segment
+                        st.end = number if st.end is None else min(st.end, number)
+        return ok
+
+    def _cancel_locked(self, st: _Stream):
+        st.generation += 1
+        for future in st.pending.values():
+            if future.cancel():
+                self.cancelled += 1
+        st.pending.clear()
+        st.prepared.clear()
+
+    def _drop_idle_locked(self, now: float):
+        for stream in [s for s, st in self.streams.items() if now - st.last_seen > self.idle_timeout]:
+            self._cancel_locked(self.streams.pop(stream))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "streams": len(self.streams),
+                "pending": sum(len(st.pending) for st in self.streams.values()),
+                "issued": self.issued,
+                "hits": self.hits,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "prepare_seconds": round(self.prepare_time, 3) if self.prepare_time is not None else None,
+            }
@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller (the leader) does the work, and
+    callers arriving while it is in flight (followers) get the leader's result, or its exception,
+    instead of doing the work again. Once the call completes the key is free, so a later call
+    does the work anew; caching results is up to the caller.
+
+    Followers of `do` wait at most `timeout` seconds (None: no limit) and then raise
+    concurrent.futures.TimeoutError. A worker of a pool must never follow a call that `start`
+    queued on that same pool: with every worker waiting, the call never runs. Pool workers use
+    `do_if_idle` for keys that may have been started that way.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = {}  # key -> Future of the call in flight
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Runs `fn(*args, **kwargs)` on the calling thread, or waits for the call already in flight."""
+        leader, future = self._join(key, follow=True)
+        if not leader:
+            return future.result(timeout=self.timeout)
+        return self._lead(key, future, fn, *args, **kwargs)
+
+    def do_if_idle(self, key, fn, *args, **kwargs):
+        """
+        Like `do` when no call for `key` is in flight, returning (True, result). Otherwise returns
+        (False, None) at once instead of waiting for that call.
+        """
+        leader, future = self._join(key, follow=False)
+        if not leader:
+            return False, None
+        return True, self._lead(key, future, fn, *args, **kwargs)
+
+    def _join(self, key, follow):
+        """(True, a new Future) for the leader, (False, the call in flight) otherwise."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is None:
+                future = self.calls[key] = Future()
+                self.leaders += 1
+                return True, future
+            if follow:
+                self.followers += 1
+            return False, future
+
+    def _lead(self, key, future, fn, *args, **kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._forget(key, future)
+
+    def start(self, key, launch):
+        """
+        Returns the future of the call in flight for `key`, or the one `launch()` returns (e.g. an
+        executor submit). Followers wait on the future themselves and don't occupy a worker.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return future
+            future = self.calls[key] = launch()
+            self.leaders += 1
+        # Outside the lock: the callback runs right away if the future is already done
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def stats(self):
+        with self.lock:
+            calls = self.leaders + self.followers
+            return {
+                "in_flight": len(self.calls),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalesced_ratio": round(self.followers / calls, 4) if calls else 0.0,
+            }
@@ -2,22 +2,36 @@ import json
 import threading
 import uuid
 
+from beta.api.mr_manager.progress_hub import ProgressHub
+from beta.api.mr_manager.task_scheduler import TaskScheduler
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger
 
 
 class TaskManager:
-    def __init__(self, client_manager):
+    """
+    Web UI download tasks. A started task is queued on `scheduler` (see task_scheduler.py), which
+    runs `max_running` of them at a time by priority and fairly between clients, instead of a
+    thread per task all at once. Statuses: created (not started yet), queued, running, pausing,
+    paused, cancelling, cancelled, completed, failed.
+    """
+
+    def __init__(self, client_manager, max_running=2):
         self.tasks = {}
         self.lock = threading.Lock()
         self.client_manager = client_manager
         self.inactive_tasks = {}
+        self.targets = {}  # task_id -> target(task_id, *task args, progress_callback, cancel_event=...)
+        # Pushes every change below to the progress streams of the task's session
+        self.progress_hub = ProgressHub()
+        self.scheduler = TaskScheduler(self._run_task, max_running)
 
     def handle_completion(self, task_id):
         print(f"Task {task_id} completed")
         with self.lock:
             self.tasks[task_id]['status'] = 'completed'
             self.client_manager.update_task(self.tasks[task_id])
+            self._publish(self.tasks[task_id], 'status')
 
     on_task_complete = handle_completion
 
@@ -44,7 +58,8 @@ class TaskManager:
             'progress': {
                 'progress': 0
             },
-            'status': 'created' if inactive else 'running',  # Set status to 'created' if inactive
+            'status': 'created' if inactive else 'queued',  # Set status to 'created' if inactive
+            'priority': int(args_dict.get('priority') or 0),
             'name': name,
             'out_dir': out_dir,
             'id': id,
@@ -57,11 +72,12 @@ class TaskManager:
 
         with self.lock:
             self.tasks[task_id] = task_info
+            self.targets[task_id] = target
             self.client_manager.add_task(client_id, session_id, task_id, task_info)
+            self._publish(task_info, *task_info)
 
         if not inactive:
-            thread = threading.Thread(target=self._run_task, args=(task_info, target, name, id, out_dir, client_id, session_id, *args[1:]))
-            thread.start()
+            self.scheduler.submit(task_id, client_id, task_info['priority'])
         else:
             self.inactive_tasks[task_id] = {
                 'target': target,
@@ -76,45 +92,144 @@ class TaskManager:
             if task_id in self.tasks:
                 if self.tasks[task_id]['status'] == 'created':
                     task_info = self.tasks[task_id]
-                    target = self._get_target_function(task_id)  # Replace with your actual logic to retrieve the target function
-                    thread = threading.Thread(target=self._run_task,
-                                              args=(
-                                                  task_info, target,
-                                                  task_info['name'],task_info['id'], task_info['batch_name'],task_info['topic_name'],task_info['lecture_url'],
-                                                  task_info['out_dir'], task_info['client_id'], task_info['session_id']))
-                    thread.start()
-                    self.tasks[task_id]['status'] = 'running'
+                    self._get_target_function(task_id)
+                    self.inactive_tasks.pop(task_id)
+                    self._set_status(task_info, 'queued')
                 else:
                     raise ValueError(f"Task {task_id} is already running or completed.")
+            else:
+                return
+        self.scheduler.submit(task_id, task_info['client_id'], task_info['priority'])
 
-    def _run_task(self, task_info, target, *args):
-        task_id = task_info['task_id']
+    def pause_task(self, task_id):
+        """Holds a queued task back, or stops a running one; its downloaded segments are kept."""
+        self._stop_task(task_id, self.scheduler.pause, 'paused')
+
+    def resume_task(self, task_id):
+        with self.lock:
+            task_info = self._get_task(task_id)
+            if not self.scheduler.resume(task_id):
+                raise ValueError(f"Task {task_id} is not paused.")
+            self._set_status(task_info, 'queued')
+
+    def cancel_task(self, task_id):
+        """Drops a created, queued or paused task, or stops a running one."""
+        with self.lock:
+            task_info = self._get_task(task_id)
+            if self.inactive_tasks.pop(task_id, None) is not None:
+                self._set_status(task_info, 'cancelled')
+                return
+        self._stop_task(task_id, self.scheduler.cancel, 'cancelled')
+
+    def set_priority(self, task_id, priority):
+        with self.lock:
+            task_info = self._get_task(task_id)
+            task_info['priority'] = int(priority)
+            self.scheduler.set_priority(task_id, task_info['priority'])
+            self.client_manager.update_task(task_info)
+            self._publish(task_info, 'priority')
+
+    def _stop_task(self, task_id, stop, stopped_status):
+        with self.lock:
+            task_info = self._get_task(task_id)
+            # A task that has just finished may still be on its scheduler thread
+            status = stop(task_id) if task_info['status'] not in ('completed', 'failed', 'cancelled') else None
+            if status is None:
+                raise ValueError(f"Task {task_id} is not queued, paused or running.")
+            # 'pausing' and 'cancelling' until the download notices and _run_task records the outcome
+            self._set_status(task_info, status)
+
+    def _get_task(self, task_id):
+        if task_id not in self.tasks:
+            raise ValueError(f"Task {task_id} not found.")
+        return self.tasks[task_id]
+
+    def _set_status(self, task_info, status):
+        """Call with the lock held."""
+        task_info['status'] = status
+        self.client_manager.update_task(task_info)
+        self._publish(task_info, 'status')
+
+    def _run_task(self, task_id, cancel_event):
+        """Runs on a scheduler thread; returns the final status."""
+        with self.lock:
+            task_info = self.tasks[task_id]
+            task_info.pop('error', None)
+            # A resumed task starts a new download, which counts the segments it already has first
+            task_info['progress'] = {'progress': 0}
+            self._set_status(task_info, 'running')
+            target = self.targets[task_id]
+            args = (task_info['name'], task_info['id'], task_info['batch_name'], task_info['topic_name'],
+                    task_info['lecture_url'], task_info['out_dir'], task_info['client_id'], task_info['session_id'])
         try:
 
             progress_callback = lambda progress: self._update_progress(task_id, progress)
             debugger.debug(json.dumps([task_id, [*args], str(progress_callback)],indent=4))
-            target(task_id, *args, progress_callback)
+            target(task_id, *args, progress_callback, cancel_event=cancel_event)
             with self.lock:
                 self.tasks[task_id]['url'] = f'/get-file/{task_id}/{self.tasks[task_id]["name"]}'
                 self.tasks[task_id]['status'] = 'completed'
                 self.client_manager.update_task(self.tasks[task_id])
+                self._publish(self.tasks[task_id], 'status', 'url')
+            return 'completed'
         except Exception as e:
+            stopped = self.scheduler.stop_reason(task_id) if cancel_event.is_set() else None
+            if stopped:
+                debugger.info(f"Task {task_id} {stopped}")
+                with self.lock:
+                    self._set_status(self.tasks[task_id], stopped)
+                return stopped
             debugger.info(f"Failed with error {e}")
             with self.lock:
                 self.tasks[task_id]['status'] = 'failed'
                 self.tasks[task_id]['error'] = str(e)
                 self.client_manager.update_task(self.tasks[task_id])
+                self._publish(self.tasks[task_id], 'status', 'error')
+            return 'failed'
 
     def _update_progress(self, task_id, progress):
         with self.lock:
             if task_id in self.tasks:
-                self.tasks[task_id]['progress'] = progress
-                self.client_manager.update_task(self.tasks[task_id])
+                task_info = self.tasks[task_id]
+                task_info['progress'] = self._merge_progress(task_info['progress'], progress)
+                self.client_manager.update_task(task_info)
+                # Only the streams in this report
+                self.progress_hub.publish(task_info['client_id'], task_info['session_id'], task_id, {
+                    'status': task_info['status'],
+                    'progress': {media_type: task_info['progress'][media_type] for media_type in progress
+                                 if media_type in task_info['progress']}
+                })
+
+    @staticmethod
+    def _merge_progress(current, delta):
+        """
+        Applies a progress report of DownloaderV3's ProgressAggregator: it only has the streams
+        that moved, and only their newly failed segments, which are appended to `failed_segments`.
+        """
+        merged = {'audio': current.get('audio', {}), 'video': current.get('video', {})}
+        for media_type, info in delta.items():
+            info = dict(info)
+            failed = merged.get(media_type, {}).get('failed_segments', [])
+            new_failed = info.pop('new_failed_segments', [])
+            info['failed_segments'] = failed + new_failed if new_failed else failed
+            merged[media_type] = info
+        return merged
+
+    def _publish(self, task_info, *fields):
+        """Pushes `fields` of the task to its session's progress streams; call with the lock held."""
+        self.progress_hub.publish(task_info['client_id'], task_info['session_id'], task_info['task_id'],
+                                  {field: task_info.get(field) for field in fields})
 
     def get_progress(self, task_id):
         with self.lock:
             return self.tasks.get(task_id, {'status': 'not found'})
 
+    def get_session_tasks(self, client_id, session_id):
+        """Copies of the session's tasks, the first event of a progress stream."""
+        with self.lock:
+            return [dict(task_info) for task_info in self.tasks.values()
+                    if task_info['client_id'] == client_id and task_info['session_id'] == session_id]
+
     def _get_target_function(self, task_id):
         if task_id in self.inactive_tasks:
             return self.inactive_tasks[task_id]['target']
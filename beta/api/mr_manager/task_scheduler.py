@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import threading
+from collections import Counter
+
+
+class TaskScheduler:
+    """
+    Runs queued tasks at most `max_running` at a time, each on its own thread.
+
+    The next task is the queued one with the highest priority; between tasks of equal priority
+    the client with the fewest running tasks goes first, then the one whose last task started
+    longest ago, then the task queued first. So one client queueing fifty lectures does not hold
+    back another client's single lecture.
+
+    A running task is paused or cancelled through the `threading.Event` it was started with: the
+    task is expected to notice it, stop, and return. `run(task_id, cancel_event)` returns the
+    final status of the task; a task that returns 'paused' is kept until `resume`.
+    """
+
+    def __init__(self, run, max_running=2):
+        self.run = run
+        self.max_running = max(1, int(max_running))
+        self.lock = threading.Lock()
+        self.queues = {}  # client_id -> heap of (-priority, seq, task_id)
+        self.queued = {}  # task_id -> (client_id, priority, seq); the heaps may hold stale entries
+        self.paused = {}  # task_id -> (client_id, priority, seq)
+        self.running = {}  # task_id -> (client_id, priority, seq, cancel_event)
+        self.stopping = {}  # task_id -> 'paused' or 'cancelled', for running tasks asked to stop
+        self.running_per_client = Counter()
+        self.last_started = {}  # client_id -> number of the dispatch that last started one of its tasks
+        self.seq = itertools.count()
+        self.dispatches = 0
+
+    # --- queue ---
+
+    def submit(self, task_id, client_id, priority=0):
+        with self.lock:
+            self._enqueue(task_id, (client_id, int(priority), next(self.seq)))
+        self._dispatch()
+
+    def set_priority(self, task_id, priority):
+        """Re-prioritises a queued or paused task; returns False if it is neither."""
+        with self.lock:
+            for entries in (self.queued, self.paused):
+                if task_id in entries:
+                    client_id, _, seq = entries[task_id]
+                    if entries is self.queued:
+                        self._enqueue(task_id, (client_id, int(priority), seq))
+                    else:
+                        entries[task_id] = (client_id, int(priority), seq)
+                    break
+            else:
+                return False
+        self._dispatch()
+        return True
+
+    def set_max_running(self, max_running):
+        with self.lock:
+            self.max_running = max(1, int(max_running))
+        self._dispatch()
+
+    def _enqueue(self, task_id, entry):
+        client_id, priority, seq = entry
+        self.queued[task_id] = entry
+        heapq.heappush(self.queues.setdefault(client_id, []), (-priority, seq, task_id))
+
+    # --- pause, resume, cancel ---
+
+    def pause(self, task_id):
+        """'paused' for a queued task, 'pausing' for a running one (until it stops), else None."""
+        with self.lock:
+            if task_id in self.queued:
+                self.paused[task_id] = self.queued.pop(task_id)
+                return 'paused'
+            if task_id in self.running:
+                self.stopping[task_id] = 'paused'
+                self.running[task_id][3].set()
+                return 'pausing'
+        return None
+
+    def resume(self, task_id):
+        with self.lock:
+            entry = self.paused.pop(task_id, None)
+            if entry is None:
+                return False
+            # Back in its original place among the tasks of its priority
+            self._enqueue(task_id, entry)
+        self._dispatch()
+        return True
+
+    def cancel(self, task_id):
+        """'cancelled' for a queued or paused task, 'cancelling' for a running one, else None."""
+        with self.lock:
+            if self.queued.pop(task_id, None) or self.paused.pop(task_id, None):
+                return 'cancelled'
+            if task_id in self.running:
+                self.stopping[task_id] = 'cancelled'
+                self.running[task_id][3].set()
+                return 'cancelling'
+        return None
+
+    def stop_reason(self, task_id):
+        """'paused' or 'cancelled' if the running task was asked to stop."""
+        with self.lock:
+            return self.stopping.get(task_id)
+
+    # --- dispatch ---
+
+    def _next(self):
+        """Pops the task to start next, or returns None; call with the lock held."""
+        best = None
+        for client_id in list(self.queues):
+            heap = self.queues[client_id]
+            # Entries of tasks that were started, paused, cancelled or re-prioritised since
+            while heap and self.queued.get(heap[0][2]) != (client_id, -heap[0][0], heap[0][1]):
+                heapq.heappop(heap)
+            if not heap:
+                del self.queues[client_id]
+                continue
+            neg_priority, seq, task_id = heap[0]
+            key = (neg_priority, self.running_per_client[client_id], self.last_started.get(client_id, -1), seq)
+            if best is None or key < best[0]:
+                best = (key, client_id)
+        if best is None:
+            return None
+        _, _, task_id = heapq.heappop(self.queues[best[1]])
+        return task_id
+
+    def _dispatch(self):
+        started = []
+        with self.lock:
+            while len(self.running) < self.max_running:
+                task_id = self._next()
+                if task_id is None:
+                    break
+                client_id, priority, seq = self.queued.pop(task_id)
+                cancel_event = threading.Event()
+                self.running[task_id] = (client_id, priority, seq, cancel_event)
+                self.running_per_client[client_id] += 1
+                self.last_started[client_id] = self.dispatches
+                self.dispatches += 1
+                started.append((task_id, cancel_event))
+        for task_id, cancel_event in started:
+            threading.Thread(target=self._run, args=(task_id, cancel_event), name=f"task-{task_id[:8]}",
+                             daemon=True).start()
+
+    def _run(self, task_id, cancel_event):
+        status = None
+        try:
+            status = self.run(task_id, cancel_event)
+        finally:
+            with self.lock:
+                client_id, priority, seq, _ = self.running.pop(task_id)
+                self.stopping.pop(task_id, None)
+                self.running_per_client[client_id] -= 1
+                if not self.running_per_client[client_id]:
+                    del self.running_per_client[client_id]
+                if status == 'paused':
+                    self.paused[task_id] = (client_id, priority, seq)
+            self._dispatch()
+
+    def stats(self):
+        with self.lock:
+            queued = Counter(client_id for client_id, _, _ in self.queued.values())
+            return {"max_running": self.max_running, "running": len(self.running), "queued": len(self.queued),
+                    "paused": len(self.paused), "queued_per_client": dict(queued),
+                    "running_per_client": dict(self.running_per_client)}
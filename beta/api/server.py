@@ -0,0 +1,93 @@
+"""
+Production serving for the WebUI (`--serve-mode`).
+
+The app keeps its state in the process: TaskManager runs downloads on threads of the process that
+accepted the request, ClientManager holds the clients in memory, and the decrypting proxy keeps
+its lecture contexts, manifests, init segments and decrypt pool in module globals. So the app is
+served by ONE process with many threads; more processes would each get their own copy of all of
+that, and a progress request could land on a process that never saw the task.
+
+Threads suit the load: a proxy request spends its time waiting on the CDN or on the decrypt pool,
+not on the GIL.
+
+The app is imported by `load_app()` in the process that serves it. Under gunicorn that is the
+worker, after the fork: the master never opens the client store, so a worker never shares its
+SQLite connection with the master, and a restarted worker starts from what is on disk.
+
+    threads  gunicorn, one gthread worker with `threads` threads; waitress where gunicorn is not
+             available (Windows); the development server if neither is installed
+    dev      the Flask development server (debugger and reloader with --verbose)
+"""
+import sys
+
+from mainLogic.utils.glv_var import debugger
+
+SERVE_MODES = ('dev', 'threads')
+DEFAULT_THREADS = 32
+
+
+def serve(load_app, host, port, threads=DEFAULT_THREADS, ssl_cert=None, ssl_key=None):
+    """Serves the app `load_app()` returns until interrupted. Returns False if no production server is installed."""
+    threads = max(2, int(threads))
+    try:
+        _serve_gunicorn(load_app, host, port, threads, ssl_cert, ssl_key)
+        return True
+    except ImportError:
+        pass
+    if ssl_cert:
+        debugger.error("gunicorn is not available, and waitress does not terminate TLS")
+        return False
+    try:
+        _serve_waitress(load_app, host, port, threads)
+        return True
+    except ImportError:
+        debugger.warning("Neither gunicorn nor waitress is installed (pip install gunicorn), "
+                         "falling back to the development server")
+        return False
+
+
+def _serve_gunicorn(load_app, host, port, threads, ssl_cert, ssl_key):
+    from gunicorn.app.base import BaseApplication
+
+    class WebUIApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs in the worker, after the fork (preload_app is off)
+            return load_app()
+
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': 1,  # see the module docstring
+        'worker_class': 'gthread',
+        'threads': threads,
+        # gthread workers heartbeat independently of requests, so this only catches a hung worker;
+        # restarting one loses the running tasks, hence the generous value
+        'timeout': 300,
+        'graceful_timeout': 30,
+        'keepalive': 75,  # players keep fetching segments over the same connection
+        'accesslog': None,
+        'errorlog': '-',
+    }
+    if ssl_cert:
+        options.update(certfile=ssl_cert, keyfile=ssl_key)
+
+    debugger.success(f"[SERVER] gunicorn on {host}:{port}, 1 process x {threads} threads")
+    # gunicorn parses sys.argv on its own, which holds pwdl's arguments
+    sys.argv = sys.argv[:1]
+    WebUIApplication(options).run()
+
+
+def _serve_waitress(load_app, host, port, threads):
+    from waitress import serve as waitress_serve
+
+    app = load_app()
+    debugger.success(f"[SERVER] waitress on {host}:{port}, {threads} threads")
+    waitress_serve(app, host=host, port=port, threads=threads, connection_limit=max(100, threads * 4),
+                   channel_timeout=75)
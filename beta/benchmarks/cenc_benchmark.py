@@ -0,0 +1,96 @@
+"""
+Benchmarks the in-process CENC engine against mp4decrypt on synthetic encrypted fixtures.
+
+    python -m beta.benchmarks.cenc_benchmark [--fragments 40] [--sample-size 8192] [--mp4decrypt PATH]
+
+Both engines decrypt the same concatenated file (the way Main.process uses them) and every
+segment on its own (the way the webui proxy uses them). The decrypted sample data is checked
+against the clear fixture; mp4decrypt is skipped when it is not on PATH.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from beta.benchmarks.cenc_fixtures import build_fixture, mdat_payloads
+from mainLogic.big4.Ravenclaw_decrypt.cenc import CencDecryptor
+
+KEY = "9c3f1a2b4d5e6f708192a3b4c5d6e7f8"
+KID = "1d2c3b4a5968778695a4b3c2d1e0f0e1"
+
+
+def _report(label, seconds, nbytes):
+    print(f"  {label:<34} {seconds * 1000:9.1f} ms  {nbytes / (1024 * 1024) / max(seconds, 1e-9):8.1f} MB/s")
+
+
+def _mp4decrypt(binary, src, dst):
+    subprocess.run([binary, "--key", f"{KID}:{KEY}", src, dst], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run(media, fragments, sample_size, mp4decrypt):
+    init, segments, clear = build_fixture(KEY, KID, media, fragments=fragments, sample_size=sample_size)
+    expected = b"".join(clear)
+    total = len(init) + sum(len(s) for s in segments)
+    print(f"\n{media}: {fragments} fragments, {total / (1024 * 1024):.1f} MB")
+
+    with tempfile.TemporaryDirectory(prefix="pwdl-cenc-") as tmp:
+        src = os.path.join(tmp, "enc.mp4")
+        with open(src, "wb") as f:
+            f.write(init)
+            for segment in segments:
+                f.write(segment)
+
+        # whole file
+        dst = os.path.join(tmp, "python.mp4")
+        start = time.perf_counter()
+        CencDecryptor(KEY).decrypt_file(src, dst)
+        _report("python  (whole file)", time.perf_counter() - start, total)
+        with open(dst, "rb") as f:
+            assert mdat_payloads(f.read()) == expected, "python engine produced wrong samples"
+
+        if mp4decrypt:
+            dst = os.path.join(tmp, "bento.mp4")
+            start = time.perf_counter()
+            _mp4decrypt(mp4decrypt, src, dst)
+            _report("mp4decrypt (whole file)", time.perf_counter() - start, total)
+            with open(dst, "rb") as f:
+                assert mdat_payloads(f.read()) == expected, "mp4decrypt produced wrong samples"
+
+        # per segment, init parsed once
+        start = time.perf_counter()
+        decryptor = CencDecryptor(KEY, init)
+        for segment, clear_data in zip(segments, clear):
+            assert mdat_payloads(decryptor.decrypt_segment(segment)) == clear_data
+        _report("python  (per segment)", time.perf_counter() - start, total)
+
+        if mp4decrypt:
+            # mp4decrypt needs the init stitched to every segment and a process per segment
+            start = time.perf_counter()
+            for i, segment in enumerate(segments):
+                stitched = os.path.join(tmp, f"seg{i}.mp4")
+                with open(stitched, "wb") as f:
+                    f.write(init)
+                    f.write(segment)
+                _mp4decrypt(mp4decrypt, stitched, stitched + ".dec")
+            _report("mp4decrypt (per segment)", time.perf_counter() - start, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CENC decryption benchmark")
+    parser.add_argument("--fragments", type=int, default=40)
+    parser.add_argument("--sample-size", type=int, default=8192)
+    parser.add_argument("--mp4decrypt", default=shutil.which("mp4decrypt"),
+                        help="Path to mp4decrypt (default: from PATH)")
+    args = parser.parse_args()
+
+    if not args.mp4decrypt:
+        print("mp4decrypt not found, benchmarking the python engine only")
+    for media in ("video", "audio"):
+        run(media, args.fragments, args.sample_size, args.mp4decrypt)
+
+
+if __name__ == "__main__":
+    main()
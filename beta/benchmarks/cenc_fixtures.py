@@ -0,0 +1,132 @@
+"""
+Synthetic CENC ('cenc', AES-128 CTR) fragmented MP4 fixtures for the decryption benchmarks.
+
+The encryption here is written independently of mainLogic/big4/Ravenclaw_decrypt/cenc.py so a
+round trip through the engine actually checks it.
+"""
+import os
+import struct
+from typing import List, Tuple
+
+from Crypto.Cipher import AES
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    return box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+
+def _sample_entry(media: str, kid: bytes) -> bytes:
+    sinf = box(b'sinf',
+               box(b'frma', b'avc1' if media == 'video' else b'mp4a') +
+               full_box(b'schm', 0, 0, b'cenc' + struct.pack('>I', 0x00010000)) +
+               box(b'schi', full_box(b'tenc', 0, 0, bytes([0, 0, 1, 8]) + kid)))
+    if media == 'video':
+        header = (bytes(6) + struct.pack('>H', 1) + bytes(16) + struct.pack('>HHII', 1280, 720, 0x00480000, 0x00480000) +
+                  bytes(4) + struct.pack('>H', 1) + bytes(32) + struct.pack('>Hh', 0x18, -1))
+        avcc = box(b'avcC', bytes([1, 0x4d, 0x40, 0x1f, 0xff, 0xe0, 0x00]))
+        return box(b'encv', header + avcc + sinf)
+    header = bytes(6) + struct.pack('>H', 1) + bytes(8) + struct.pack('>HHHHI', 2, 16, 0, 0, 48000 << 16)
+    return box(b'enca', header + sinf)
+
+
+def build_init(media: str, kid: bytes, track_id: int = 1) -> bytes:
+    matrix = struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+    mvhd = full_box(b'mvhd', 0, 0, struct.pack('>IIIIIH', 0, 0, 1000, 0, 0x00010000, 0x0100) + bytes(10) +
+                    matrix + bytes(24) + struct.pack('>I', track_id + 1))
+    tkhd = full_box(b'tkhd', 0, 7, struct.pack('>IIIII', 0, 0, track_id, 0, 0) + bytes(8) +
+                    struct.pack('>hhhH', 0, 0, 0x0100 if media == 'audio' else 0, 0) + matrix +
+                    struct.pack('>II', (1280 << 16) if media == 'video' else 0, (720 << 16) if media == 'video' else 0))
+    mdhd = full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, 90000, 0, 0x55c4, 0))
+    hdlr = full_box(b'hdlr', 0, 0, bytes(4) + (b'vide' if media == 'video' else b'soun') + bytes(12) + b'fixture\0')
+    media_header = (full_box(b'vmhd', 0, 1, bytes(8)) if media == 'video' else full_box(b'smhd', 0, 0, bytes(4)))
+    dinf = box(b'dinf', full_box(b'dref', 0, 0, struct.pack('>I', 1) + full_box(b'url ', 0, 1, b'')))
+    stbl = box(b'stbl',
+               full_box(b'stsd', 0, 0, struct.pack('>I', 1) + _sample_entry(media, kid)) +
+               full_box(b'stts', 0, 0, struct.pack('>I', 0)) +
+               full_box(b'stsc', 0, 0, struct.pack('>I', 0)) +
+               full_box(b'stsz', 0, 0, struct.pack('>II', 0, 0)) +
+               full_box(b'stco', 0, 0, struct.pack('>I', 0)))
+    trak = box(b'trak', tkhd + box(b'mdia', mdhd + hdlr + box(b'minf', media_header + dinf + stbl)))
+    mvex = box(b'mvex', full_box(b'trex', 0, 0, struct.pack('>IIIII', track_id, 1, 0, 0, 0)))
+    pssh = full_box(b'pssh', 0, 0, bytes(16) + struct.pack('>I', 4) + b'test')
+    ftyp = box(b'ftyp', b'iso6' + struct.pack('>I', 0) + b'iso6dash')
+    return ftyp + box(b'moov', mvhd + trak + mvex + pssh)
+
+
+def _encrypt_sample(key: bytes, iv: bytes, sample: bytes, subsamples: List[Tuple[int, int]]) -> bytes:
+    cipher = AES.new(key, AES.MODE_CTR, nonce=b'', initial_value=iv + bytes(8))
+    if not subsamples:
+        return cipher.encrypt(sample)
+    out, pos = bytearray(), 0
+    for clear, protected in subsamples:
+        out += sample[pos:pos + clear]
+        out += cipher.encrypt(sample[pos + clear:pos + clear + protected])
+        pos += clear + protected
+    return bytes(out)
+
+
+def build_segment(key: bytes, sequence: int, samples: List[bytes], media: str, track_id: int = 1) -> bytes:
+    ivs = [os.urandom(8) for _ in samples]
+    # Video keeps a short clear NAL header per subsample, audio is encrypted whole
+    subsample_maps = []
+    for sample in samples:
+        if media == 'video':
+            half = len(sample) // 2
+            subsample_maps.append([(5, half - 5), (5, len(sample) - half - 5)])
+        else:
+            subsample_maps.append([])
+    encrypted = b''.join(_encrypt_sample(key, iv, s, m) for iv, s, m in zip(ivs, samples, subsample_maps))
+
+    senc_entries = b''
+    aux_sizes = []
+    for iv, subsamples in zip(ivs, subsample_maps):
+        entry = iv
+        if subsamples:
+            entry += struct.pack('>H', len(subsamples)) + b''.join(struct.pack('>HI', c, p) for c, p in subsamples)
+        senc_entries += entry
+        aux_sizes.append(len(entry))
+
+    def moof(data_offset: int, aux_offset: int) -> bytes:
+        trun = full_box(b'trun', 0, 0x000201, struct.pack('>Ii', len(samples), data_offset) +
+                        b''.join(struct.pack('>I', len(s)) for s in samples))
+        saiz = full_box(b'saiz', 0, 0, struct.pack('>BI', 0, len(samples)) + bytes(aux_sizes))
+        saio = full_box(b'saio', 0, 0, struct.pack('>II', 1, aux_offset))
+        senc = full_box(b'senc', 0, 0x2 if media == 'video' else 0, struct.pack('>I', len(samples)) + senc_entries)
+        traf = box(b'traf',
+                   full_box(b'tfhd', 0, 0x020000, struct.pack('>I', track_id)) +
+                   full_box(b'tfdt', 1, 0, struct.pack('>Q', sequence * 90000)) +
+                   trun + saiz + saio + senc)
+        return box(b'moof', full_box(b'mfhd', 0, 0, struct.pack('>I', sequence)) + traf)
+
+    draft = moof(0, 0)
+    aux_offset = len(draft) - len(senc_entries)
+    final = moof(len(draft) + 8, aux_offset)
+    return box(b'styp', b'msdh' + struct.pack('>I', 0) + b'msdhmsix') + final + box(b'mdat', encrypted)
+
+
+def build_fixture(key_hex: str, kid_hex: str, media: str = 'video', fragments: int = 20,
+                  samples_per_fragment: int = 48, sample_size: int = 8192) -> Tuple[bytes, List[bytes], List[bytes]]:
+    """Returns (init, encrypted segments, clear sample data of each segment)."""
+    key = bytes.fromhex(key_hex)
+    init = build_init(media, bytes.fromhex(kid_hex))
+    segments, clear = [], []
+    for sequence in range(1, fragments + 1):
+        samples = [os.urandom(sample_size + (i * 37) % 512) for i in range(samples_per_fragment)]
+        segments.append(build_segment(key, sequence, samples, media))
+        clear.append(b''.join(samples))
+    return init, segments, clear
+
+
+def mdat_payloads(data: bytes) -> bytes:
+    """Concatenated payload of every top-level mdat, used to compare decrypter outputs."""
+    out, pos = bytearray(), 0
+    while pos + 8 <= len(data):
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        if box_type == b'mdat':
+            out += data[pos + 8:pos + size]
+        pos += size
+    return bytes(out)
@@ -0,0 +1,80 @@
+"""
+Benchmarks ClientManager.get_task, the lookup behind /get-file and /progress, on a large history.
+
+    python -m beta.benchmarks.client_index_benchmark [--tasks 100000] [--clients 100] [--sessions 10] [--lookups 2000]
+
+Compares the task_id index with the nested scan over clients, sessions and tasks it replaced, on
+the same data, and checks that both find the same tasks.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from beta.api.mr_manager.client_manager import ClientManager
+
+
+def scan(clients, task_id):
+    """The lookup before the index"""
+    for client_id in clients:
+        for session_id in clients[client_id]['sessions']:
+            if task_id in clients[client_id]['sessions'][session_id]['tasks']:
+                return clients[client_id]['sessions'][session_id]['tasks'][task_id]
+    return None
+
+
+def build_clients(tasks, clients, sessions):
+    data = {}
+    per_session = max(1, tasks // (clients * sessions))
+    n = 0
+    for c in range(clients):
+        client_id = f"client-{c}"
+        data[client_id] = {"name": client_id, "client_id": client_id, "sessions": {}}
+        for s in range(sessions):
+            session_id = f"session-{c}-{s}"
+            session = data[client_id]["sessions"][session_id] = {"tasks": {}, "name": "", "timestamp": ""}
+            for _ in range(per_session):
+                task_id = f"task-{n}"
+                session["tasks"][task_id] = {"task_id": task_id, "client_id": client_id, "session_id": session_id,
+                                             "status": "completed", "name": task_id, "progress": {"progress": 100}}
+                n += 1
+    return data, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClientManager task lookup benchmark")
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    data, total = build_clients(args.tasks, args.clients, args.sessions)
+    with tempfile.TemporaryDirectory(prefix="pwdl-clients-") as tmp:
+        json_path = os.path.join(tmp, "clients.json")
+        with open(json_path, "w") as f:
+            json.dump(data, f)
+
+        start = time.perf_counter()
+        manager = ClientManager(json_path)
+        print(f"{total} tasks, loaded and indexed in {time.perf_counter() - start:.2f}s")
+
+        ids = [f"task-{random.randrange(total)}" for _ in range(args.lookups)] + ["missing"] * 10
+
+        start = time.perf_counter()
+        scanned = [scan(manager.clients, task_id) for task_id in ids]
+        scan_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = [manager.get_task(task_id) for task_id in ids]
+        index_time = time.perf_counter() - start
+
+        assert scanned == indexed, "index and scan disagree"
+        print(f"  scan   {scan_time / len(ids) * 1e6:10.1f} us/lookup")
+        print(f"  index  {index_time / len(ids) * 1e6:10.1f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
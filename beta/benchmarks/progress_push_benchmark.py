@@ -0,0 +1,215 @@
+"""
+Server CPU spent on watching task progress: clients polling /api/progress/<task_id> versus one
+Server-Sent Events stream per session (/api/client/<client_id>/<session_id>/progress/stream).
+
+    python -m beta.benchmarks.progress_push_benchmark [--tasks 100] [--per-session 10] [--hz 4]
+        [--poll-interval 1] [--seconds 10] [--port 5077]
+
+Starts the progress routes of the web UI in a separate process, with `--tasks` running tasks
+whose progress is reported `--hz` times a second through TaskManager._update_progress, as
+DownloaderV3 does. The server's CPU time is measured with no one watching, while every task is
+polled each `--poll-interval` seconds, and while every session is watched over one stream; the
+idle CPU is subtracted from the other two.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def task_ids(tasks, per_session):
+    """[(client_id, session_id, task_id)], the same in the server and the clients"""
+    return [("bench-client", f"session-{n // per_session}", f"task-{n}") for n in range(tasks)]
+
+
+def progress_report(n, total=600):
+    """A report like ProgressAggregator's, for segment `n` of both streams"""
+    stream = lambda media_type: {"type": media_type, "total": total, "current": n, "percentage": n / total * 100,
+                                 "segment_num": n, "success": True, "failed": 0, "new_failed_segments": [],
+                                 "timestamp": "2024-01-01 00:00:00"}
+    return {"audio": stream("audio"), "video": stream("video")}
+
+
+def serve(args):
+    sys.path.insert(0, REPO_ROOT)
+    # ClientManager keeps clients.json / clients.db in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="pwdl-progress-"))
+
+    import logging
+    from flask import Flask, jsonify
+    from werkzeug.serving import make_server
+    from beta.api.blueprints.while_dl_and_post_dl import dl_and_post_dl, task_manager
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log
+    app = Flask(__name__)
+    app.register_blueprint(dl_and_post_dl)
+
+    @app.route('/bench/cpu')
+    def cpu():
+        return jsonify(cpu=time.process_time())
+
+    ids = task_ids(args.tasks, args.per_session)
+    for client_id, session_id, task_id in ids:
+        task_manager.client_manager.add_client(client_id, client_id)
+        task_manager.client_manager.add_session(client_id, session_id)
+        task_info = {'task_id': task_id, 'progress': {'progress': 0}, 'status': 'running', 'name': task_id,
+                     'out_dir': '', 'id': task_id, 'batch_name': None, 'topic_name': None, 'lecture_url': None,
+                     'client_id': client_id, 'session_id': session_id}
+        with task_manager.lock:
+            task_manager.tasks[task_id] = task_info
+            task_manager.client_manager.add_task(client_id, session_id, task_id, task_info)
+
+    def report():
+        n = 0
+        while True:
+            n += 1
+            start = time.monotonic()
+            for _, _, task_id in ids:
+                task_manager._update_progress(task_id, progress_report(n))
+            time.sleep(max(0.0, 1.0 / args.hz - (time.monotonic() - start)))
+
+    threading.Thread(target=report, daemon=True).start()
+    make_server('127.0.0.1', args.port, app, threaded=True).serve_forever()
+
+
+def server_cpu(base):
+    return requests.get(f"{base}/bench/cpu", timeout=10).json()["cpu"]
+
+
+def measure(base, seconds, watch=None, counters=None):
+    """
+    Server CPU seconds over `seconds`, while `watch(stop)` runs on its own thread, and how much
+    each of `counters` grew meanwhile.
+    """
+    stop = threading.Event()
+    thread = threading.Thread(target=watch, args=(stop,)) if watch else None
+    if thread:
+        thread.start()
+        time.sleep(1)  # connections opened
+    counters = counters if counters is not None else {}
+    before = dict(counters)
+    start = server_cpu(base)
+    time.sleep(seconds)
+    cpu = server_cpu(base) - start
+    grown = {key: counters[key] - before[key] for key in counters}
+    stop.set()
+    if thread:
+        thread.join()
+    return cpu, grown
+
+
+def poll(base, ids, interval, counters):
+    def run(stop):
+        lock = threading.Lock()
+
+        def worker(chunk):
+            session = requests.Session()
+            while not stop.is_set():
+                start = time.monotonic()
+                for _, _, task_id in chunk:
+                    r = session.get(f"{base}/api/progress/{task_id}", timeout=10)
+                    with lock:
+                        counters["requests"] += 1
+                        counters["bytes"] += len(r.content)
+                stop.wait(max(0.0, interval - (time.monotonic() - start)))
+
+        chunks = [ids[i::8] for i in range(8)]
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks if chunk]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return run
+
+
+def push(base, ids, counters):
+    def run(stop):
+        lock = threading.Lock()
+        sessions = sorted({(client_id, session_id) for client_id, session_id, _ in ids})
+        responses = []
+
+        def reader(client_id, session_id):
+            r = requests.get(f"{base}/api/client/{client_id}/{session_id}/progress/stream", stream=True, timeout=30)
+            with lock:
+                responses.append(r)
+            try:
+                for line in r.iter_lines():
+                    if line.startswith(b"data:"):
+                        with lock:
+                            counters["events"] += 1
+                            counters["bytes"] += len(line)
+                    if stop.is_set():
+                        break
+            except Exception:
+                pass  # closed below
+
+        threads = [threading.Thread(target=reader, args=s, daemon=True) for s in sessions]
+        for t in threads:
+            t.start()
+        stop.wait()
+        with lock:
+            for r in responses:
+                r.close()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task progress: polling versus push")
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--per-session", type=int, default=10)
+    parser.add_argument("--hz", type=float, default=4.0, help="Progress reports per task per second")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args)
+
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "beta.benchmarks.progress_push_benchmark", "--serve",
+                               "--tasks", str(args.tasks), "--per-session", str(args.per_session),
+                               "--hz", str(args.hz), "--port", str(args.port)],
+                              cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                server_cpu(base)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise SystemExit("The benchmark server did not start")
+                time.sleep(0.2)
+
+        ids = task_ids(args.tasks, args.per_session)
+        per_100 = 100 / args.tasks
+        idle, _ = measure(base, args.seconds)
+        counters = {"requests": 0, "bytes": 0}
+        polling, polled = measure(base, args.seconds, poll(base, ids, args.poll_interval, counters), counters)
+        counters = {"events": 0, "bytes": 0}
+        pushing, pushed = measure(base, args.seconds, push(base, ids, counters), counters)
+        polling, pushing = polling - idle, pushing - idle
+
+        print(f"{args.tasks} tasks in sessions of {args.per_session}, progress at {args.hz:g} Hz, "
+              f"{args.seconds:g}s per run")
+        print(f"  idle      {idle / args.seconds * 1000:8.1f} ms CPU/s (progress reports alone)")
+        print(f"  polling   {polling / args.seconds * 1000 * per_100:8.1f} ms CPU/s per 100 watched tasks, "
+              f"{polled['requests'] / args.seconds:.0f} requests/s, {polled['bytes'] / args.seconds / 1024:.0f} KiB/s")
+        print(f"  push      {pushing / args.seconds * 1000 * per_100:8.1f} ms CPU/s per 100 watched tasks, "
+              f"{pushed['events'] / args.seconds:.0f} events/s, {pushed['bytes'] / args.seconds / 1024:.0f} KiB/s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmarks the per-segment decrypt step of the webui proxy, before and after the init cache.
+
+    python -m beta.benchmarks.proxy_segment_benchmark [--fragments 40] [--sample-size 65536] [--mp4decrypt PATH]
+
+"stitched" is the old pipeline: init and segment are written into one temp file, the whole file
+is decrypted, and the tail past the decrypted init is copied into the output. "segment only" is
+the current one: the segment is decrypted alone, against an init parsed once (the python engine)
+or passed with --fragments-info (mp4decrypt). Times are per media segment; the decrypted sample
+data is checked against the clear fixture. mp4decrypt is skipped when it is not on PATH.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from beta.benchmarks.cenc_fixtures import build_fixture, mdat_payloads
+from mainLogic.big4.Ravenclaw_decrypt.cenc import CencDecryptor, decrypt_file
+
+KEY = "9c3f1a2b4d5e6f708192a3b4c5d6e7f8"
+KID = "1d2c3b4a5968778695a4b3c2d1e0f0e1"
+
+
+def _report(label, seconds, count):
+    print(f"  {label:<34} {seconds * 1000 / count:8.2f} ms/segment")
+
+
+def _mp4decrypt(binary, src, dst, fragments_info=None):
+    cmd = [binary, "--key", f"{KID}:{KEY}"]
+    if fragments_info:
+        cmd += ["--fragments-info", fragments_info]
+    subprocess.run(cmd + [src, dst], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _stitched(tmp, init_path, seg_path, out_path, decrypt, dec_init_size):
+    stitch_enc = os.path.join(tmp, "st.enc")
+    stitch_dec = os.path.join(tmp, "st.dec")
+    with open(stitch_enc, "wb") as out:
+        with open(init_path, "rb") as f:
+            shutil.copyfileobj(f, out)
+        with open(seg_path, "rb") as f:
+            shutil.copyfileobj(f, out)
+    decrypt(stitch_enc, stitch_dec)
+    with open(stitch_dec, "rb") as fin:
+        fin.seek(dec_init_size)
+        with open(out_path, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+    os.remove(stitch_enc)
+    os.remove(stitch_dec)
+
+
+def run(media, fragments, sample_size, mp4decrypt):
+    init, segments, clear = build_fixture(KEY, KID, media, fragments=fragments, sample_size=sample_size)
+    print(f"\n{media}: {fragments} segments of {len(segments[0]) / 1024:.0f} KB")
+
+    with tempfile.TemporaryDirectory(prefix="pwdl-proxy-") as tmp:
+        init_path = os.path.join(tmp, "init.mp4")
+        with open(init_path, "wb") as f:
+            f.write(init)
+        seg_paths = []
+        for i, segment in enumerate(segments):
+            seg_paths.append(os.path.join(tmp, f"{i}.mp4"))
+            with open(seg_paths[-1], "wb") as f:
+                f.write(segment)
+        out_path = os.path.join(tmp, "out.mp4")
+
+        def check(i):
+            with open(out_path, "rb") as f:
+                assert mdat_payloads(f.read()) == clear[i], f"segment {i} decrypted wrong"
+
+        engines = [("python", lambda src, dst: decrypt_file(src, dst, KEY))]
+        if mp4decrypt:
+            engines.append(("mp4decrypt", lambda src, dst: _mp4decrypt(mp4decrypt, src, dst)))
+
+        for name, decrypt in engines:
+            dec_init_path = os.path.join(tmp, f"init.{name}.dec")
+            decrypt(init_path, dec_init_path)
+            dec_init_size = os.path.getsize(dec_init_path)
+
+            start = time.perf_counter()
+            for i, seg_path in enumerate(seg_paths):
+                _stitched(tmp, init_path, seg_path, out_path, decrypt, dec_init_size)
+                check(i)
+            _report(f"{name} (stitched)", time.perf_counter() - start, len(seg_paths))
+
+            start = time.perf_counter()
+            if name == "python":
+                decryptor = CencDecryptor(KEY, init)
+            for i, seg_path in enumerate(seg_paths):
+                if name == "python":
+                    with open(seg_path, "rb") as f:
+                        data = decryptor.decrypt_segment(f.read())
+                    with open(out_path, "wb") as f:
+                        f.write(data)
+                else:
+                    _mp4decrypt(mp4decrypt, seg_path, out_path, fragments_info=init_path)
+                check(i)
+            _report(f"{name} (segment only)", time.perf_counter() - start, len(seg_paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy segment decrypt benchmark")
+    parser.add_argument("--fragments", type=int, default=40)
+    parser.add_argument("--sample-size", type=int, default=65536)
+    parser.add_argument("--mp4decrypt", default=shutil.which("mp4decrypt"),
+                        help="Path to mp4decrypt (default: from PATH)")
+    args = parser.parse_args()
+
+    if not args.mp4decrypt:
+        print("mp4decrypt not found, benchmarking the python engine only")
+    for media in ("video", "audio"):
+        run(media, args.fragments, args.sample_size, args.mp4decrypt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Load test of the decrypting proxy: several viewers playing lectures at once, the way hls.js does.
+
+    python -m beta.benchmarks.webui_load_test --base http://127.0.0.1:5000 --batch <batch_name> \
+        --lectures <id>,<id>,... [--viewers-per-lecture 1] [--segments 30] [--buffer 30] [--speed 1]
+
+Start the server first, e.g. `python pwdl.py --webui 5000 --serve-mode threads` (or `dev` to
+compare). Every viewer loads master.m3u8, picks the first video rendition and its audio rendition,
+and fetches init and media segments of both in parallel. Like a player it fetches ahead while its
+buffer holds less than --buffer seconds and otherwise waits for playback (at --speed) to catch up.
+A stall is counted whenever playback reaches the end of the buffer.
+"""
+import argparse
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+import requests
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def parse_media_playlist(text):
+    """(init URI, [(duration, segment URI)]) of a media playlist"""
+    init = re.search(r'#EXT-X-MAP:URI="([^"]+)"', text)
+    segments, duration = [], None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[8:].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return (init.group(1) if init else None), segments
+
+
+def parse_master_playlist(text):
+    """(first video playlist URI, audio playlist URI or None) of a master playlist"""
+    audio = re.search(r'#EXT-X-MEDIA:TYPE=AUDIO[^\n]*URI="([^"]+)"', text)
+    lines = text.splitlines()
+    video = next((lines[i + 1].strip() for i, line in enumerate(lines)
+                  if line.startswith('#EXT-X-STREAM-INF') and i + 1 < len(lines)), None)
+    return video, (audio.group(1) if audio else None)
+
+
+class Viewer:
+    def __init__(self, base, batch, lecture, segments, buffer, speed):
+        self.base = base
+        self.master_url = urljoin(base, f"/api/lecture/{batch}/{lecture}/master.m3u8")
+        self.lecture = lecture
+        self.max_segments = segments
+        self.buffer = buffer
+        self.speed = speed
+        self.session = requests.Session()
+        self.latencies = []
+        self.bytes = 0
+        self.errors = 0
+        self.stalls = 0
+        self.startup = None
+        self.lock = threading.Lock()
+
+    def _get(self, url):
+        start = time.perf_counter()
+        r = self.session.get(urljoin(self.base, url), timeout=120)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.bytes += len(r.content)
+            if r.status_code != 200:
+                self.errors += 1
+        return r
+
+    def _play(self, playlist_url, started):
+        init, segments = parse_media_playlist(self._get(playlist_url).text)
+        if init:
+            self._get(init)
+        buffered = 0.0
+        playback_start = None
+        for duration, url in segments[:self.max_segments]:
+            if playback_start is not None:
+                position = (time.perf_counter() - playback_start) * self.speed
+                if position > buffered:
+                    # Played past what was fetched: the player stalled, and resumes from here
+                    with self.lock:
+                        self.stalls += 1
+                    playback_start = time.perf_counter() - buffered / self.speed
+                elif buffered - position > self.buffer:
+                    time.sleep((buffered - position - self.buffer) / self.speed)
+            self._get(url)
+            buffered += duration
+            if playback_start is None:
+                playback_start = time.perf_counter()
+                with self.lock:
+                    self.startup = max(self.startup or 0.0, playback_start - started)
+
+    def run(self):
+        started = time.perf_counter()
+        video, audio = parse_master_playlist(self._get(self.master_url).text)
+        tracks = [t for t in (video, audio) if t]
+        threads = [threading.Thread(target=self._play, args=(t, started)) for t in tracks]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent playback load test of the decrypting proxy")
+    parser.add_argument("--base", default="http://127.0.0.1:5000")
+    parser.add_argument("--batch", required=True)
+    parser.add_argument("--lectures", required=True, help="Comma-separated lecture ids")
+    parser.add_argument("--viewers-per-lecture", type=int, default=1)
+    parser.add_argument("--segments", type=int, default=30, help="Segments played per rendition")
+    parser.add_argument("--buffer", type=float, default=30.0, help="Seconds a viewer buffers ahead")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed; >1 plays faster")
+    args = parser.parse_args()
+
+    viewers = [Viewer(args.base, args.batch, lecture.strip(), args.segments, args.buffer, args.speed)
+               for lecture in args.lectures.split(',') if lecture.strip()
+               for _ in range(args.viewers_per_lecture)]
+    print(f"{len(viewers)} viewers on {args.base}")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=v.run) for v in viewers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies = [x for v in viewers for x in v.latencies]
+    total_bytes = sum(v.bytes for v in viewers)
+    print(f"  requests      {len(latencies)} in {wall:.1f}s, {sum(v.errors for v in viewers)} errors")
+    print(f"  latency       p50 {_percentile(latencies, 50) * 1000:.0f} ms, p95 {_percentile(latencies, 95) * 1000:.0f} ms, "
+          f"max {max(latencies, default=0) * 1000:.0f} ms")
+    print(f"  startup       max {max((v.startup or 0) for v in viewers):.2f}s")
+    print(f"  stalls        {sum(v.stalls for v in viewers)}")
+    print(f"  throughput    {total_bytes / (1024 * 1024) / max(wall, 1e-9):.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from mainLogic.big4.Gryffindor_downloadv3 import DownloaderV3, DownloadResult, ConcurrencyController
+from mainLogic.error import debugger
+
+
+class StreamGate:
+    """
+    Admits a stream's requests while fewer than `limit()` are in flight. The limit is re-read
+    every time a request finishes, so AIMD decisions take effect immediately.
+    """
+
+    def __init__(self, limit: Callable[[], int]):
+        self.limit = limit
+        self.in_flight = 0
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.limit())
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.cond:
+            self.in_flight -= 1
+            # Only as many waiters as there is room for
+            self.cond.notify(max(1, self.limit() - self.in_flight))
+
+
+class AsyncSegmentEngine:
+    """
+    Alternative segment engine for DownloaderV3 that fetches the audio and video streams on a
+    single asyncio event loop with aiohttp, instead of two threads each driving its own pool.
+
+    An in-flight request costs a coroutine rather than a thread, so the per-stream ceiling
+    (`DownloaderV3.max_in_flight`) can be in the hundreds. Everything else is shared with the
+    threaded engine: the segment manifest, the AIMD controllers, the progress trackers (and
+    therefore the TUI and the web task progress) and the `DownloadResult` contract.
+    """
+
+    def __init__(self, downloader: DownloaderV3, retry_count: int = 3):
+        self.downloader = downloader
+        self.retry_count = retry_count
+
+    def run(self, urls: Dict,
+            on_complete: Optional[Callable[[str, DownloadResult], None]] = None) -> Dict[str, DownloadResult]:
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            debugger.error("The asyncio downloader engine needs aiohttp (pip install aiohttp)")
+            raise
+        return asyncio.run(self._run(urls, on_complete))
+
+    def _make_trace_config(self):
+        import aiohttp
+
+        stats = self.downloader.async_pool_stats
+
+        async def on_request_start(session, ctx, params):
+            stats["requests"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            stats["handshakes"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+
+    async def _run(self, urls: Dict,
+                   on_complete: Optional[Callable[[str, DownloadResult], None]]) -> Dict[str, DownloadResult]:
+        import aiohttp
+
+        d = self.downloader
+        # Created on the loop that uses it; see _acquire_budget
+        self._budget_turn = asyncio.Lock()
+        connector = aiohttp.TCPConnector(limit=d.max_in_flight * 2, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         trace_configs=[self._make_trace_config()]) as session:
+            audio, video = await asyncio.gather(
+                self._download_and_notify(session, urls, "audio", d.audio_dir, on_complete),
+                self._download_and_notify(session, urls, "video", d.video_dir, on_complete),
+            )
+        return {"audio": audio, "video": video}
+
+    async def _download_and_notify(self, session, urls: Dict, media_type: str, output_dir: Path,
+                                   on_complete: Optional[Callable[[str, DownloadResult], None]]) -> DownloadResult:
+        result = await self._download_media(session, urls.get(media_type), media_type, output_dir)
+        if on_complete:
+            on_complete(media_type, result)
+        return result
+
+    def _controller_for(self, media_type: str) -> Optional[ConcurrencyController]:
+        d = self.downloader
+        if not d.adaptive_concurrency:
+            return None
+        controller = ConcurrencyController(media_type, d.initial_workers, d.min_workers, d.max_in_flight, d.verbose)
+        with d._controllers_lock:
+            d.controllers[media_type] = controller
+        return controller
+
+    async def _download_media(self, session, media_data: Optional[Dict], media_type: str,
+                              output_dir: Path) -> DownloadResult:
+        d = self.downloader
+        if not media_data or "segments" not in media_data:
+            d.debugger.warning(f"No {media_type} data provided")
+            return DownloadResult(None, output_dir, 0, 0, [])
+
+        total_segments = len(media_data["segments"])
+        progress_tracker = d._make_progress_tracker(total_segments, media_type)
+        controller = self._controller_for(media_type)
+
+        init_file_path = None
+        if "init" in media_data:
+            init_filename = d._get_file_name_from_url(media_data["init"], 0, media_type)
+            init_file_path = output_dir / init_filename
+            if not await self._fetch_segment(session, media_data["init"], init_file_path, media_type, "init",
+                                             None, None):
+                d.debugger.error(f"Failed to download {media_type} init segment")
+                return DownloadResult(None, output_dir, total_segments, 0, list(range(1, total_segments + 1)))
+
+        # Each request attempt waits here until the stream's controller admits it
+        gate = StreamGate(lambda: controller.limit if controller else d.max_in_flight)
+
+        async def process(segment_num: int, segment_url: str) -> bool:
+            segment_path = output_dir / d._get_file_name_from_url(segment_url, segment_num, media_type)
+            success = await self._fetch_segment(session, segment_url, segment_path, media_type,
+                                                str(segment_num), controller, gate)
+            d._report_progress(progress_tracker, segment_num, success)
+            return success
+
+        outcomes = await asyncio.gather(*(
+            process(int(segment_num), segment_url)
+            for segment_num, segment_url in media_data["segments"].items()
+        ))
+
+        progress_tracker.close()
+        if d.manifest:
+            d.manifest.save()
+        if d._refetch_pass(media_type):
+            return await self._download_media(session, media_data, media_type, output_dir)
+
+        return DownloadResult(
+            init_file_path,
+            output_dir,
+            total_segments,
+            sum(1 for ok in outcomes if ok),
+            progress_tracker.failed_segments,
+            peak_buffer_bytes=d._peak_buffered_bytes,
+            decrypted=d.is_decrypted(media_type)
+        )
+
+    async def _fetch_segment(self, session, url: str, output_path: Path, media_type: str, key: str,
+                             controller: Optional[ConcurrencyController], gate: Optional[StreamGate]) -> bool:
+        d = self.downloader
+        if d.cancelled():
+            return False
+        transform = d._decrypt_stage(media_type, key)
+        refetch = d.decrypt_key and key == "init"
+        if d.manifest and not refetch and d.manifest.is_complete(
+                media_type, key, url, output_path, clear=d.is_decrypted(media_type)):
+            return True
+        success = await self._download_segment(session, url, output_path, controller, gate, transform)
+        if d.manifest:
+            d.manifest.mark(media_type, key, url, output_path, success, clear=bool(transform and transform.clear))
+        return success
+
+    @asynccontextmanager
+    async def _request_slot(self, gate: Optional[StreamGate]):
+        """A slot of the stream's gate (if any) and of the shared connection budget."""
+        budget = self.downloader.connection_budget
+        if gate:
+            await gate.acquire()
+        try:
+            await self._acquire_budget()
+            try:
+                yield
+            finally:
+                if budget:
+                    budget.release()
+        finally:
+            if gate:
+                await gate.release()
+
+    async def _acquire_budget(self):
+        budget = self.downloader.connection_budget
+        if budget is None or budget.acquire(blocking=False):
+            return
+        # The shared budget is a threading semaphore (other lectures may use the threaded
+        # engine), so there is nothing to await. One coroutine at a time polls it, backing
+        # off while it stays taken; the others queue on the lock instead of waking up to poll.
+        async with self._budget_turn:
+            delay = 0.005
+            while not budget.acquire(blocking=False):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    @staticmethod
+    async def _off_loop(fn: Callable, *args):
+        """Runs blocking file work (or the CPU-bound decrypt) on the default executor."""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @staticmethod
+    def _discard(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    async def _buffer_and_transform(self, response, f, transform: Callable[[bytes], bytes]) -> int:
+        d = self.downloader
+        buffer = bytearray()
+        try:
+            async for chunk in response.content.iter_chunked(d.chunk_size):
+                d._track_buffer(len(chunk))
+                buffer += chunk
+            await self._off_loop(lambda: f.write(transform(buffer)))
+        finally:
+            d._track_buffer(-len(buffer))
+        return len(buffer)
+
+    async def _write_chunks(self, response, f) -> int:
+        d = self.downloader
+        written = 0
+        async for chunk in response.content.iter_chunked(d.chunk_size):
+            d._track_buffer(len(chunk))
+            try:
+                await self._off_loop(f.write, chunk)
+            finally:
+                d._track_buffer(-len(chunk))
+            written += len(chunk)
+        return written
+
+    async def _download_segment(self, session, url: str, output_path: Path,
+                                controller: Optional[ConcurrencyController], gate: Optional[StreamGate],
+                                transform: Optional[Callable[[bytes], bytes]] = None) -> bool:
+        # As in the threaded engine, each attempt holds its gate and budget slots only while it
+        # talks to the server; they are released before the backoff.
+        d = self.downloader
+        part_path = output_path.with_name(output_path.name + ".part")
+        for attempt in range(self.retry_count):
+            status = None
+            started = time.monotonic()
+            try:
+                async with self._request_slot(gate):
+                    # The wait for a slot may have outlasted the download
+                    if d.cancelled():
+                        return False
+                    async with session.get(url, allow_redirects=True) as response:
+                        status = response.status
+                        response.raise_for_status()
+
+                        # Opening, writing and renaming the .part file can block on a slow or busy
+                        # disk, so none of it runs on the loop that drives every other request
+                        f = await self._off_loop(open, part_path, 'wb')
+                        try:
+                            if transform:
+                                written = await self._buffer_and_transform(response, f, transform)
+                            else:
+                                written = await self._write_chunks(response, f)
+                        finally:
+                            await self._off_loop(f.close)
+                await self._off_loop(os.replace, part_path, output_path)
+                if controller:
+                    controller.record(True, time.monotonic() - started, written)
+                return True
+            except Exception as e:
+                await self._off_loop(self._discard, part_path)
+                if controller:
+                    controller.record(False, status=status)
+                if status == 403:
+                    d.forbidden_responses += 1
+                if attempt == self.retry_count - 1:
+                    d.debugger.error(f"Failed to download {url}: {str(e)}")
+                    return False
+                d.debugger.warning(f"Retry {attempt + 1}/{self.retry_count} for {url}")
+                if status is None or status in ConcurrencyController.CONGESTION_STATUSES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        return False
@@ -1,11 +1,18 @@
 import os
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse, unquote
 from typing import Dict, Optional, Callable, List, Tuple, Any
 from pathlib import Path
 import concurrent.futures
-from threading import Lock
+import threading
+from threading import Lock, Condition, Semaphore
+from contextlib import contextmanager
 from mainLogic.error import debugger
+from mainLogic.big4.Ravenclaw_decrypt.cenc import CencDecryptor, CencError
+from mainLogic.utils.batch_scheduler import budget_slot
 from tqdm import tqdm
 from dataclasses import dataclass
 from datetime import datetime
@@ -18,14 +25,24 @@ class DownloadResult:
     successful_segments: int
     failed_segments: List[int]
     encoded_file: str = ""
+    peak_buffer_bytes: int = 0
+    decrypted: bool = False
 
 class ProgressTracker:
+    """
+    Segment counters of one media stream. `update` runs on the segment workers and only bumps
+    the counters (and the tqdm bar); the progress dicts are built by `ProgressAggregator` on
+    its own thread.
+    """
+
     def __init__(self, total_segments: int, media_type: str, show_tqdm: bool = True):
         self.total = total_segments
         self.current = 0
         self.media_type = media_type
         self.lock = Lock()
         self.failed_segments = []
+        self.last_segment = None
+        self.last_success = True
         if show_tqdm:
             self.pbar = tqdm(
                 total=total_segments,
@@ -35,52 +52,319 @@ class ProgressTracker:
         else:
             self.pbar = None
 
-    def update(self, segment_num: int, success: bool = True) -> Dict:
+    def update(self, segment_num: int, success: bool = True):
         with self.lock:
             self.current += 1
+            self.last_segment = segment_num
+            self.last_success = success
             if not success:
                 self.failed_segments.append(segment_num)
 
-            if self.pbar:
-                self.pbar.update(1)
-
-            return {
-                "type": self.media_type,
-                "total": self.total,
-                "current": self.current,
-                "percentage": (self.current / self.total) * 100,
-                "segment_num": segment_num,
-                "success": success,
-                "failed_segments": self.failed_segments.copy(),
-                "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-            }
+        if self.pbar:
+            self.pbar.update(1)
+
+    def sample(self, failed_seen: int) -> Tuple[Dict, int]:
+        """The stream's progress, with the segments that failed after the first `failed_seen`."""
+        with self.lock:
+            current = self.current
+            new_failed = self.failed_segments[failed_seen:]
+            last_segment, last_success = self.last_segment, self.last_success
+        return {
+            "type": self.media_type,
+            "total": self.total,
+            "current": current,
+            "percentage": (current / self.total) * 100 if self.total else 100.0,
+            "segment_num": last_segment,
+            "success": last_success,
+            "failed": failed_seen + len(new_failed),
+            "new_failed_segments": new_failed,
+        }, current
 
     def close(self):
         if self.pbar:
             self.pbar.close()
 
-class CombinedProgressTracker:
-    def __init__(self, callback: Optional[Callable[[Dict], None]] = None):
+class ProgressAggregator:
+    """
+    Reports the progress of the streams of one download to `callback` at most `rate_hz` times a
+    second, from its own thread, so that neither the segment workers nor the asyncio engine's
+    event loop ever wait on the callback (the web UI's takes TaskManager.lock and writes the task
+    through to the client store).
+
+    Every report is a delta: {"audio": {...}, "video": {...}} with only the streams that moved
+    since the previous report, each carrying its counters and the segments that failed since
+    then as `new_failed_segments` (see TaskManager._update_progress, which accumulates them into
+    `failed_segments`). A last report is made when the aggregator is stopped.
+    """
+
+    def __init__(self, callback: Callable[[Dict], None], rate_hz: float = 4.0,
+                 concurrency: Optional[Callable[[str], Optional[Dict]]] = None):
         self.callback = callback
+        self.interval = 1.0 / max(0.1, rate_hz)
+        self.concurrency = concurrency
         self.lock = Lock()
-        self.audio_data = {}
-        self.video_data = {}
+        self.trackers: Dict[str, ProgressTracker] = {}
+        self.reported: Dict[str, Tuple[int, int]] = {}  # media type -> (current, failed) last reported
+        self.reports = 0
+        self._stop = threading.Event()
+        self._thread = None
 
-    def update(self, progress_info: Dict):
+    def track(self, tracker: ProgressTracker):
         with self.lock:
-            media_type = progress_info["type"]
+            self.trackers[tracker.media_type] = tracker
+            self.reported.pop(tracker.media_type, None)
 
-            if media_type == "audio":
-                self.audio_data = progress_info
-            elif media_type == "video":
-                self.video_data = progress_info
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="progress-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._report()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._report()
+
+    def _report(self):
+        with self.lock:
+            trackers = list(self.trackers.items())
+            delta = {}
+            for media_type, tracker in trackers:
+                last_current, failed_seen = self.reported.get(media_type, (-1, 0))
+                if tracker.current == last_current:
+                    continue
+                info, current = tracker.sample(failed_seen)
+                if self.concurrency:
+                    concurrency = self.concurrency(media_type)
+                    if concurrency is not None:
+                        info["concurrency"] = concurrency
+                info["timestamp"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                self.reported[media_type] = (current, info["failed"])
+                delta[media_type] = info
+            if not delta:
+                return
+            self.reports += 1
+        try:
+            self.callback(delta)
+        except Exception as e:
+            debugger.error(f"Progress callback failed: {e}")
+
+class ConcurrencyController:
+    """
+    AIMD controller for the number of in-flight segment requests of one media stream.
+
+    Every `limit` completed requests form a window. If a 429/5xx or a connection error
+    was seen during the window the limit is halved (multiplicative decrease), otherwise
+    it grows by one (additive increase) as long as throughput has not dropped and the
+    mean latency has not inflated past twice the best window seen so far.
+    """
+
+    CONGESTION_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, media_type: str, initial: int, minimum: int, maximum: int, verbose: bool = False):
+        self.media_type = media_type
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = max(self.minimum, min(self.maximum, initial))
+        self.verbose = verbose
+        self.in_flight = 0
+        self.cond = Condition()
+
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+        self._window_congested = False
+        self._last_throughput = 0.0
+        self._best_latency = None
+        self._cooldown_until = 0.0
+        self.last_decision = {"limit": self.limit, "action": "start", "reason": "initial limit"}
+
+    @contextmanager
+    def slot(self):
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                self.cond.notify()
+
+    def record(self, success: bool, latency: float = 0.0, nbytes: int = 0, status: Optional[int] = None):
+        with self.cond:
+            if success:
+                self._window_count += 1
+                self._window_bytes += nbytes
+                self._window_latency += latency
+            elif status is None or status in self.CONGESTION_STATUSES:
+                self._window_congested = True
+
+            if self._window_congested and time.monotonic() >= self._cooldown_until:
+                # Requests already in flight when the limit was cut will report the same
+                # congestion; give them one round trip before cutting again.
+                self._cooldown_until = time.monotonic() + max(self._best_latency or 0.0, 0.5)
+                self._decide("decrease", max(self.minimum, self.limit // 2),
+                             f"congestion signal (status {status})" if status else "connection error")
+            elif self._window_count >= self.limit:
+                self._end_window()
+
+    def _end_window(self):
+        elapsed = max(time.monotonic() - self._window_start, 1e-6)
+        throughput = self._window_bytes / elapsed
+        latency = self._window_latency / self._window_count
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+
+        if self._window_congested:
+            self._decide("hold", self.limit, "congestion during cooldown", throughput, latency)
+        elif throughput < self._last_throughput * 0.9:
+            self._decide("hold", self.limit, "throughput dropped", throughput, latency)
+        elif latency > self._best_latency * 2:
+            self._decide("hold", self.limit, "latency inflated", throughput, latency)
+        else:
+            self._decide("increase", min(self.maximum, self.limit + 1), "window healthy", throughput, latency)
+        self._last_throughput = throughput
+
+    def _decide(self, action: str, new_limit: int, reason: str, throughput: float = 0.0, latency: float = 0.0):
+        old_limit = self.limit
+        self.limit = new_limit
+        self.last_decision = {
+            "limit": new_limit,
+            "action": action,
+            "reason": reason,
+            "throughput_kbps": round(throughput / 1024, 1),
+            "latency_ms": round(latency * 1000, 1),
+        }
+        if self.verbose and new_limit != old_limit:
+            debugger.debug(f"[{self.media_type}] concurrency {old_limit} -> {new_limit} ({reason})")
+
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+        self._window_congested = False
+        if new_limit > old_limit:
+            self.cond.notify(new_limit - old_limit)
+
+    def snapshot(self) -> Dict:
+        with self.cond:
+            return {**self.last_decision, "in_flight": self.in_flight}
+
+
+class SegmentManifest:
+    """
+    On-disk record of the segments of one lecture that are already downloaded, so an
+    interrupted download can be resumed instead of started over.
+
+    Entries are keyed by media type and segment number and remember the segment URL
+    (without the signature query, which changes on every run), its size in bytes and
+    whether it completed, and whether it was stored decrypted. The file is rewritten atomically and at most every
+    `flush_interval` seconds while segments are completing.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, lecture_id: str, flush_interval: float = 2.0):
+        self.path = Path(path)
+        self.lecture_id = lecture_id
+        self.flush_interval = flush_interval
+        self.lock = Lock()
+        self._dirty = False
+        self._last_flush = 0.0
+        self.media = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION and data.get("lecture_id") == self.lecture_id:
+                return data.get("media", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.netloc}{parsed.path}"
+
+    def is_complete(self, media_type: str, key: str, url: str, path: Path, clear: bool = False) -> bool:
+        with self.lock:
+            entry = self.media.get(media_type, {}).get(str(key))
+        if not entry or not entry.get("done") or entry.get("url") != self._url_key(url):
+            return False
+        # A segment kept encrypted by an earlier run is no use to a run that decrypts while
+        # downloading, and vice versa
+        if entry.get("clear", False) != clear:
+            return False
+        try:
+            return os.path.getsize(path) == entry.get("size")
+        except OSError:
+            return False
+
+    def mark(self, media_type: str, key: str, url: str, path: Path, done: bool, clear: bool = False):
+        try:
+            size = os.path.getsize(path) if done else 0
+        except OSError:
+            size, done = 0, False
+        with self.lock:
+            self.media.setdefault(media_type, {})[str(key)] = {
+                "url": self._url_key(url),
+                "size": size,
+                "done": done,
+                "clear": clear,
+            }
+            self._dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def save(self):
+        with self.lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": self.VERSION, "lecture_id": self.lecture_id, "media": self.media}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def completed_count(self, media_type: str) -> int:
+        with self.lock:
+            return sum(1 for key, entry in self.media.get(media_type, {}).items()
+                       if key != "init" and entry.get("done"))
+
+
+class DecryptStage:
+    """
+    The in-memory transform of one fetched segment. A segment it cannot decrypt is kept as it
+    came and `on_error` is told, rather than failing the request (and being retried as if the
+    network had failed); `clear` tells which of the two was written.
+    """
+
+    def __init__(self, decrypt: Callable[[bytes], bytes], on_error: Callable[[CencError], None]):
+        self.decrypt = decrypt
+        self.on_error = on_error
+        self.clear = False
+
+    def __call__(self, data: bytes) -> bytes:
+        try:
+            clear = self.decrypt(data)
+        except CencError as e:
+            self.clear = False
+            self.on_error(e)
+            return data
+        self.clear = True
+        return clear
 
-            if self.callback:
-                combined_data = {
-                    "audio": self.audio_data,
-                    "video": self.video_data
-                }
-                self.callback(combined_data)
 
 class DownloaderV3:
     def __init__(
@@ -90,16 +374,67 @@ class DownloaderV3:
             verbose: bool = False,
             progress_callback: Optional[Callable[[Dict], None]] = None,
             max_workers: int = 16,
+            initial_workers: Optional[int] = None,
+            min_workers: int = 2,
+            adaptive_concurrency: bool = True,
             audio_dir: Optional[str] = "audio",
             video_dir: Optional[str] = "video",
-            show_progress_bar: bool = True
+            show_progress_bar: bool = True,
+            chunk_size: int = 256 * 1024,
+            lecture_id: Optional[str] = None,
+            resume: bool = True,
+            engine: str = "threads",
+            max_in_flight: int = 128,
+            decrypt_key: Optional[str] = None,
+            connection_budget: Optional[Semaphore] = None,
+            progress_hz: float = 4.0,
+            cancel_event: Optional[threading.Event] = None
     ):
         self.tmp_dir = Path(tmp_dir)
         self.out_dir = Path(out_dir)
         self.verbose = verbose
         self.progress_callback = progress_callback
-        self.max_workers = max(4, min(16, max_workers))
+        # `progress_callback` is called from a ProgressAggregator at most `progress_hz` times a second
+        self.progress_hz = progress_hz
+        self.max_workers = max(4, min(32, max_workers))
+        # With adaptive concurrency `max_workers` is the ceiling of the per-stream AIMD
+        # controllers and the thread pools are sized to it; the controllers start at
+        # `initial_workers` in-flight requests.
+        self.adaptive_concurrency = adaptive_concurrency
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.initial_workers = initial_workers or max(self.min_workers, self.max_workers // 2)
+        self.controllers: Dict[str, ConcurrencyController] = {}
+        self._controllers_lock = Lock()
+
+        # "threads" runs one thread pool per media stream, "asyncio" fetches every segment on
+        # a single event loop (see Gryffindor_asyncio.AsyncSegmentEngine). `max_in_flight`
+        # is the per-stream ceiling for the asyncio engine.
+        if engine not in ("threads", "asyncio"):
+            raise ValueError(f"Unknown downloader engine: {engine}")
+        self.engine = engine
+        self.max_in_flight = max(self.max_workers, max_in_flight)
+        self.async_pool_stats = {"requests": 0, "handshakes": 0}
         self.show_progress_bar = show_progress_bar
+        # Upper bound on the bytes a single worker holds in memory at once
+        self.chunk_size = max(16 * 1024, chunk_size)
+
+        # Optional decrypt stage: with a CENC key every segment is held in memory once,
+        # decrypted and written to disk in the clear. A stream whose init segment the
+        # in-process engine can't handle is kept encrypted (see `is_decrypted`). A stream with a
+        # media segment it can't handle is fetched again encrypted (see `_disable_decrypt_stage`).
+        self.decrypt_key = decrypt_key
+        self._decryptors: Dict[str, CencDecryptor] = {}
+        self._decrypt_lock = Lock()
+        self._decrypt_disabled = set()
+        self._refetch_encrypted = set()
+
+        # Semaphore shared with other downloaders (see BatchScheduler); every segment request
+        # holds one unit on top of this downloader's own concurrency limit
+        self.connection_budget = connection_budget
+
+        # Once set, segments not fetched yet are given up (and reported as failed), so the
+        # download ends after the requests in flight; the manifest keeps what was fetched
+        self.cancel_event = cancel_event
 
         self.audio_dir = self.out_dir / audio_dir if audio_dir else self.out_dir
         self.video_dir = self.out_dir / video_dir if video_dir else self.out_dir
@@ -108,7 +443,66 @@ class DownloaderV3:
             directory.mkdir(parents=True, exist_ok=True)
 
         self.debugger = debugger
-        self.combined_tracker = None
+        self.progress_aggregator = None
+
+        # Resume support: segments already recorded as complete in the manifest (and still
+        # present on disk with the recorded size) are not fetched again.
+        self.manifest = None
+        if lecture_id and resume:
+            self.manifest = SegmentManifest(self.out_dir / f"{lecture_id}.manifest.json", lecture_id)
+
+        # One pooled session shared by the audio and video pipelines so that
+        # segments reuse keep-alive connections instead of paying a fresh
+        # TCP+TLS handshake each. urllib3 keeps a separate pool per host.
+        self.session = self._make_session()
+
+        self._buffer_lock = Lock()
+        self._buffered_bytes = 0
+        self._peak_buffered_bytes = 0
+
+        # 403s from the CDN usually mean the signed URL has expired; the caller uses this to
+        # drop a cached URL before the rerun (see KeyCache)
+        self.forbidden_responses = 0
+
+    def _make_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.max_workers * 2,
+            pool_block=False,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Connection reuse statistics aggregated over every per-host pool of the session.
+        `handshakes` is the number of connections opened, `requests` the number of
+        requests issued over them.
+        """
+        stats = {"hosts": 0, "requests": 0, "handshakes": 0, "reuse_ratio": 0.0}
+        seen = set()
+        for adapter in self.session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats["hosts"] += 1
+                stats["requests"] += pool.num_requests
+                stats["handshakes"] += pool.num_connections
+        stats["requests"] += self.async_pool_stats["requests"]
+        stats["handshakes"] += self.async_pool_stats["handshakes"]
+        if stats["requests"]:
+            stats["reuse_ratio"] = 1 - stats["handshakes"] / stats["requests"]
+        return stats
+
+    def close(self):
+        self.session.close()
 
     def _get_file_name_from_url(self, url: str, index: int = 0, media_type: str = "") -> str:
         parsed_url = urlparse(url)
@@ -118,36 +512,204 @@ class DownloaderV3:
             return f"{index:04d}-{media_type}-{base_name}"
         return base_name
 
-    def _download_segment(self, url: str, output_path: Path, retry_count: int = 3) -> bool:
+    def _track_buffer(self, delta: int):
+        with self._buffer_lock:
+            self._buffered_bytes += delta
+            if self._buffered_bytes > self._peak_buffered_bytes:
+                self._peak_buffered_bytes = self._buffered_bytes
+
+    def is_decrypted(self, media_type: str) -> bool:
+        return media_type in self._decryptors
+
+    def _decrypt_stage(self, media_type: str, key: str) -> Optional[DecryptStage]:
+        """The in-memory transform for one fetched segment, or None to stream it to disk as is."""
+        if not self.decrypt_key or media_type in self._decrypt_disabled:
+            return None
+        if key != "init":
+            decryptor = self._decryptors.get(media_type)
+            if not decryptor:
+                return None
+            return DecryptStage(decryptor.decrypt_segment, lambda e: self._disable_decrypt_stage(media_type, e))
+
+        def decrypt_init(data: bytes) -> bytes:
+            decryptor = CencDecryptor(self.decrypt_key)
+            clear = decryptor.decrypt_init(data)
+            self._decryptors[media_type] = decryptor
+            return clear
+
+        def keep_encrypted(e: CencError):
+            self.debugger.warning(f"Cannot decrypt {media_type} while downloading ({e}), keeping it encrypted")
+            self._decryptors.pop(media_type, None)
+
+        return DecryptStage(decrypt_init, keep_encrypted)
+
+    def _disable_decrypt_stage(self, media_type: str, error: CencError):
+        # Segments already written in the clear can't be concatenated with encrypted ones, so
+        # the stream is fetched again without the stage once this pass is over (`_refetch_pass`)
+        # and the whole track is decrypted after download instead
+        with self._decrypt_lock:
+            if media_type in self._decrypt_disabled:
+                return
+            self._decrypt_disabled.add(media_type)
+            self._refetch_encrypted.add(media_type)
+            self._decryptors.pop(media_type, None)
+        self.debugger.warning(f"Cannot decrypt a {media_type} segment while downloading ({error}), "
+                              f"the track will be decrypted after download")
+
+    def _refetch_pass(self, media_type: str) -> bool:
+        """True once if the decrypt stage of the stream was disabled during the pass that just ended."""
+        with self._decrypt_lock:
+            if media_type not in self._refetch_encrypted or self.cancelled():
+                return False
+            self._refetch_encrypted.discard(media_type)
+        self.debugger.warning(f"Fetching the {media_type} segments written in the clear again, encrypted")
+        return True
+
+    def _buffer_and_transform(self, chunks, f, transform: Callable[[bytes], bytes]) -> int:
+        # The decrypt stage needs the whole segment (moof comes before its mdat), so it is
+        # held in memory once and only the transformed bytes reach the disk
+        buffer = bytearray()
+        try:
+            for chunk in chunks:
+                self._track_buffer(len(chunk))
+                buffer += chunk
+            f.write(transform(buffer))
+        finally:
+            self._track_buffer(-len(buffer))
+        return len(buffer)
+
+    def _controller_for(self, media_type: str) -> Optional[ConcurrencyController]:
+        if not self.adaptive_concurrency:
+            return None
+        with self._controllers_lock:
+            if media_type not in self.controllers:
+                self.controllers[media_type] = ConcurrencyController(
+                    media_type, self.initial_workers, self.min_workers, self.max_workers, self.verbose
+                )
+            return self.controllers[media_type]
+
+    @contextmanager
+    def _request_slot(self, controller: Optional[ConcurrencyController]):
+        """A slot of the stream's controller (if any) and of the shared connection budget."""
+        if controller:
+            with controller.slot(), budget_slot(self.connection_budget):
+                yield
+        else:
+            with budget_slot(self.connection_budget):
+                yield
+
+    def _download_segment(self, url: str, output_path: Path, retry_count: int = 3,
+                          controller: Optional[ConcurrencyController] = None,
+                          transform: Optional[Callable[[bytes], bytes]] = None) -> bool:
+        # Segments are streamed to a sibling .part file in chunks of `chunk_size` and renamed
+        # into place once complete, so a worker never holds a whole segment in memory (unless
+        # a `transform` such as the decrypt stage needs it) and a half-written file is never
+        # mistaken for a finished segment.
+        # Each attempt holds its request slots only while it talks to the server; they are
+        # released before the backoff so a retrying segment doesn't hold back other streams.
+        part_path = output_path.with_name(output_path.name + ".part")
         for attempt in range(retry_count):
+            status = None
+            started = time.monotonic()
             try:
-                response = requests.get(url, allow_redirects=True)
-                response.raise_for_status()
-
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
+                with self._request_slot(controller):
+                    # The wait for a slot may have outlasted the download
+                    if self.cancelled():
+                        return False
+                    with self.session.get(url, allow_redirects=True, stream=True) as response:
+                        status = response.status_code
+                        response.raise_for_status()
+
+                        written = 0
+                        with open(part_path, 'wb') as f:
+                            chunks = response.iter_content(chunk_size=self.chunk_size)
+                            if transform:
+                                written = self._buffer_and_transform(chunks, f, transform)
+                            else:
+                                for chunk in chunks:
+                                    self._track_buffer(len(chunk))
+                                    try:
+                                        f.write(chunk)
+                                    finally:
+                                        self._track_buffer(-len(chunk))
+                                    written += len(chunk)
+                os.replace(part_path, output_path)
+                if controller:
+                    controller.record(True, time.monotonic() - started, written)
                 return True
             except Exception as e:
+                try:
+                    part_path.unlink()
+                except OSError:
+                    pass
+                if controller:
+                    controller.record(False, status=status)
+                if status == 403:
+                    self.forbidden_responses += 1
                 if attempt == retry_count - 1:
                     self.debugger.error(f"Failed to download {url}: {str(e)}")
                     return False
                 self.debugger.warning(f"Retry {attempt + 1}/{retry_count} for {url}")
+                if status is None or status in ConcurrencyController.CONGESTION_STATUSES:
+                    time.sleep(0.5 * 2 ** attempt)
         return False
 
-    def _process_segment(self, args: tuple) -> bool:
-        url, output_path, segment_num, progress_tracker = args
+    def cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _fetch_segment(self, url: str, output_path: Path, media_type: str, key: str) -> bool:
+        if self.cancelled():
+            return False
+        transform = self._decrypt_stage(media_type, key)
+        # The init segment is always fetched again when decrypting, its encryption info is
+        # gone from the clear copy on disk
+        refetch = self.decrypt_key and key == "init"
+        if self.manifest and not refetch and self.manifest.is_complete(
+                media_type, key, url, output_path, clear=self.is_decrypted(media_type)):
+            return True
+        success = self._download_segment(url, output_path, controller=self._controller_for(media_type),
+                                         transform=transform)
+        if self.manifest:
+            self.manifest.mark(media_type, key, url, output_path, success, clear=bool(transform and transform.clear))
+        return success
 
-        success = self._download_segment(url, output_path)
-        progress_info = progress_tracker.update(segment_num, success)
+    def _make_progress_tracker(self, total_segments: int, media_type: str):
+        tracker = ProgressTracker(total_segments, media_type, self.show_progress_bar)
+        if self.progress_aggregator:
+            self.progress_aggregator.track(tracker)
+        return tracker
+
+    def _concurrency_snapshot(self, media_type: str) -> Optional[Dict]:
+        controller = self.controllers.get(media_type)
+        return controller.snapshot() if controller else None
+
+    @contextmanager
+    def _progress_reporting(self):
+        """Runs a ProgressAggregator for `progress_callback`, unless one is already running."""
+        if not self.progress_callback or self.progress_aggregator:
+            yield
+            return
+        self.progress_aggregator = ProgressAggregator(self.progress_callback, self.progress_hz,
+                                                      self._concurrency_snapshot)
+        self.progress_aggregator.start()
+        try:
+            yield
+        finally:
+            # Reports the final state, then detaches so that it doesn't affect future downloads
+            self.progress_aggregator.stop()
+            self.progress_aggregator = None
 
-        # If we have a combined tracker, use it instead of direct callback
-        if self.combined_tracker:
-            self.combined_tracker.update(progress_info)
-        elif self.progress_callback:
-            self.progress_callback(progress_info)
+    def _process_segment(self, args: tuple) -> bool:
+        url, output_path, segment_num, progress_tracker = args
 
+        success = self._fetch_segment(url, output_path, progress_tracker.media_type, str(segment_num))
+        self._report_progress(progress_tracker, segment_num, success)
         return success
 
+    def _report_progress(self, progress_tracker, segment_num: int, success: bool):
+        # Counters only; the aggregator thread reports them (with the concurrency decision)
+        progress_tracker.update(segment_num, success)
+
     def _download_media(self, media_data: Dict, media_type: str, output_dir: Path) -> DownloadResult:
         if not media_data or "segments" not in media_data:
             self.debugger.warning(f"No {media_type} data provided")
@@ -156,17 +718,13 @@ class DownloaderV3:
         total_segments = len(media_data["segments"])
         init_file_path = None
 
-        progress_tracker = ProgressTracker(
-            total_segments,
-            media_type,
-            self.show_progress_bar
-        )
+        progress_tracker = self._make_progress_tracker(total_segments, media_type)
 
         # Download init segment first
         if "init" in media_data:
             init_filename = self._get_file_name_from_url(media_data["init"], 0, media_type)
             init_file_path = output_dir / init_filename
-            if not self._download_segment(media_data["init"], init_file_path):
+            if not self._fetch_segment(media_data["init"], init_file_path, media_type, "init"):
                 self.debugger.error(f"Failed to download {media_type} init segment")
                 return DownloadResult(None, output_dir, total_segments, 0, list(range(1, total_segments + 1)))
 
@@ -185,6 +743,10 @@ class DownloaderV3:
                 progress_tracker
             ))
 
+        if self.manifest and self.manifest.completed_count(media_type):
+            self.debugger.info(f"Resuming {media_type}: {self.manifest.completed_count(media_type)} "
+                               f"segment(s) already recorded in the manifest")
+
         successful_segments = 0
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             futures = [executor.submit(self._process_segment, task) for task in download_tasks]
@@ -194,43 +756,72 @@ class DownloaderV3:
                     successful_segments += 1
 
         progress_tracker.close()
+        if self.manifest:
+            self.manifest.save()
+        if self._refetch_pass(media_type):
+            return self._download_media(media_data, media_type, output_dir)
 
         return DownloadResult(
             init_file_path,
             output_dir,
             total_segments,
             successful_segments,
-            progress_tracker.failed_segments
+            progress_tracker.failed_segments,
+            peak_buffer_bytes=self._peak_buffered_bytes,
+            decrypted=self.is_decrypted(media_type)
         )
 
     def download_audio(self, urls: Dict) -> DownloadResult:
         if not urls.get("audio"):
             self.debugger.warning("No audio URLs provided")
             return DownloadResult(None, self.audio_dir, 0, 0, [])
-        return self._download_media(urls["audio"], "audio", self.audio_dir)
+        with self._progress_reporting():
+            return self._download_media(urls["audio"], "audio", self.audio_dir)
 
     def download_video(self, urls: Dict) -> DownloadResult:
         if not urls.get("video"):
             self.debugger.warning("No video URLs provided")
             return DownloadResult(None, self.video_dir, 0, 0, [])
-        return self._download_media(urls["video"], "video", self.video_dir)
+        with self._progress_reporting():
+            return self._download_media(urls["video"], "video", self.video_dir)
+
+    def _download_and_notify(self, download: Callable[[Dict], DownloadResult], media_type: str, urls: Dict,
+                             on_complete: Optional[Callable[[str, DownloadResult], None]]) -> DownloadResult:
+        result = download(urls)
+        if on_complete:
+            on_complete(media_type, result)
+        return result
+
+    def download_all(self, urls: Dict,
+                     on_complete: Optional[Callable[[str, DownloadResult], None]] = None) -> Dict[str, DownloadResult]:
+        """
+        Downloads the audio and video streams concurrently.
+
+        `on_complete(media_type, result)` is called from the downloading thread as soon as one
+        stream has finished, while the other may still be downloading, so callers can start
+        post-processing that stream early. It should hand work off rather than block.
+        """
+        with self._buffer_lock:
+            self._peak_buffered_bytes = self._buffered_bytes
+        with self._controllers_lock:
+            self.controllers = {}
+        with self._decrypt_lock:
+            self._decryptors = {}
+            self._decrypt_disabled = set()
+            self._refetch_encrypted = set()
+
+        with self._progress_reporting():
+            if self.engine == "asyncio":
+                from mainLogic.big4.Gryffindor_asyncio import AsyncSegmentEngine
+                return AsyncSegmentEngine(self).run(urls, on_complete=on_complete)
 
-    def download_all(self, urls: Dict) -> Dict[str, DownloadResult]:
-        # Create a combined progress tracker if we have a callback
-        if self.progress_callback:
-            self.combined_tracker = CombinedProgressTracker(self.progress_callback)
-
-        try:
             with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                audio_future = executor.submit(self.download_audio, urls)
-                video_future = executor.submit(self.download_video, urls)
+                audio_future = executor.submit(self._download_and_notify, self.download_audio, "audio", urls, on_complete)
+                video_future = executor.submit(self._download_and_notify, self.download_video, "video", urls, on_complete)
 
                 results = {
                     "audio": audio_future.result(),
                     "video": video_future.result()
                 }
-        finally:
-            # Reset the combined tracker to avoid affecting future downloads
-            self.combined_tracker = None
 
         return results
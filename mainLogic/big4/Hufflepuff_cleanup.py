@@ -11,6 +11,9 @@ class Clean:
 
     def removeFile(self,file,verbose):
         from mainLogic.utils.glv_var import debugger
+        # Intermediate files are not written at all in direct-to-mux mode
+        if not os.path.exists(file):
+            return
         try:
             os.remove(file)
             if verbose: debugger.success(f"Removed file: {file}")
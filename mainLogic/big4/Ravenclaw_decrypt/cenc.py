@@ -0,0 +1,371 @@
+import os
+import struct
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from Crypto.Cipher import AES
+
+
+class CencError(Exception):
+    """Raised when a file cannot be decrypted by the in-process engine (callers fall back to mp4decrypt)."""
+
+
+# Boxes whose payload is just more boxes
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'mvex', b'moof', b'traf',
+                   b'sinf', b'schi', b'edts', b'dinf'}
+
+# Bytes between the start of a sample entry's payload and its first child box
+SAMPLE_ENTRY_HEADER = {b'encv': 78, b'enca': 28}
+
+# Boxes that only carry protection information and are blanked out once a file is in the clear
+PROTECTION_BOXES = {b'senc', b'saiz', b'saio', b'pssh'}
+
+SUPPORTED_SCHEMES = {b'cenc'}
+
+
+class TrackEncryption:
+    def __init__(self, track_id: int, scheme: bytes, iv_size: int, kid: bytes, default_sample_size: int = 0):
+        self.track_id = track_id
+        self.scheme = scheme
+        self.iv_size = iv_size
+        self.kid = kid
+        self.default_sample_size = default_sample_size
+
+
+def iter_boxes(buf, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int, int]]:
+    """Yields (type, box_start, payload_start, box_end) for the boxes laid out in buf[start:end]."""
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise CencError(f"Malformed box {box_type!r} at offset {pos}")
+        yield box_type, pos, pos + header, pos + size
+        pos += size
+
+
+def _find_all(buf, box_type: bytes, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    for child_type, box_start, payload, box_end in iter_boxes(buf, start, end):
+        if child_type == box_type:
+            yield box_start, payload, box_end
+        elif child_type in CONTAINER_BOXES:
+            yield from _find_all(buf, box_type, payload, box_end)
+
+
+def _find(buf, box_type: bytes, start: int, end: int) -> Optional[Tuple[int, int, int]]:
+    return next(_find_all(buf, box_type, start, end), None)
+
+
+@contextmanager
+def _malformed(what: str):
+    """Reports a box that is too short for its fields (or otherwise garbled) as a CencError."""
+    try:
+        yield
+    except (struct.error, IndexError, ValueError) as e:
+        raise CencError(f"Malformed {what}: {e}") from e
+
+
+def _rename(buf: bytearray, box_start: int, new_type: bytes):
+    buf[box_start + 4:box_start + 8] = new_type
+
+
+class CencDecryptor:
+    """
+    Pure-Python (pycryptodome) decryption of fragmented MP4 protected with the ISO 23001-7
+    'cenc' scheme (AES-128 CTR), as a drop-in replacement for `mp4decrypt --key`.
+
+    The init segment (ftyp+moov) tells us, per track, the scheme and the per-sample IV size.
+    For every moof the sample byte ranges are derived from tfhd/trun, the IVs and subsample
+    maps are read from senc, and the protected ranges are decrypted in place inside the
+    following mdat. Protection boxes (sinf, senc, saiz, saio, pssh) are renamed to `free`
+    and encv/enca entries get their original format back, so no offsets need rewriting.
+
+    Works on a whole file (`decrypt_file`) or on individual segments once the init segment
+    is known (`decrypt_init`, `decrypt_segment`).
+    """
+
+    def __init__(self, key: str, init: Optional[bytes] = None):
+        try:
+            self.key = bytes.fromhex(key.strip())
+        except ValueError:
+            raise CencError("Key must be a hex string")
+        if len(self.key) != 16:
+            raise CencError(f"Expected a 128-bit key, got {len(self.key) * 8} bits")
+        self.tracks: Dict[int, TrackEncryption] = {}
+        self.clear_init: Optional[bytes] = None
+        if init is not None:
+            self.clear_init = self.decrypt_init(init)
+
+    # --- init segment -----------------------------------------------------------------
+
+    def decrypt_init(self, init: bytes) -> bytes:
+        """Parses the track encryption info of an init segment and returns it in the clear."""
+        with _malformed("init segment"):
+            return self._decrypt_init(bytearray(init))
+
+    def _decrypt_init(self, buf: bytearray) -> bytes:
+        moov = _find(buf, b'moov', 0, len(buf))
+        if moov is None:
+            raise CencError("No moov box in init segment")
+        _, moov_payload, moov_end = moov
+
+        defaults = {}
+        for _, payload, _ in _find_all(buf, b'trex', moov_payload, moov_end):
+            track_id, _, _, sample_size = struct.unpack_from('>IIII', buf, payload + 4)
+            defaults[track_id] = sample_size
+
+        for _, trak_payload, trak_end in _find_all(buf, b'trak', moov_payload, moov_end):
+            track_id = self._track_id(buf, trak_payload, trak_end)
+            stsd = _find(buf, b'stsd', trak_payload, trak_end)
+            if stsd is None:
+                continue
+            _, stsd_payload, stsd_end = stsd
+            for entry_type, entry_start, entry_payload, entry_end in iter_boxes(buf, stsd_payload + 8, stsd_end):
+                if entry_type not in SAMPLE_ENTRY_HEADER:
+                    continue
+                track = self._parse_sinf(buf, entry_start, entry_payload + SAMPLE_ENTRY_HEADER[entry_type],
+                                         entry_end, track_id)
+                track.default_sample_size = defaults.get(track_id, 0)
+                self.tracks[track_id] = track
+
+        for box_start, _, _ in list(_find_all(buf, b'pssh', 0, len(buf))):
+            _rename(buf, box_start, b'free')
+
+        return bytes(buf)
+
+    @staticmethod
+    def _track_id(buf, trak_payload: int, trak_end: int) -> int:
+        tkhd = _find(buf, b'tkhd', trak_payload, trak_end)
+        if tkhd is None:
+            raise CencError("trak without tkhd")
+        payload = tkhd[1]
+        version = buf[payload]
+        return struct.unpack_from('>I', buf, payload + (20 if version == 1 else 12))[0]
+
+    def _parse_sinf(self, buf: bytearray, entry_start: int, children: int, entry_end: int,
+                    track_id: int) -> TrackEncryption:
+        original_format, scheme, iv_size, kid = None, None, 0, b''
+        for child_type, sinf_start, sinf_payload, sinf_end in iter_boxes(buf, children, entry_end):
+            if child_type != b'sinf':
+                continue
+            for box_type, _, payload, _ in iter_boxes(buf, sinf_payload, sinf_end):
+                if box_type == b'frma':
+                    original_format = bytes(buf[payload:payload + 4])
+                elif box_type == b'schm':
+                    scheme = bytes(buf[payload + 4:payload + 8])
+            tenc = _find(buf, b'tenc', sinf_payload, sinf_end)
+            if tenc is not None:
+                payload = tenc[1]
+                iv_size = buf[payload + 7]
+                kid = bytes(buf[payload + 8:payload + 24])
+            _rename(buf, sinf_start, b'free')
+
+        if original_format is None or scheme is None:
+            raise CencError(f"Track {track_id} is missing frma/schm")
+        if scheme not in SUPPORTED_SCHEMES:
+            raise CencError(f"Protection scheme {scheme.decode(errors='replace')} is not supported")
+        if iv_size not in (8, 16):
+            raise CencError(f"Unsupported per-sample IV size {iv_size}")
+        _rename(buf, entry_start, original_format)
+        return TrackEncryption(track_id, scheme, iv_size, kid)
+
+    # --- media segments ---------------------------------------------------------------
+
+    def decrypt_segment(self, segment: bytes) -> bytes:
+        """Decrypts every moof/mdat pair in a media segment. Needs the init segment first."""
+        buf = bytearray(segment)
+        with _malformed("media segment"):
+            self._decrypt_fragments(buf)
+        return bytes(buf)
+
+    def _decrypt_fragments(self, buf: bytearray):
+        if not self.tracks:
+            raise CencError("Init segment not parsed yet")
+        view = memoryview(buf)
+        try:
+            for box_type, box_start, payload, box_end in iter_boxes(buf):
+                if box_type == b'moof':
+                    self._decrypt_moof(buf, view, box_start, payload, box_end)
+        finally:
+            view.release()
+
+    def _decrypt_moof(self, buf: bytearray, view: memoryview, moof_start: int, moof_payload: int, moof_end: int):
+        for _, traf_payload, traf_end in list(_find_all(buf, b'traf', moof_payload, moof_end)):
+            tfhd = _find(buf, b'tfhd', traf_payload, traf_end)
+            if tfhd is None:
+                raise CencError("traf without tfhd")
+            track_id, base_offset, default_size = self._parse_tfhd(buf, tfhd[1], moof_start)
+            track = self.tracks.get(track_id)
+            if track is None:
+                continue
+            if not default_size:
+                default_size = track.default_sample_size
+
+            samples: List[Tuple[int, int]] = []
+            for _, trun_payload, _ in _find_all(buf, b'trun', traf_payload, traf_end):
+                # A trun without data_offset continues right after the previous one's data
+                next_offset = samples[-1][0] + samples[-1][1] if samples else base_offset
+                samples.extend(self._parse_trun(buf, trun_payload, base_offset, next_offset, default_size))
+
+            senc = _find(buf, b'senc', traf_payload, traf_end)
+            if senc is None:
+                raise CencError(f"Track {track_id} fragment has no senc box")
+            entries = self._parse_senc(buf, senc[1], track.iv_size)
+            if len(entries) != len(samples):
+                raise CencError(f"senc has {len(entries)} entries for {len(samples)} samples")
+
+            for (offset, size), (iv, subsamples) in zip(samples, entries):
+                if offset + size > len(buf):
+                    raise CencError("Sample data lies outside the segment")
+                cipher = AES.new(self.key, AES.MODE_CTR, nonce=b'', initial_value=iv.ljust(16, b'\0'))
+                if not subsamples:
+                    cipher.decrypt(view[offset:offset + size], output=view[offset:offset + size])
+                    continue
+                pos = offset
+                for clear, protected in subsamples:
+                    pos += clear
+                    cipher.decrypt(view[pos:pos + protected], output=view[pos:pos + protected])
+                    pos += protected
+
+            for box_type in PROTECTION_BOXES:
+                for box_start, _, _ in list(_find_all(buf, box_type, traf_payload, traf_end)):
+                    _rename(buf, box_start, b'free')
+
+        for box_start, _, _ in list(_find_all(buf, b'pssh', moof_payload, moof_end)):
+            _rename(buf, box_start, b'free')
+
+    @staticmethod
+    def _parse_tfhd(buf, payload: int, moof_start: int) -> Tuple[int, int, int]:
+        flags = struct.unpack_from('>I', buf, payload)[0] & 0xFFFFFF
+        track_id = struct.unpack_from('>I', buf, payload + 4)[0]
+        pos = payload + 8
+        base_offset = moof_start
+        if flags & 0x01:
+            base_offset = struct.unpack_from('>Q', buf, pos)[0]
+            pos += 8
+        if flags & 0x02:
+            pos += 4
+        if flags & 0x08:
+            pos += 4
+        default_size = 0
+        if flags & 0x10:
+            default_size = struct.unpack_from('>I', buf, pos)[0]
+        return track_id, base_offset, default_size
+
+    @staticmethod
+    def _parse_trun(buf, payload: int, base_offset: int, next_offset: int,
+                    default_size: int) -> List[Tuple[int, int]]:
+        flags = struct.unpack_from('>I', buf, payload)[0] & 0xFFFFFF
+        count = struct.unpack_from('>I', buf, payload + 4)[0]
+        pos = payload + 8
+        offset = next_offset
+        if flags & 0x01:
+            offset = base_offset + struct.unpack_from('>i', buf, pos)[0]
+            pos += 4
+        if flags & 0x04:
+            pos += 4
+
+        samples = []
+        for _ in range(count):
+            if flags & 0x100:
+                pos += 4
+            size = default_size
+            if flags & 0x200:
+                size = struct.unpack_from('>I', buf, pos)[0]
+                pos += 4
+            if flags & 0x400:
+                pos += 4
+            if flags & 0x800:
+                pos += 4
+            samples.append((offset, size))
+            offset += size
+        return samples
+
+    @staticmethod
+    def _parse_senc(buf, payload: int, iv_size: int) -> List[Tuple[bytes, List[Tuple[int, int]]]]:
+        flags = struct.unpack_from('>I', buf, payload)[0] & 0xFFFFFF
+        pos = payload + 4
+        if flags & 0x01:
+            # Override of the track's AlgorithmID/IV_size/KID
+            iv_size = buf[pos + 3]
+            pos += 20
+        count = struct.unpack_from('>I', buf, pos)[0]
+        pos += 4
+
+        entries = []
+        for _ in range(count):
+            iv = bytes(buf[pos:pos + iv_size])
+            pos += iv_size
+            subsamples = []
+            if flags & 0x02:
+                subsample_count = struct.unpack_from('>H', buf, pos)[0]
+                pos += 2
+                for _ in range(subsample_count):
+                    subsamples.append(struct.unpack_from('>HI', buf, pos))
+                    pos += 6
+            entries.append((iv, subsamples))
+        return entries
+
+    # --- whole files --------------------------------------------------------------------
+
+    def decrypt_file(self, input_path: str, output_path: str):
+        """
+        Decrypts a concatenated fMP4 file one top-level box at a time, so only the current
+        fragment (moof + mdat) is held in memory.
+        """
+        with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+            pending = bytearray()
+            for box_type, box in self._read_top_level(src):
+                if box_type == b'moov':
+                    dst.write(self.decrypt_init(box))
+                elif box_type == b'moof' or pending:
+                    # moof offsets point into the following mdat, so decrypt them together
+                    pending += box
+                    if box_type == b'mdat':
+                        with _malformed("fragment"):
+                            self._decrypt_fragments(pending)
+                        dst.write(pending)
+                        pending = bytearray()
+                else:
+                    dst.write(box)
+            if pending:
+                raise CencError("File ends inside a fragment")
+
+    @staticmethod
+    def _read_top_level(f) -> Iterator[Tuple[bytes, bytes]]:
+        while True:
+            header = f.read(8)
+            if not header:
+                return
+            if len(header) < 8:
+                raise CencError("Truncated box header")
+            size, box_type = struct.unpack('>I4s', header)
+            if size == 1:
+                extended = f.read(8)
+                if len(extended) < 8:
+                    raise CencError("Truncated box header")
+                size = struct.unpack('>Q', extended)[0]
+                header += extended
+            elif size == 0:
+                yield box_type, header + f.read()
+                return
+            body = f.read(size - len(header))
+            if len(body) != size - len(header):
+                raise CencError(f"Truncated {box_type!r} box")
+            yield box_type, header + body
+
+
+def decrypt_file(input_path: str, output_path: str, key: str):
+    """Convenience wrapper: decrypt `input_path` into `output_path` with a hex `key`."""
+    try:
+        CencDecryptor(key).decrypt_file(input_path, output_path)
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
@@ -3,8 +3,10 @@ from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger
 from mainLogic.utils.process import shell
 from mainLogic.utils.basicUtils import BasicUtils
+from mainLogic.big4.Ravenclaw_decrypt import cenc
 from mainLogic import error
 import os
+import time
 
 class Decrypt:
     """
@@ -12,7 +14,12 @@ class Decrypt:
     understanding, much like a Ravenclaw unraveling the mysteries and hidden secrets.
     """
 
-    def decrypt(self,path,name,key,mp4d="mp4decrypt",out="None",outfile="",outdir="",verbose=True,suppress_exit=False):
+    # "mp4decrypt" shells out to Bento4, "python" uses the in-process engine in cenc.py and
+    # "auto" tries the in-process engine first and falls back to mp4decrypt when it can't cope
+    BACKENDS = ("mp4decrypt", "python", "auto")
+
+    def decrypt(self,path,name,key,mp4d="mp4decrypt",out="None",outfile="",outdir="",verbose=True,suppress_exit=False,
+                backend="mp4decrypt"):
         
         Global.hr()
 
@@ -38,6 +45,18 @@ class Decrypt:
             file
         )
 
+        if backend not in self.BACKENDS:
+            debugger.warning(f"Unknown decrypt backend '{backend}', using mp4decrypt")
+            backend = "mp4decrypt"
+
+        if backend != "mp4decrypt":
+            if self._decrypt_in_process(f"{path}/{name}.{extension}", file, key, out, verbose):
+                debugger.debug(f"{out} Decrypted Successfully")
+                return os.path.abspath(file)
+            if backend == "python":
+                return self._failed(out, file, suppress_exit)
+            debugger.warning(f"Falling back to {mp4d} for {out}")
+
         _ = shell(mp4d)
         if  _ > 1 :
             debugger.error(f"{mp4d} failed with exit code {_}")
@@ -66,28 +85,46 @@ class Decrypt:
             debugger.debug(f"{out} Decrypted Successfully")
             return os.path.abspath(file)
         else:
+            return self._failed(out, file, suppress_exit)
+
+    @staticmethod
+    def _decrypt_in_process(input_file, file, key, out, verbose):
+        try:
+            start = time.perf_counter()
+            cenc.decrypt_file(input_file, file, key)
+        except (cenc.CencError, OSError) as e:
+            debugger.warning(f"In-process decryption of {out} failed: {e}")
+            return False
+        if verbose:
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(file) / (1024 * 1024)
+            debugger.debug(f"{out} decrypted in-process: {size_mb:.1f} MB in {elapsed:.2f}s "
+                           f"({size_mb / max(elapsed, 1e-6):.1f} MB/s)")
+        return True
+
+    @staticmethod
+    def _failed(out, file, suppress_exit):
+        if os.path.exists(file):
+            debugger.debug(f"Removing {file}...")
+        # if decryption failed then print error message and exit
+        if out == "Audio":
+            debugger.error(CouldNotDecryptAudio())
+        else:
+            debugger.error(CouldNotDecryptVideo())
+
+        if not suppress_exit:
 
-            if os.path.exists(file):
-                debugger.debug(f"Removing {file}...")
-            # if decryption failed then print error message and exit
             if out == "Audio":
-                debugger.error(CouldNotDecryptAudio())
+                CouldNotDecryptAudio().exit()
             else:
-                debugger.error(CouldNotDecryptVideo())
-
-            if not suppress_exit:
-
-                if out == "Audio":
-                    CouldNotDecryptAudio().exit()
-                else:
-                    CouldNotDecryptVideo().exit()
-
-        
+                CouldNotDecryptVideo().exit()
 
     # decrypts audio
-    def decryptAudio(self,path,name,key,mp4d="mp4decrypt",outfile='None',outdir=None,verbose=True,suppress_exit=False):
-        return self.decrypt(path,name,key,mp4d,"Audio",outfile,outdir,verbose,suppress_exit=suppress_exit)
+    def decryptAudio(self,path,name,key,mp4d="mp4decrypt",outfile='None',outdir=None,verbose=True,suppress_exit=False,
+                     backend="mp4decrypt"):
+        return self.decrypt(path,name,key,mp4d,"Audio",outfile,outdir,verbose,suppress_exit=suppress_exit,backend=backend)
 
     # decrypts video
-    def decryptVideo(self,path,name,key,mp4d="mp4decrypt",outfile='None',outdir=None,verbose=True,suppress_exit=False):
-        return self.decrypt(path,name,key,mp4d,"Video",outfile,outdir,verbose,suppress_exit=suppress_exit)
\ No newline at end of file
+    def decryptVideo(self,path,name,key,mp4d="mp4decrypt",outfile='None',outdir=None,verbose=True,suppress_exit=False,
+                     backend="mp4decrypt"):
+        return self.decrypt(path,name,key,mp4d,"Video",outfile,outdir,verbose,suppress_exit=suppress_exit,backend=backend)
\ No newline at end of file
@@ -3,6 +3,7 @@ import base64
 import json
 from beta.batch_scraper_2.Endpoints import Endpoints
 from mainLogic.big4.Ravenclaw_decrypt.heck import get_cookiees_from_url
+from mainLogic.big4.Ravenclaw_decrypt.key_cache import KeyCache
 from mainLogic.big4.obsolete.Obsolete_Gryffindor_downloadv2 import Download
 from mainLogic.utils.glv import Global
 from mainLogic.utils.glv_var import debugger
@@ -15,6 +16,8 @@ class LicenseKeyFetcher:
         self.token = token
         self.random_id = random_id
         self.cookies = None
+        # Whether the last get_key answer came (at least partly) from the key cache
+        self.from_cache = False
 
     def build_license_url(self, encoded_otp_key):
         return f"https://api.penpencil.co/v1/videos/get-otp?key={encoded_otp_key}&isEncoded=true"
@@ -92,27 +95,59 @@ class LicenseKeyFetcher:
     def set_cookies(self, url):
         self.cookies = cookies_dict_to_str(get_cookiees_from_url(url))
 
-    def get_key(self, id, batch_name,khazana_topic_name=None,khazana_url=None, verbose=True):
+    def fetch_signed_url(self, id, batch_name, khazana_topic_name=None, khazana_url=None):
+        if not khazana_topic_name and not khazana_url:
+            url_op = Endpoints(verbose=True).set_token(self.token,self.random_id).process("lecture",lecture_id=id,batch_name=batch_name)
+        else:
+            url_op = Endpoints(verbose=True).set_token(self.token,self.random_id).process("lecture",khazana=True,program_name=batch_name,topic_name=khazana_topic_name,lecture_id=id,lecture_url=khazana_url)
+        return Download.buildUrl(url_op['url'], url_op['signedUrl'])
+
+    def invalidate_cached_url(self, id, batch_name, khazana_topic_name=None, khazana_url=None):
+        """Forgets the cached signed URL of a lecture, e.g. after the CDN answered 403 with it."""
+        KeyCache.shared(self.token).invalidate_url(KeyCache.lecture_key(id, batch_name, khazana_topic_name, khazana_url))
+
+    def get_key(self, id, batch_name,khazana_topic_name=None,khazana_url=None, verbose=True, use_cache=False):
+        """
+        Returns (kid, key, signed url) of a lecture, or None.
+
+        With use_cache, a cached key skips the MPD and OTP requests, and a cached signed URL that
+        has not expired skips the network entirely. Token checks leave the cache off so that they
+        still talk to the API.
+        """
         if verbose: Global.hr()
 
         if verbose: debugger.debug("Beginning to get the key for the video... & Audio :) ")
         if verbose: debugger.debug(f"ID: {id}")
-        if verbose: debugger.debug("Building the URL to get the key...")
+
+        self.from_cache = False
+        cache = KeyCache.shared(self.token) if use_cache else None
+        cache_key = KeyCache.lecture_key(id, batch_name, khazana_topic_name, khazana_url)
 
         try:
+            cached = cache.get(cache_key) if cache else None
+            if cached:
+                url = cached['url']
+                if url is None:
+                    if verbose: debugger.debug("Cached key found, refreshing the expired signed URL...")
+                    url = self.fetch_signed_url(id, batch_name, khazana_topic_name, khazana_url)
+                    cache.put(cache_key, cached['kid'], cached['key'], url)
+                elif verbose:
+                    debugger.debug("Key and signed URL found in the key cache")
+
+                self.url = url
+                self.set_cookies(url)
+                self.from_cache = True
+                if verbose: debugger.success(f"KID: {cached['kid']}")
+                if verbose: Global.hr()
+                return (cached['kid'], cached['key'], url)
+
+            if verbose: debugger.debug("Building the URL to get the key...")
             #from mainLogic.big4.Ravenclaw_decrypt.signedUrl import get_signed_url
 
             # policy_string = get_signed_url(token=self.token, random_id=self.random_id, id=id, verbose=verbose)['data']
             # add_on = cookie_splitter(policy_string, verbose)
 
-            if not khazana_topic_name and not khazana_url:
-                url_op = Endpoints(verbose=True).set_token(self.token,self.random_id).process("lecture",lecture_id=id,batch_name=batch_name)
-            else:
-                url_op = Endpoints(verbose=True).set_token(self.token,self.random_id).process("lecture",khazana=True,program_name=batch_name,topic_name=khazana_topic_name,lecture_id=id,lecture_url=khazana_url)
-            url = url_op['url']
-            signature = url_op['signedUrl']
-
-            url = Download.buildUrl(url,signature)
+            url = self.fetch_signed_url(id, batch_name, khazana_topic_name, khazana_url)
             #url = f"{url}"+f"{add_on}"
 
             self.url = url
@@ -154,6 +189,8 @@ class LicenseKeyFetcher:
                     if verbose: debugger.success("Key received successfully!")
                     key = self.get_key_final(response['data']['otp'])
                     if verbose: debugger.success(f"Key: {key}")
+                    if cache:
+                        cache.put(cache_key, kid, key, url)
 
                     if verbose:Global.hr()
                     return (kid,key,url)
@@ -0,0 +1,176 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from Crypto.Cipher import AES
+
+from mainLogic.utils import glv_var
+from mainLogic.utils.glv_var import debugger
+
+
+class KeyCache:
+    """
+    Persistent cache of what LicenseKeyFetcher.get_key works out per lecture: the KID, the
+    content key and the signed MPD URL.
+
+    Entries are encrypted at rest with AES-GCM under a key derived from the auth token, and are
+    looked up by a hash of the lecture coordinates, so the file on disk reveals neither keys,
+    URLs nor lecture ids. A different token simply cannot read the entries (they are misses).
+
+    The content key lives for `key_ttl` seconds (prefs 'key-cache-ttl'). The signed URL lives
+    until the expiry embedded in its CloudFront policy (minus a safety margin), and is dropped
+    early by `invalidate_url` when the CDN answers 403. When only the URL is stale, the caller
+    refreshes the URL and keeps the cached KID and key.
+    """
+
+    VERSION = 1
+    DEFAULT_KEY_TTL = 7 * 24 * 3600
+    # Used when the signed URL carries no readable expiry
+    DEFAULT_URL_TTL = 3600
+    URL_EXPIRY_MARGIN = 300
+
+    _instances: Dict[tuple, "KeyCache"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, token: str, path: Optional[str] = None, key_ttl: Optional[int] = None):
+        prefs = glv_var.vars.get('prefs', {}) or {}
+        self.path = path or self.default_path()
+        self.key_ttl = key_ttl if key_ttl is not None else int(prefs.get('key-cache-ttl', self.DEFAULT_KEY_TTL))
+        self._aes_key = hashlib.sha256(b"pwdl-key-cache:" + str(token).encode('utf-8')).digest()
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    @classmethod
+    def shared(cls, token: str, path: Optional[str] = None) -> "KeyCache":
+        """One instance per (file, token) so that threads share a lock and an in-memory copy."""
+        path = path or cls.default_path()
+        with cls._instances_lock:
+            instance = cls._instances.get((path, str(token)))
+            if instance is None:
+                instance = cls._instances[(path, str(token))] = cls(token, path)
+            return instance
+
+    @staticmethod
+    def default_path() -> str:
+        return os.environ.get('PWDL_KEY_CACHE') or os.path.join(glv_var.vars['$home'], '.pwdl', 'key_cache.json')
+
+    @staticmethod
+    def lecture_key(id, batch_name=None, topic_name=None, lecture_url=None) -> str:
+        raw = json.dumps([id, batch_name, topic_name, lecture_url])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _kid_hash(kid: str) -> str:
+        return hashlib.sha256(kid.replace('-', '').lower().encode('utf-8')).hexdigest()
+
+    @classmethod
+    def url_expiry(cls, url: str) -> Optional[float]:
+        """Expiry (epoch seconds) of a CloudFront signed URL, from `Expires` or the custom `Policy`."""
+        query = parse_qs(urlparse(url).query)
+        if 'Expires' in query:
+            try:
+                return float(query['Expires'][0])
+            except ValueError:
+                return None
+        if 'Policy' in query:
+            # CloudFront's URL-safe base64 variant
+            policy = query['Policy'][0].replace('-', '+').replace('_', '=').replace('~', '/')
+            try:
+                statement = json.loads(base64.b64decode(policy + '=' * (-len(policy) % 4)))['Statement'][0]
+                return float(statement['Condition']['DateLessThan']['AWS:EpochTime'])
+            except (ValueError, KeyError, IndexError, TypeError):
+                return None
+        return None
+
+    # --- storage ------------------------------------------------------------------------
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                return data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_locked(self):
+        now = time.time()
+        self.entries = {k: v for k, v in self.entries.items() if v.get("key_expires", 0) > now}
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"version": self.VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            debugger.warning(f"Could not write key cache {self.path}: {e}")
+
+    def _seal(self, payload: Dict) -> str:
+        cipher = AES.new(self._aes_key, AES.MODE_GCM)
+        ciphertext, tag = cipher.encrypt_and_digest(json.dumps(payload).encode('utf-8'))
+        return base64.b64encode(cipher.nonce + tag + ciphertext).decode('ascii')
+
+    def _open(self, blob: str) -> Optional[Dict]:
+        try:
+            raw = base64.b64decode(blob)
+            cipher = AES.new(self._aes_key, AES.MODE_GCM, nonce=raw[:16])
+            return json.loads(cipher.decrypt_and_verify(raw[32:], raw[16:32]))
+        except (ValueError, KeyError):
+            # Written under another token, or tampered with
+            return None
+
+    # --- public API ---------------------------------------------------------------------
+
+    def get(self, lecture_key: str) -> Optional[Dict]:
+        """
+        Returns {"kid", "key", "url"} for a lecture whose key is still valid, or None. "url" is
+        None when the cached signed URL has expired or was invalidated.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(lecture_key)
+        if not entry or entry.get("key_expires", 0) <= now:
+            return None
+        payload = self._open(entry["blob"])
+        if payload is None:
+            return None
+        if entry.get("url_expires", 0) <= now:
+            payload["url"] = None
+        return payload
+
+    def put(self, lecture_key: str, kid: str, key: str, url: str):
+        now = time.time()
+        url_expires = self.url_expiry(url)
+        url_expires = (url_expires - self.URL_EXPIRY_MARGIN) if url_expires else now + self.DEFAULT_URL_TTL
+        with self.lock:
+            self.entries[lecture_key] = {
+                "kid": self._kid_hash(kid),
+                "key_expires": now + self.key_ttl,
+                "url_expires": url_expires,
+                "blob": self._seal({"kid": kid, "key": key, "url": url}),
+            }
+            self._save_locked()
+
+    def invalidate_url(self, lecture_key: str):
+        """Forgets the signed URL of a lecture (e.g. after a 403) but keeps its KID and key."""
+        with self.lock:
+            entry = self.entries.get(lecture_key)
+            if entry and entry.get("url_expires", 0) > 0:
+                entry["url_expires"] = 0
+                self._save_locked()
+
+    def invalidate(self, lecture_key: Optional[str] = None, kid: Optional[str] = None):
+        """Drops whole entries, by lecture or by KID (e.g. when a key turns out to be wrong)."""
+        kid_hash = self._kid_hash(kid) if kid else None
+        with self.lock:
+            doomed = [k for k, v in self.entries.items() if k == lecture_key or (kid_hash and v.get("kid") == kid_hash)]
+            for k in doomed:
+                del self.entries[k]
+            if doomed:
+                self._save_locked()
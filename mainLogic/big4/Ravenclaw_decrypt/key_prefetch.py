@@ -0,0 +1,52 @@
+import concurrent.futures
+import time
+from typing import Dict, Iterable
+
+from mainLogic.big4.Ravenclaw_decrypt.key import LicenseKeyFetcher
+from mainLogic.utils.glv_var import debugger
+
+
+def prefetch_keys(lectures: Iterable[Dict], token: str, random_id: str, workers: int = 8,
+                  verbose: bool = False) -> Dict[str, str]:
+    """
+    Resolves the signed URL, KID and key of every lecture up front, `workers` at a time, into the
+    shared KeyCache. The downloads that follow then hit the cache instead of running the get_key
+    chain one lecture after another.
+
+    `lectures` are dicts with "id", "batch_name" and optionally "topic_name" / "lecture_url" (the
+    rows of iter_csv_rows). Returns {lecture id: error} for every lecture whose key could not be
+    fetched, so the caller can report and drop them before any segment is downloaded.
+    """
+    unique = {}
+    for lecture in lectures:
+        unique.setdefault(lecture["id"], lecture)
+    if not unique:
+        return {}
+
+    def fetch(lecture):
+        fetcher = LicenseKeyFetcher(token, random_id)
+        keys = fetcher.get_key(lecture["id"], lecture.get("batch_name"),
+                               khazana_topic_name=lecture.get("topic_name"),
+                               khazana_url=lecture.get("lecture_url"),
+                               verbose=False, use_cache=True)
+        if not keys:
+            raise ValueError("no key returned (check the id, batch and token)")
+        return fetcher.from_cache
+
+    started = time.monotonic()
+    failures, cached = {}, 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers),
+                                               thread_name_prefix="pwdl-keys") as executor:
+        futures = {executor.submit(fetch, lecture): lecture_id for lecture_id, lecture in unique.items()}
+        for future in concurrent.futures.as_completed(futures):
+            lecture_id = futures[future]
+            try:
+                cached += future.result()
+            except Exception as e:
+                failures[lecture_id] = str(e) or type(e).__name__
+                debugger.error(f"[keys] {lecture_id}: key fetch failed: {failures[lecture_id]}")
+
+    if verbose or failures:
+        debugger.info(f"[keys] Prefetched {len(unique) - len(failures)}/{len(unique)} key(s) "
+                      f"({cached} already cached) in {time.monotonic() - started:.1f}s")
+    return failures
@@ -1,4 +1,7 @@
 import os
+import shutil
+import tempfile
+import threading
 from mainLogic.error import errorList, OverwriteAbortedByUser
 from mainLogic.utils.glv_var import debugger
 from mainLogic.utils.process import shell
@@ -45,4 +48,89 @@ class Merge:
             shell(self.mergeCommandBuilder(ffmpeg_path,input1,input2,output,overwrite=True), stderr="", stdout="")
 
 
-        return output
\ No newline at end of file
+        return output
+
+
+    @staticmethod
+    def can_stream():
+        """Direct-to-mux needs named pipes, which Windows does not have."""
+        return hasattr(os, "mkfifo")
+
+    @staticmethod
+    def _feed(fifo, sources, errors):
+        # Opening blocks until ffmpeg opens its end of the pipe
+        try:
+            with open(fifo, "wb") as pipe:
+                for source in sources:
+                    with open(source, "rb") as f:
+                        shutil.copyfileobj(f, pipe, 1024 * 1024)
+        except BrokenPipeError:
+            # ffmpeg went away, its exit code tells the story
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    @staticmethod
+    def _unblock(fifo):
+        # Lets a feeder that is still waiting in open() through if ffmpeg never opened the pipe
+        try:
+            os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+        except OSError:
+            pass
+
+    def ffmpegMergeStreams(self,video_sources,audio_sources,output,ffmpeg_path="ffmpeg",verbose=False):
+        """
+        Muxes the video and audio tracks without writing either of them to disk on its own.
+
+        Each track is given as a list of clear files played back in order (an init segment and
+        its media segments, or a single decrypted file). They are streamed into ffmpeg through a
+        named pipe per track, so the only file written is `output`.
+
+        Returns `output`, or None if ffmpeg failed.
+        """
+        output = SysFunc.modify_path(output)
+
+        if verbose: Global.hr();debugger.debug('Attempting ffmpeg merge from pipes')
+
+        if os.path.exists(output):
+
+            debugger.error("Warninbg: Output file already exists. Overwriting...")
+            consent = input("Do you want to continue? (y/n): ")
+
+            if consent.lower() != 'y':
+                OverwriteAbortedByUser().exit()
+
+        fifo_dir = tempfile.mkdtemp(prefix="pwdl-mux-")
+        video_fifo, audio_fifo = os.path.join(fifo_dir, "video.mp4"), os.path.join(fifo_dir, "audio.mp4")
+        os.mkfifo(video_fifo)
+        os.mkfifo(audio_fifo)
+
+        errors = []
+        feeders = [
+            threading.Thread(target=self._feed, args=(video_fifo, video_sources, errors), daemon=True),
+            threading.Thread(target=self._feed, args=(audio_fifo, audio_sources, errors), daemon=True),
+        ]
+        for feeder in feeders:
+            feeder.start()
+
+        command = self.mergeCommandBuilder(ffmpeg_path,video_fifo,audio_fifo,output,overwrite=True)
+        try:
+            if verbose:
+                debugger.debug(f"Running: {command}")
+                code = shell(command,filter='.*')
+            else:
+                code = shell(command, stderr="", stdout="")
+        finally:
+            for fifo, feeder in zip((video_fifo, audio_fifo), feeders):
+                while feeder.is_alive():
+                    self._unblock(fifo)
+                    feeder.join(0.1)
+            shutil.rmtree(fifo_dir, ignore_errors=True)
+
+        if code != 0 or errors:
+            debugger.error(f"ffmpeg merge from pipes failed (exit code {code}){f': {errors[0]}' if errors else ''}")
+            if os.path.exists(output):
+                os.remove(output)
+            return None
+
+        return output
@@ -12,6 +12,8 @@ from beta.shellLogic import shell
 from mainLogic.utils import glv_var
 from mainLogic.error import errorList, CsvFileNotFound
 from mainLogic.utils.glv_var import debugger
+from mainLogic.utils.batch_scheduler import BatchScheduler
+from mainLogic.big4.Ravenclaw_decrypt.key_prefetch import prefetch_keys
 
 # Global variables
 glv = Global()
@@ -25,9 +27,22 @@ def start_shell():
     shell.main()
 
 
-def start_webui(port, verbose, no_reloader=False, ssl=False, ssl_cert=None, ssl_key=None, ssl_password=None):
-    """Start the WebUI if requested."""
+def load_webui_app():
+    """Imports the WebUI app; the production server calls this in the process that serves it."""
     from run import app
+    return app
+
+
+def start_webui(port, verbose, no_reloader=False, ssl=False, ssl_cert=None, ssl_key=None, ssl_password=None,
+                serve_mode=None, serve_threads=None):
+    """
+    Start the WebUI if requested. serve_mode 'threads' runs it under a production server (see
+    beta/api/server.py), 'dev' under the Flask development server.
+    """
+    from beta.api.server import serve, DEFAULT_THREADS
+
+    serve_mode = serve_mode or prefs.get('webui-serve-mode', 'dev')
+    serve_threads = serve_threads or prefs.get('webui-threads', DEFAULT_THREADS)
 
     if 'webui-port' in prefs and port == -1 and port <= glv_var.MINIMUM_PORT:
         port = prefs['webui-port']
@@ -80,11 +95,19 @@ def start_webui(port, verbose, no_reloader=False, ssl=False, ssl_cert=None, ssl_
     protocol = "HTTPS" if ssl else "HTTP"
     if verbose:
         Global.hr()
-        debugger.debug(f"Starting WebUI on {protocol}://0.0.0.0:{port}")
+        debugger.debug(f"Starting WebUI on {protocol}://0.0.0.0:{port} ({serve_mode} server)")
+
+    if serve_mode == 'threads':
+        if ssl_password:
+            debugger.warning("Encrypted SSL keys are only supported by the development server")
+        elif serve(load_webui_app, "0.0.0.0", port, threads=serve_threads,
+                   ssl_cert=ssl_cert if ssl else None, ssl_key=ssl_key if ssl else None):
+            return
 
     debug_mode = True if verbose else False
     use_reloader = not no_reloader if debug_mode else False
     
+    app = load_webui_app()
     app.run(
         host="0.0.0.0", 
         port=port, 
@@ -97,9 +120,15 @@ def start_webui(port, verbose, no_reloader=False, ssl=False, ssl_cert=None, ssl_
 
 def download_process(
         id, name,batch_name,topic_name,lecture_url,
-        state, verbose, simulate=False
+        state, verbose, simulate=False,
+        exit_on_error=True, tui=True, connection_budget=None, cpu_budget=None
 ):
-    """Process a single download or simulate the download."""
+    """
+    Process a single download or simulate the download.
+
+    With exit_on_error=False a failure is raised to the caller instead of exiting (used by the
+    batch scheduler, which records it and moves on to the next row).
+    """
     if simulate:
         print("Simulating the download process. No files will be downloaded.")
         print(f"Id to be processed: {id}")
@@ -119,6 +148,15 @@ def download_process(
             random_id=prefs['random_id'],
             mp4d=state['mp4decrypt'],
             tmpDir= state['tmpDir'] if 'tmpDir' in state else prefs['tmpDir'],
+            engine=prefs.get('downloader-engine', 'threads'),
+            decrypt_backend=prefs.get('decrypt-backend', 'mp4decrypt'),
+            direct_mux=prefs.get('direct-mux', False),
+            key_cache=prefs.get('key-cache', True),
+            tui=tui,
+            show_progress_bar=tui,
+            suppress_exit=not exit_on_error,
+            connection_budget=connection_budget,
+            cpu_budget=cpu_budget,
             verbose=verbose
         ).process()
     except Exception as e:
@@ -126,23 +164,13 @@ def download_process(
             Global.hr()
             glv.errprint(f"Error: {e}")
         errorList['downloadFailed']['func'](name, id)
+        if not exit_on_error:
+            raise
         sys.exit(errorList['downloadFailed']['code'])
 
 
-def handle_csv_file(csv_file, state, batch_name_param, verbose, simulate=False):
-    """Handle processing of CSV file with or without headers, including new arguments."""
-    try:
-        if not os.path.exists(csv_file):
-            raise CsvFileNotFound(csv_file)
-    except CsvFileNotFound as e:
-        debugger.error(e)
-        e.exit()
-
-    if simulate:
-        print("Simulating the download csv process. No files will be downloaded.")
-        print(f"File to be processed: {csv_file}")
-        return
-
+def iter_csv_rows(csv_file, batch_name_param, verbose):
+    """Yields the valid rows of a CSV file (with or without headers) as dicts ready for download_process."""
     with open(csv_file, 'r', newline='', encoding='utf-8') as f: # Added encoding
         sniffer = csv.Sniffer()
         try:
@@ -234,22 +262,96 @@ def handle_csv_file(csv_file, state, batch_name_param, verbose, simulate=False):
             if verbose:
                 debugger.info(f"Preparing from CSV line {current_line_num}: ID='{csv_id}', Name='{csv_name}' (Folder: '{final_safe_name}'), Batch='{csv_batch_name}', Topic='{csv_topic_name}', URL='{csv_lecture_url}'")
 
-            download_process(
-                id=csv_id,
-                name=final_safe_name, # Already safe
-                batch_name=csv_batch_name,
-                topic_name=csv_topic_name,
-                lecture_url=csv_lecture_url,
-                state=state,
-                verbose=verbose
-            )
+            yield {
+                "line": current_line_num,
+                "id": csv_id,
+                "name": final_safe_name, # Already safe
+                "batch_name": csv_batch_name,
+                "topic_name": csv_topic_name,
+                "lecture_url": csv_lecture_url,
+            }
+
+
+def handle_csv_file(csv_file, state, batch_name_param, verbose, simulate=False, batch_workers=None):
+    """
+    Handle processing of CSV file with or without headers, including new arguments.
+
+    Rows are run by a BatchScheduler, `batch_workers` lectures at a time (prefs 'batch-workers'
+    when not given), sharing one segment connection budget and one decrypt/merge budget.
+    Failed rows don't stop the batch; a per-row report is written next to the downloads.
+    The keys of all rows are prefetched first (prefs 'key-prefetch-workers', 0 to disable), and
+    rows whose key can't be fetched are reported as failed without being downloaded.
+    """
+    try:
+        if not os.path.exists(csv_file):
+            raise CsvFileNotFound(csv_file)
+    except CsvFileNotFound as e:
+        debugger.error(e)
+        e.exit()
+
+    if simulate:
+        print("Simulating the download csv process. No files will be downloaded.")
+        print(f"File to be processed: {csv_file}")
+        return
+
+    workers = batch_workers or prefs.get('batch-workers', 1)
+    # The live TUI and progress bars assume one lecture on screen
+    tui = workers <= 1
+    report_path = os.path.join(
+        prefs['dir'], f"{os.path.splitext(os.path.basename(csv_file))[0]}.report.csv")
+
+    scheduler = BatchScheduler(
+        run_row=lambda row: download_process(
+            id=row["id"],
+            name=row["name"],
+            batch_name=row["batch_name"],
+            topic_name=row["topic_name"],
+            lecture_url=row["lecture_url"],
+            state=state,
+            verbose=verbose,
+            exit_on_error=False,
+            tui=tui,
+            connection_budget=scheduler.connection_budget,
+            cpu_budget=scheduler.cpu_budget,
+        ),
+        workers=workers,
+        max_connections=prefs.get('batch-connections', 64),
+        cpu_slots=prefs.get('batch-cpu-slots') or None,
+        report_path=report_path,
+        verbose=verbose,
+    )
+
+    rows = list(iter_csv_rows(csv_file, batch_name_param, verbose))
+
+    # Resolve every key before the first segment is fetched: a bad id or batch fails here, and
+    # the downloads below find their keys in the key cache
+    prefetch_workers = prefs.get('key-prefetch-workers', 8)
+    if prefetch_workers and prefs.get('key-cache', True):
+        key_failures = prefetch_keys(rows, prefs['token'], prefs['random_id'],
+                                     workers=prefetch_workers, verbose=verbose)
+        for row in rows:
+            if row["id"] in key_failures:
+                scheduler.reject(row, f"key fetch failed: {key_failures[row['id']]}")
+        rows = [row for row in rows if row["id"] not in key_failures]
+
+    if verbose:
+        debugger.info(f"Running {csv_file} with {scheduler.workers} lecture(s) at a time")
+    scheduler.run(rows)
+
+    counts = scheduler.summary()
+    Global.hr()
+    debugger.info(f"Batch finished: {counts['ok']} ok, {counts['failed']} failed, "
+                  f"{counts['skipped']} skipped. Report: {report_path}")
+    if counts['failed']:
+        sys.exit(errorList['downloadFailed']['code'])
 
 
 def main(csv_file=None,
          id=None, name=None,batch_name=None,topic_name=None,lecture_url=None,
          directory=None, verbose=False, shell=False, webui_port=None, no_reloader=False, tmp_dir=None,
-         new_downloader=False,
-         simulate=False, ssl=False, ssl_cert=None, ssl_key=None, ssl_password=None):
+         new_downloader=False, batch_workers=None,
+         simulate=False, ssl=False, ssl_cert=None, ssl_key=None, ssl_password=None,
+         serve_mode=None, serve_threads=None):
     global prefs  # Use global keyword to modify global prefs
 
     if shell:
@@ -264,7 +366,8 @@ def main(csv_file=None,
     glv_var.vars['prefs'] = prefs
 
     if webui_port is not None:
-        start_webui(webui_port, glv.vout, no_reloader=no_reloader, ssl=ssl, ssl_cert=ssl_cert, ssl_key=ssl_key, ssl_password=ssl_password)
+        start_webui(webui_port, glv.vout, no_reloader=no_reloader, ssl=ssl, ssl_cert=ssl_cert, ssl_key=ssl_key, ssl_password=ssl_password,
+                    serve_mode=serve_mode, serve_threads=serve_threads)
 
     if simulate:
         if csv_file:
@@ -282,7 +385,8 @@ def main(csv_file=None,
     if csv_file:
         # Pass batch_name from main args to handle_csv_file
         # This batch_name acts as a default if not specified in the CSV
-        handle_csv_file(csv_file, state, batch_name, glv.vout, simulate=False) # simulate is False here
+        handle_csv_file(csv_file, state, batch_name, glv.vout, simulate=False, # simulate is False here
+                        batch_workers=batch_workers)
     elif id and name:
         download_process(
             id=id,
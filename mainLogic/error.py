@@ -129,6 +129,11 @@ errorList = {
         "code": 33,
         "func": lambda: debugger.error("Adaptation set is not video. Exiting..."),
         "message_template": "The provided adaptation set does not contain video data."
+    },
+    "downloadCancelled": {
+        "code": 34,
+        "func": lambda name, id: debugger.warning(f"Download of {name} with id {id} was cancelled."),
+        "message_template": "The download of {name} (ID: {id}) was cancelled."
     }
 }
 
@@ -295,3 +300,8 @@ class AdaptationSetIsNotVideo(PwdlError):
                          errorList["adaptationSetIsNotVideo"]["code"],
                          errorList["adaptationSetIsNotVideo"]["func"])
 
+class DownloadCancelled(PwdlError):
+    def __init__(self, name, id):
+        super().__init__(errorList["downloadCancelled"]["message_template"].format(name=name, id=id),
+                         errorList["downloadCancelled"]["code"],
+                         errorList["downloadCancelled"]["func"])
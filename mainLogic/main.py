@@ -6,6 +6,9 @@ from mainLogic.big4.Hufflepuff_cleanup import Clean
 from mainLogic.big4.Ravenclaw_decrypt.key import LicenseKeyFetcher
 from mainLogic.big4.Ravenclaw_decrypt.decrypt import Decrypt
 from mainLogic.big4.Slytherin_merge import Merge
+from mainLogic.error import DownloadFailed, DownloadCancelled
+from mainLogic.utils.batch_scheduler import budget_slot
+import concurrent.futures
 import os
 
 from mainLogic.utils.MPDParser import MPDParser
@@ -23,10 +26,20 @@ class Main:
         tmpDir (str): Temporary directory for intermediate files. Defaults to './tmp/'.
         vsdPath (str): Path to the vsd binary. Defaults to 'vsd'.
         ffmpeg (str): Path to the ffmpeg binary. Defaults to 'ffmpeg'.
+        engine (str): Segment download engine, "threads" or "asyncio". Defaults to "threads".
+        decrypt_backend (str): Decryption backend, "mp4decrypt", "python" or "auto". Defaults to "mp4decrypt".
+        direct_mux (bool): Stream the clear segments straight into ffmpeg so the final MP4 is the only
+            file written. Needs the "python" or "auto" decrypt backend and named pipes. Defaults to False.
+        connection_budget (Semaphore): Segment connections shared with other lectures of a batch. Defaults to None.
+        cpu_budget (Semaphore): Decrypt/merge slots shared with other lectures of a batch. Defaults to None.
+        show_progress_bar (bool): Show the per-stream tqdm bars. Defaults to True.
         token (str): Auth Token for the process.
         verbose (bool): Flag for verbose output. Defaults to True.
         suppress_exit (bool): Flag to suppress exit on error. Defaults to False.
         progress_callback (function): Callback function to report progress. Defaults to None.
+        progress_hz (float): Most progress reports per second sent to `progress_callback`. Defaults to 4.
+        cancel_event (threading.Event): Once set, the download stops fetching segments and `process`
+            raises DownloadCancelled, keeping the segments so far for a later resume. Defaults to None.
     """
 
     def __init__(self,
@@ -41,7 +54,15 @@ class Main:
                  ffmpeg="ffmpeg",
                  mp4d="mp4decrypt",
                  tui=True,
-                 token=None, random_id=None, verbose=True, suppress_exit=False, progress_callback=None):
+                 engine="threads",
+                 decrypt_backend="mp4decrypt",
+                 direct_mux=False,
+                 key_cache=True,
+                 connection_budget=None,
+                 cpu_budget=None,
+                 show_progress_bar=True,
+                 token=None, random_id=None, verbose=True, suppress_exit=False, progress_callback=None,
+                 progress_hz=4, cancel_event=None):
 
         os2 = SysFunc()
 
@@ -65,12 +86,96 @@ class Main:
         self.ffmpeg = BasicUtils.abspath(ffmpeg) if ffmpeg != 'ffmpeg' else 'ffmpeg'
         self.mp4d = BasicUtils.abspath(mp4d) if mp4d != 'mp4decrypt' else 'mp4decrypt'
         self.tui = tui
+        self.engine = engine
+        self.decrypt_backend = decrypt_backend
+        self.direct_mux = direct_mux
+        self.key_cache = key_cache
+        self.connection_budget = connection_budget
+        self.cpu_budget = cpu_budget
+        self.show_progress_bar = show_progress_bar
 
         self.token = token
         self.random_id = random_id
         self.verbose = verbose
         self.suppress_exit = suppress_exit
         self.progress_callback = progress_callback
+        self.progress_hz = progress_hz
+        self.cancel_event = cancel_event
+
+    def _decrypt_media(self, media_type, result, key):
+        """
+        Concatenates the downloaded segments of one track and decrypts them into the output
+        directory. Runs on the stage pool of `process` while the other track may still be
+        downloading.
+        """
+        with budget_slot(self.cpu_budget):
+            return self._concatenate_and_decrypt(media_type, result, key)
+
+    def _concatenate_and_decrypt(self, media_type, result, key):
+        debugger.info(f"\n{media_type.upper()} Download Summary:")
+        debugger.info(f"Init file: {result.init_file}")
+        debugger.info(f"Segments directory: {result.segments_dir}")
+        debugger.info(f"Total segments: {result.total_segments}")
+        debugger.info(f"Successfully downloaded: {result.successful_segments}")
+        debugger.info(f"Failed segments: {result.failed_segments}")
+        debugger.info(f"Peak segment buffer: {result.peak_buffer_bytes / 1024:.0f} KiB")
+
+        # The segments stay until the whole lecture has succeeded (download_out_dir is removed
+        # then): if the other track fails, a rerun resumes this one from its manifest instead
+        # of finding the entries without their files and downloading it again
+        if result.decrypted:
+            # Segments were decrypted as they arrived, so the clear track is assembled straight
+            # into the output directory with no -enc.mp4 intermediate and no decrypt pass
+            decrypted = SysFunc.concatenate_mp4_segments(
+                str(result.segments_dir),
+                output_dir=self.directory,
+                output_filename=f"{self.name}-{media_type.title()}.mp4",
+                cleanup=False)
+            if self.verbose: debugger.success(f"{media_type.title()} (decrypted while downloading): {decrypted}")
+            return os.path.abspath(decrypted)
+
+        result.encoded_file = SysFunc.concatenate_mp4_segments(
+            str(result.segments_dir),
+            output_filename=f"{self.name}-{media_type.title()}-enc.mp4",
+            cleanup=False)
+        if self.verbose: debugger.success(f"{media_type.title()}: {result.encoded_file}")
+
+        decrypt = Decrypt()
+        decrypt_track = decrypt.decryptAudio if media_type == "audio" else decrypt.decryptVideo
+        return decrypt_track(
+            result.segments_dir,
+            f'{self.name}-{media_type.title()}-enc',
+            key, mp4d=self.mp4d, outfile=self.name, outdir=self.directory,
+            verbose=self.verbose, suppress_exit=self.suppress_exit, backend=self.decrypt_backend)
+
+    def _direct_mux_available(self):
+        if not self.direct_mux:
+            return False
+        if not Merge.can_stream():
+            debugger.warning("Direct-to-mux needs named pipes, which this OS lacks. Writing intermediate files instead.")
+            return False
+        if self.decrypt_backend not in ("python", "auto"):
+            debugger.warning("Direct-to-mux needs the python or auto decrypt backend. Writing intermediate files instead.")
+            return False
+        return True
+
+    @staticmethod
+    def _mux_sources(result, decrypted_file):
+        # A track decrypted while downloading is muxed straight from its clear segments,
+        # anything else from the decrypted file the stage pool produced
+        return [decrypted_file] if decrypted_file else SysFunc.list_mp4_segments(str(result.segments_dir))
+
+    def _get_key(self, fetcher):
+        try:
+            return fetcher.get_key(
+                id=self.id,batch_name=self.batch_name,khazana_topic_name=self.topic_name,khazana_url=self.lecture_url,
+                verbose=self.verbose, use_cache=self.key_cache)[1]
+        except Exception as e:
+            raise TypeError(f"ID is invalid (if the token is valid) ")
+
+    def _invalidate_cached_url(self, fetcher):
+        if self.key_cache:
+            fetcher.invalidate_cached_url(self.id, self.batch_name, self.topic_name, self.lecture_url)
 
     def process(self):
         """
@@ -83,18 +188,21 @@ class Main:
         TOKEN = self.token
         RANDOM_ID = self.random_id
         fetcher = LicenseKeyFetcher(TOKEN, RANDOM_ID)
-        try:
-            if self.verbose: debugger.debug(f"Fetching License Key for ID: {self.id} and Batch Name: {self.batch_name}")
-            if self.verbose and self.topic_name:
-                debugger.debug(f"Fetching License Key for Topic Name: {self.topic_name} and Lecture URL: {self.lecture_url}")
-            key = fetcher.get_key(
-                id=self.id,batch_name=self.batch_name,khazana_topic_name=self.topic_name,khazana_url=self.lecture_url,
-                verbose=self.verbose)[1]
-            cookies = fetcher.cookies
-        except Exception as e:
-            raise TypeError(f"ID is invalid (if the token is valid) ")
+        if self.verbose: debugger.debug(f"Fetching License Key for ID: {self.id} and Batch Name: {self.batch_name}")
+        if self.verbose and self.topic_name:
+            debugger.debug(f"Fetching License Key for Topic Name: {self.topic_name} and Lecture URL: {self.lecture_url}")
+        key = self._get_key(fetcher)
 
-        urls = MPDParser(fetcher.url).pre_process().parse().get_segment_urls()
+        try:
+            urls = MPDParser(fetcher.url).pre_process().parse().get_segment_urls()
+        except Exception:
+            if not fetcher.from_cache:
+                raise
+            # The CDN no longer accepts the cached signed URL; get a fresh one (the key stays cached)
+            debugger.warning("Cached MPD URL was rejected, fetching a new signed URL...")
+            self._invalidate_cached_url(fetcher)
+            key = self._get_key(fetcher)
+            urls = MPDParser(fetcher.url).pre_process().parse().get_segment_urls()
 
         # 1. Downloading Files (New Download Method using VSD)
 
@@ -105,56 +213,72 @@ class Main:
             out_dir=download_out_dir,
             verbose=self.verbose,
             progress_callback=self.progress_callback,
-            show_progress_bar=True,
-            max_workers=16,
+            progress_hz=self.progress_hz,
+            show_progress_bar=self.show_progress_bar,
+            max_workers=32,
+            initial_workers=16,
             audio_dir="audio",
             video_dir="video",
+            lecture_id=self.id,
+            engine=self.engine,
+            # The python engine can decrypt every segment as it lands; with mp4decrypt the
+            # whole track is decrypted after concatenation instead
+            decrypt_key=key if self.decrypt_backend in ("python", "auto") else None,
+            connection_budget=self.connection_budget,
+            cancel_event=self.cancel_event,
         )
 
         from tui import update_downloader_v3_with_tui
 
         if self.tui:
             downloader = update_downloader_v3_with_tui(downloader)
-        results = downloader.download_all(urls)
 
+        # 1-2. Download and decrypt as a pipeline: each track is concatenated and decrypted on
+        # the stage pool as soon as its own download finishes, so audio (usually done first)
+        # is decrypted while video is still downloading, and the two decrypts run in parallel.
+        # With direct-to-mux, tracks decrypted while downloading skip this stage entirely.
+        direct_mux = self._direct_mux_available()
+        stage_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="pwdl-stage")
+        stage_futures = {}
 
-        for media_type, result in results.items():
-            debugger.info(f"\n{media_type.upper()} Download Summary:")
-            debugger.info(f"Init file: {result.init_file}")
-            debugger.info(f"Segments directory: {result.segments_dir}")
-            debugger.info(f"Total segments: {result.total_segments}")
-            debugger.info(f"Successfully downloaded: {result.successful_segments}")
-            debugger.info(f"Failed segments: {result.failed_segments}")
-            results[media_type].encoded_file = SysFunc.concatenate_mp4_segments(str(result.segments_dir),output_filename=f"{self.name}-{media_type.title()}-enc.mp4",cleanup=True)
-
-
-        audio = results["audio"].encoded_file
-        video = results["video"].encoded_file
-
-
-        debugger.success("Download completed.")
-        if self.verbose: debugger.success(f"Audio: {audio}\nVideo: {video}")
-
-
-
-        # 2. Decrypting Files
-
-        debugger.success("Please wait while we Ravenclaw_decrypt the files...")
-
-        decrypt = Decrypt()
-
-        decrypted_audio = decrypt.decryptAudio(
-            results["audio"].segments_dir,
-            f'{self.name}-Audio-enc',
-            key, mp4d=self.mp4d, outfile=self.name,outdir=self.directory,
-            verbose=self.verbose, suppress_exit=self.suppress_exit)
+        def on_media_downloaded(media_type, result):
+            if result.failed_segments or (direct_mux and result.decrypted):
+                return
+            stage_futures[media_type] = stage_pool.submit(self._decrypt_media, media_type, result, key)
 
+        try:
+            try:
+                results = downloader.download_all(urls, on_complete=on_media_downloaded)
+            finally:
+                pool_stats = downloader.pool_stats()
+                downloader.close()
 
-        decrypted_video = decrypt.decryptVideo(
-            results["video"].segments_dir,
-            f'{self.name}-Video-enc',
-            key, mp4d=self.mp4d, outfile=self.name,outdir=self.directory,
-            verbose=self.verbose, suppress_exit=self.suppress_exit)
+            if self.verbose:
+                debugger.info(f"Connection pool: {pool_stats['requests']} requests over "
+                              f"{pool_stats['handshakes']} connections "
+                              f"({pool_stats['reuse_ratio']:.1%} reused, {pool_stats['hosts']} host(s))")
+
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                # download_out_dir and its manifest stay, so the download can be resumed
+                raise DownloadCancelled(self.name, self.id)
+
+            failed = {media_type: result.failed_segments for media_type, result in results.items() if result.failed_segments}
+            if failed:
+                # Keep download_out_dir (and its segment manifest) so that a rerun only fetches
+                # the segments that are still missing.
+                debugger.error(f"Segments failed to download: {failed}. Re-run to resume from {download_out_dir}")
+                if downloader.forbidden_responses:
+                    # Most likely an expired signature, so the rerun must not reuse the cached URL
+                    self._invalidate_cached_url(fetcher)
+                raise DownloadFailed(self.name, self.id)
+
+            debugger.success("Download completed.")
+            debugger.success("Please wait while we Ravenclaw_decrypt the files...")
+
+            decrypted_audio = stage_futures["audio"].result() if "audio" in stage_futures else None
+            decrypted_video = stage_futures["video"].result() if "video" in stage_futures else None
+        finally:
+            stage_pool.shutdown(wait=True)
 
         # Call the progress callback for decryption completion
         # if self.progress_callback:
@@ -165,11 +289,21 @@ class Main:
         #     })
 
         if self.verbose:
-            debugger.success(f"Audio file: {decrypted_audio}")
-            debugger.success(f"Video file: {decrypted_video}")
+            debugger.success(f"Audio file: {decrypted_audio or 'streamed from clear segments'}")
+            debugger.success(f"Video file: {decrypted_video or 'streamed from clear segments'}")
 
         # 3. Merging Files
 
+        if direct_mux:
+            with budget_slot(self.cpu_budget):
+                muxed = Merge().ffmpegMergeStreams(self._mux_sources(results["video"], decrypted_video),
+                                                   self._mux_sources(results["audio"], decrypted_audio),
+                                                   f"{self.directory}/{self.name}.mp4",
+                                                   ffmpeg_path=self.ffmpeg, verbose=self.verbose)
+            if muxed is None:
+                # The clear segments are still in download_out_dir, a rerun resumes from them
+                raise DownloadFailed(self.name, self.id)
+
         #Move files form download_out_dir/<media_type>/{self.name}-<media_type.title()>.mp4 to out dir
         try:
             import shutil
@@ -183,11 +317,13 @@ class Main:
             debugger.error(f"Failed to remove temp dir {download_out_dir}")
 
 
-        merge = Merge()
-        merge.ffmpegMerge(f"{self.directory}/{self.name}-Video.mp4",
-                          f"{self.directory}/{self.name}-Audio.mp4",
-                          f"{self.directory}/{self.name}.mp4",
-                          ffmpeg_path=self.ffmpeg, verbose=self.verbose)
+        if not direct_mux:
+            merge = Merge()
+            with budget_slot(self.cpu_budget):
+                merge.ffmpegMerge(f"{self.directory}/{self.name}-Video.mp4",
+                                  f"{self.directory}/{self.name}-Audio.mp4",
+                                  f"{self.directory}/{self.name}.mp4",
+                                  ffmpeg_path=self.ffmpeg, verbose=self.verbose)
 
         # Call the progress callback for merge completion
         # if self.progress_callback:
@@ -0,0 +1,105 @@
+import csv
+import os
+import threading
+import time
+import concurrent.futures
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from mainLogic.utils.glv_var import debugger
+
+
+@contextmanager
+def budget_slot(budget: Optional[threading.Semaphore]):
+    """Holds one unit of a shared budget for the duration of the block (no-op without a budget)."""
+    if budget is None:
+        yield
+        return
+    budget.acquire()
+    try:
+        yield
+    finally:
+        budget.release()
+
+
+class BatchScheduler:
+    """
+    Runs the lectures of a CSV batch `workers` at a time.
+
+    All lectures draw from two shared budgets instead of each sizing itself as if it were alone:
+    `connection_budget` caps the segment requests in flight across every DownloaderV3, and
+    `cpu_budget` caps how many decrypt/concatenate/merge stages run at once. A failing row is
+    recorded and the batch carries on; every finished row is appended to the report CSV.
+    """
+
+    REPORT_FIELDS = ["line", "id", "name", "status", "seconds", "error"]
+
+    def __init__(self, run_row: Callable[[Dict], None], workers: int = 1, max_connections: int = 64,
+                 cpu_slots: Optional[int] = None, report_path: Optional[str] = None, verbose: bool = False):
+        self.run_row = run_row
+        self.workers = max(1, workers)
+        self.connection_budget = threading.BoundedSemaphore(max(1, max_connections))
+        self.cpu_budget = threading.BoundedSemaphore(max(1, cpu_slots or os.cpu_count() or 2))
+        self.report_path = report_path
+        self.verbose = verbose
+        self.results: List[Dict] = []
+        self._lock = threading.Lock()
+
+        if self.report_path:
+            with open(self.report_path, 'w', newline='', encoding='utf-8') as f:
+                csv.DictWriter(f, fieldnames=self.REPORT_FIELDS).writeheader()
+
+    def _record(self, row: Dict, status: str, seconds: float = 0.0, error: str = ""):
+        result = {"line": row.get("line"), "id": row.get("id"), "name": row.get("name"),
+                  "status": status, "seconds": round(seconds, 1), "error": error}
+        with self._lock:
+            self.results.append(result)
+            if self.report_path:
+                with open(self.report_path, 'a', newline='', encoding='utf-8') as f:
+                    csv.DictWriter(f, fieldnames=self.REPORT_FIELDS).writerow(result)
+
+        if status == "ok":
+            debugger.success(f"[batch] {row.get('name')} done in {seconds:.0f}s")
+        elif status == "failed":
+            debugger.error(f"[batch] {row.get('name')} (line {row.get('line')}) failed: {error}")
+        elif self.verbose:
+            debugger.warning(f"[batch] {row.get('name')} (line {row.get('line')}) skipped: {error}")
+
+    def reject(self, row: Dict, error: str):
+        """Records a row as failed without running it (e.g. its key could not be prefetched)."""
+        self._record(row, "failed", error=error)
+
+    def _run_one(self, row: Dict):
+        started = time.monotonic()
+        try:
+            self.run_row(row)
+        except BaseException as e:
+            # SystemExit from deep inside a lecture must not take the whole batch down
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            error = f"exited with code {e.code}" if isinstance(e, SystemExit) else (str(e) or type(e).__name__)
+            self._record(row, "failed", time.monotonic() - started, error)
+            return
+        self._record(row, "ok", time.monotonic() - started)
+
+    def run(self, rows: Iterable[Dict]) -> List[Dict]:
+        seen = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                   thread_name_prefix="pwdl-batch") as executor:
+            futures = []
+            for row in rows:
+                # Two rows for one lecture would share a temp directory and segment manifest
+                if row["id"] in seen:
+                    self._record(row, "skipped", error="duplicate id")
+                    continue
+                seen.add(row["id"])
+                futures.append(executor.submit(self._run_one, row))
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        return self.results
+
+    def summary(self) -> Dict[str, int]:
+        counts = {"ok": 0, "failed": 0, "skipped": 0}
+        for result in self.results:
+            counts[result["status"]] += 1
+        return counts
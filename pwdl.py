@@ -27,6 +27,9 @@ def parse_arguments():
     parser.add_argument('--ssl-cert', type=str, help='Path to SSL certificate file (cert.pem)')
     parser.add_argument('--ssl-key', type=str, help='Path to SSL private key file (key.pem)')
     parser.add_argument('--ssl-password', type=str, help='Password for SSL private key (if encrypted)')
+    parser.add_argument('--serve-mode', choices=['dev', 'threads'],
+                        help="Server for the webui: 'threads' (gunicorn/waitress, one process, many threads) or 'dev' (Flask)")
+    parser.add_argument('--serve-threads', type=int, help="Request threads with --serve-mode threads (default 32)")
     parser.add_argument('--simulate', action='store_true',
                         help='Simulate the download process. No files will be downloaded. Incompatible wit h '
                              '--csv-file. Must be used with --id and --name')
@@ -41,6 +44,7 @@ def parse_arguments():
     parser.add_argument("--batch-name","-B",type=str,help="Batch Id")
     parser.add_argument("--topic-name","-T",type=str,help="Topic name ")
     parser.add_argument("--lecture-url","-U",type=str,help="Lecture URL")
+    parser.add_argument("--batch-workers","-j",type=int,help="Lectures to download at once from --csv-file")
 
 
     return parser.parse_args()
@@ -90,6 +94,7 @@ if __name__ == "__main__":
 
     downloader.main(
         csv_file=args.csv_file,
+        batch_workers=args.batch_workers,
         id=args.id,
         name=args.name,
         batch_name=args.batch_name,
@@ -105,5 +110,7 @@ if __name__ == "__main__":
         ssl=args.ssl,
         ssl_cert=args.ssl_cert,
         ssl_key=args.ssl_key,
-        ssl_password=args.ssl_password
+        ssl_password=args.ssl_password,
+        serve_mode=args.serve_mode,
+        serve_threads=args.serve_threads
     )
@@ -332,7 +332,7 @@ def update_downloader_v3_with_tui(downloader:Gryffindor_downloadv3.DownloaderV3)
         if "init" in media_data:
             init_filename = downloader._get_file_name_from_url(media_data["init"], 0, media_type)
             init_file_path = output_dir / init_filename
-            if not downloader._download_segment(media_data["init"], init_file_path):
+            if not downloader._fetch_segment(media_data["init"], init_file_path, media_type, "init"):
                 downloader.terminal.log(f"Failed to download {media_type} init segment", "ERROR")
                 downloader.debugger.error(f"Failed to download {media_type} init segment")
                 return DownloadResult(None, output_dir, total_segments, 0, list(range(1, total_segments + 1)))
@@ -371,23 +371,32 @@ def update_downloader_v3_with_tui(downloader:Gryffindor_downloadv3.DownloaderV3)
         )
 
         progress_tracker.close()
+        if downloader.manifest:
+            downloader.manifest.save()
 
         return DownloadResult(
             init_file_path,
             output_dir,
             total_segments,
             successful_segments,
-            progress_tracker.failed_segments
+            progress_tracker.failed_segments,
+            peak_buffer_bytes=downloader._peak_buffered_bytes,
+            decrypted=downloader.is_decrypted(media_type)
         )
 
     # Replace the original method with our enhanced version
     downloader._download_media = _download_media_with_tui
 
+    # The asyncio engine builds its trackers through this hook instead of _download_media
+    downloader._make_progress_tracker = lambda total_segments, media_type: ProgressTracker(
+        total_segments, media_type, downloader.terminal, False
+    )
+
     # Make sure to stop the TUI when done
     original_download_all = downloader.download_all
-    def download_all_with_tui(urls):
+    def download_all_with_tui(urls, *args, **kwargs):
         try:
-            return original_download_all(urls)
+            return original_download_all(urls, *args, **kwargs)
         finally:
             downloader.terminal.stop()
 